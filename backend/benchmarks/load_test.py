@@ -0,0 +1,338 @@
+"""
+API Load Test
+Drives weighted storefront and admin scenarios against the API and reports
+throughput and p50/p95/p99 latency per route as JSON, optionally compared
+against a saved baseline
+
+Seed a local database first (python generate_synthetic_data.py --drop), then
+from backend/:
+    python benchmarks/load_test.py --mode inprocess --duration 30 --output baseline.json
+    python benchmarks/load_test.py --mode uvicorn --workers 2 --baseline baseline.json
+    python benchmarks/load_test.py --url http://localhost:8001 --baseline baseline.json
+
+Compare runs of the same mode on the same machine; absolute numbers differ
+between modes (in-process shares one event loop with the load generator).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SEARCH_TERMS = ["netflix", "pubg", "steam", "gift", "spotify", "free fire", "uc", "premium"]
+
+# Differences smaller than this are noise, whatever the percentage
+NOISE_FLOOR_MS = 2.0
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.enabled = True
+
+    async def call(self, client, name, method, url, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code in expected
+        except httpx.HTTPError:
+            response, ok = None, False
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.enabled:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+        return response if ok else None
+
+    def report(self, duration: float) -> dict:
+        routes = {}
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            routes[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "rps": round(len(values) / duration, 2),
+                "mean_ms": round(sum(values) / len(values), 2),
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "totals": {
+                "requests": total,
+                "errors": sum(r["errors"] for r in routes.values()),
+                "rps": round(total / duration, 2),
+            },
+            "routes": routes,
+        }
+
+
+class Context:
+    """Data discovered during setup that scenarios pick from"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.products = []
+        self.order_ids = []
+        self.admin_headers = None
+
+
+# ==================== SCENARIOS ====================
+
+async def browse_products(client, ctx, rec):
+    await rec.call(client, "GET /api/categories", "GET", "/api/categories")
+    await rec.call(client, "GET /api/products", "GET", "/api/products")
+    if ctx.products:
+        product = ctx.rng.choice(ctx.products)
+        await rec.call(client, "GET /api/products/{product_id}", "GET", f"/api/products/{product.get('slug') or product['id']}")
+        await rec.call(client, "GET /api/products/{product_id}/related", "GET", f"/api/products/{product['id']}/related")
+    await rec.call(client, "GET /api/reviews", "GET", "/api/reviews")
+
+
+async def search(client, ctx, rec):
+    term = ctx.rng.choice(SEARCH_TERMS)
+    await rec.call(client, "GET /api/products/search/suggestions", "GET", "/api/products/search/suggestions", params={"q": term})
+    await rec.call(client, "GET /api/products/search/advanced", "GET", "/api/products/search/advanced",
+                   params={"q": term, "sort_by": ctx.rng.choice(["relevance", "price_low", "newest"])})
+
+
+async def checkout(client, ctx, rec):
+    if not ctx.products:
+        return
+    product = ctx.rng.choice(ctx.products)
+    variation = ctx.rng.choice(product.get("variations") or [{"name": "Default", "price": 100.0}])
+    await rec.call(client, "POST /api/promo-codes/validate", "POST", "/api/promo-codes/validate",
+                   expected=(200, 400), params={"code": "WELCOME10", "subtotal": variation["price"]}, json=[])
+    response = await rec.call(client, "POST /api/orders/create", "POST", "/api/orders/create", json={
+        "customer_name": "Load Test",
+        "customer_phone": f"98{ctx.rng.randrange(100_000_000):08d}",
+        "items": [{"name": product["name"], "price": variation["price"], "quantity": 1, "variation": variation["name"]}],
+        "total_amount": variation["price"],
+        "remark": "load-test",
+    })
+    if response is not None:
+        order_id = response.json().get("order_id") or response.json().get("id")
+        if order_id:
+            ctx.order_ids.append(order_id)
+
+
+async def track_order(client, ctx, rec):
+    if not ctx.order_ids:
+        return
+    order_id = ctx.rng.choice(ctx.order_ids)
+    await rec.call(client, "GET /api/orders/track/{order_id}", "GET", f"/api/orders/track/{order_id}")
+
+
+async def admin_dashboard(client, ctx, rec):
+    if not ctx.admin_headers:
+        return
+    headers = ctx.admin_headers
+    await rec.call(client, "GET /api/analytics/overview", "GET", "/api/analytics/overview", headers=headers)
+    await rec.call(client, "GET /api/analytics/revenue-chart", "GET", "/api/analytics/revenue-chart", headers=headers)
+    await rec.call(client, "GET /api/analytics/top-products", "GET", "/api/analytics/top-products", headers=headers)
+    await rec.call(client, "GET /api/orders", "GET", "/api/orders", headers=headers)
+
+
+SCENARIOS = [
+    ("browse_products", 50, browse_products),
+    ("search", 20, search),
+    ("checkout", 10, checkout),
+    ("track_order", 10, track_order),
+    ("admin_dashboard", 10, admin_dashboard),
+]
+
+
+async def setup(client, ctx):
+    response = await client.get("/api/products")
+    response.raise_for_status()
+    ctx.products = response.json()[:500]
+
+    response = await client.post("/api/auth/login", json={
+        "email": os.environ.get("ADMIN_USERNAME", "gsnadmin"),
+        "password": os.environ.get("ADMIN_PASSWORD", "gsnadmin"),
+    })
+    if response.status_code == 200:
+        ctx.admin_headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        orders = await client.get("/api/orders", headers=ctx.admin_headers)
+        if orders.status_code == 200:
+            ctx.order_ids = [o["id"] for o in orders.json()[:500] if o.get("id")]
+    else:
+        print("⚠ Admin login failed, admin scenario disabled")
+
+
+async def virtual_user(client, ctx, rec, deadline: float):
+    scenarios = [scenario for _, _, scenario in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    while time.perf_counter() < deadline:
+        scenario = ctx.rng.choices(scenarios, weights=weights)[0]
+        await scenario(client, ctx, rec)
+
+
+async def run_load(client, args) -> dict:
+    ctx = Context(random.Random(args.seed))
+    rec = Recorder()
+    await setup(client, ctx)
+
+    if args.warmup:
+        rec.enabled = False
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*[virtual_user(client, ctx, rec, deadline) for _ in range(args.concurrency)])
+        rec.enabled = True
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[virtual_user(client, ctx, rec, deadline) for _ in range(args.concurrency)])
+    result = rec.report(time.perf_counter() - started)
+    result["meta"] = {
+        "mode": args.mode if not args.url else "url",
+        "duration": args.duration,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+    return result
+
+
+# ==================== TARGETS ====================
+
+async def run_inprocess(args) -> dict:
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            return await run_load(client, args)
+    finally:
+        await server.app.router.shutdown()
+
+
+async def run_against_url(url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        return await run_load(client, args)
+
+
+async def wait_until_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become ready in {timeout}s")
+
+
+async def run_uvicorn(args) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    try:
+        await wait_until_ready(url)
+        return await run_against_url(url, args)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+# ==================== REPORTING ====================
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Routes whose p95 or throughput regressed beyond tolerance"""
+    regressions = []
+    for name, current in result["routes"].items():
+        base = baseline.get("routes", {}).get(name)
+        if not base:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) and current["p95_ms"] - base["p95_ms"] > NOISE_FLOOR_MS:
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['rps']}/s -> {current['rps']}/s")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def print_report(result: dict, baseline: dict = None):
+    print(f"\n{'route':<42}{'count':>7}{'err':>5}{'rps':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'Δp95':>8}")
+    for name, route in result["routes"].items():
+        delta = ""
+        base = (baseline or {}).get("routes", {}).get(name)
+        if base and base["p95_ms"]:
+            delta = f"{(route['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%"
+        print(f"{name:<42}{route['count']:>7}{route['errors']:>5}{route['rps']:>8.1f}"
+              f"{route['p50_ms']:>8.1f}{route['p95_ms']:>8.1f}{route['p99_ms']:>8.1f}{delta:>8}")
+    totals = result["totals"]
+    print(f"\nTotal: {totals['requests']} requests, {totals['errors']} errors, {totals['rps']} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--url", help="Test an already running server instead of booting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=20, help="Virtual users")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # Every virtual user shares one client IP; the limiter would turn the run into 429s
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    if args.url:
+        result = asyncio.run(run_against_url(args.url.rstrip("/"), args))
+    elif args.mode == "uvicorn":
+        result = asyncio.run(run_uvicorn(args))
+    else:
+        result = asyncio.run(run_inprocess(args))
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_report(result, baseline)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+        print(f"✓ Report written to {args.output}")
+
+    if baseline:
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"✗ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✓ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Serialization Benchmark
+Compares FastAPI's default JSON pipeline with the orjson / trusted-response
+path for the payloads of /api/products, /api/orders and /api/customers
+
+Usage (from backend/):
+    python benchmarks/serialization.py [--items 500] [--iterations 50]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# server.py reads these at import; no connection is made
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from server import Product, PRODUCT_DEFAULTS
+from json_responses import trusted_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_products(count):
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "name": f"Product {i}",
+        "slug": f"product-{i}",
+        "description": "<p>Instant delivery gift card. Redeem on your account.</p>" * 4,
+        "image_url": f"https://i.ibb.co/abc{i}/product.webp",
+        "category_id": str(uuid.uuid4()),
+        "variations": [
+            {"id": str(uuid.uuid4()), "name": f"{amount} USD", "price": amount * 140.0,
+             "original_price": amount * 150.0, "cost_price": amount * 130.0, "description": None}
+            for amount in (5, 10, 25, 50, 100)
+        ],
+        "tags": ["gift card", "instant"],
+        "sort_order": i,
+        "custom_fields": [],
+        "is_active": True,
+        "is_sold_out": False,
+        "stock_quantity": None,
+        "flash_sale_end": None,
+        "flash_sale_label": None,
+        "created_at": (now - timedelta(minutes=i)).isoformat(),
+    } for i in range(count)]
+
+
+def make_orders(count):
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "customer_name": f"Customer {i}",
+        "customer_email": f"customer{i}@example.com",
+        "customer_phone": f"98{i:08d}",
+        "phone_key": f"+97798{i:08d}",
+        "items": [{"name": "Product 1", "variation": "10 USD", "price": 1400.0, "quantity": 1}],
+        "total_amount": 1400.0,
+        "status": "Completed",
+        "payment_method": "eSewa",
+        "remark": "",
+        "created_at": (now - timedelta(hours=i)).isoformat(),
+    } for i in range(count)]
+
+
+def make_customers(count):
+    return [{
+        "email": f"customer{i}@example.com",
+        "name": f"Customer {i}",
+        "phone": f"98{i:08d}",
+        "total_orders": i % 7,
+        "total_spent": (i % 7) * 1400.0,
+        "last_order_date": datetime.now(timezone.utc).isoformat(),
+        "is_registered": bool(i % 2),
+        "credit_balance": float(i % 50),
+    } for i in range(count)]
+
+
+async def time_it(fn, iterations):
+    await fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = await fn()
+    return (time.perf_counter() - start) / iterations * 1000, body
+
+
+async def run(items, iterations):
+    products = make_products(items)
+    orders = make_orders(items)
+    customers = make_customers(items)
+    product_field = create_response_field(name="response", type_=List[Product])
+
+    # Mirrors fastapi.routing: serialize_response then response_class(content).body
+    async def products_before():
+        content = await serialize_response(field=product_field, response_content=products)
+        return JSONResponse(content).body
+
+    async def products_after():
+        return trusted_response([{**PRODUCT_DEFAULTS, **p} for p in products]).body
+
+    # Routes without a response_model still went through jsonable_encoder
+    def encoded(data):
+        async def encode():
+            content = await serialize_response(response_content=data)
+            return JSONResponse(content).body
+        return encode
+
+    def trusted(data):
+        async def encode():
+            return trusted_response(data).body
+        return encode
+
+    cases = [
+        ("/api/products", products_before, products_after),
+        ("/api/orders", encoded(orders), trusted(orders)),
+        ("/api/customers", encoded(customers), trusted(customers)),
+    ]
+
+    print(f"{items} items per response, {iterations} iterations\n")
+    print(f"{'endpoint':<16}{'before ms':>11}{'after ms':>10}{'speedup':>9}{'json KB':>9}{'gzip KB':>9}{'br KB':>8}")
+    for name, before, after in cases:
+        before_ms, before_body = await time_it(before, iterations)
+        after_ms, after_body = await time_it(after, iterations)
+        assert json.loads(before_body) == json.loads(after_body), f"{name}: output differs"
+        gzip_kb = len(gzip.compress(after_body, 6)) / 1024
+        br_kb = f"{len(brotli.compress(after_body, quality=4)) / 1024:8.1f}" if brotli else f"{'-':>8}"
+        print(f"{name:<16}{before_ms:>11.2f}{after_ms:>10.2f}{before_ms / after_ms:>8.1f}x"
+              f"{len(after_body) / 1024:>9.1f}{gzip_kb:>9.1f}{br_kb}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.iterations))
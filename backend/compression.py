@@ -0,0 +1,195 @@
+"""
+Response Compression
+ASGI middleware that negotiates brotli or gzip from Accept-Encoding
+
+Only text-like content types above a size threshold are compressed. Responses
+that are already encoded, partial (206) or have no body pass through untouched.
+Streaming responses are compressed chunk by chunk and flushed after each chunk,
+so long-running exports still reach the client progressively.
+"""
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "application/rss+xml",
+    "image/svg+xml",
+)
+SKIP_STATUS = {204, 206, 304}
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Map of coding -> q value; codings with q=0 are refused"""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(header: str, brotli_available: bool = True) -> Optional[str]:
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli_available else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = codings.get(coding, wildcard)
+        # Ties go to the earlier candidate (brotli compresses JSON better)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it so the client can decode it right away"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept, brotli is not None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, send, encoding)
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    """Holds back the response start until enough of the body is seen to decide whether to compress"""
+
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str):
+        self.middleware = middleware
+        self.send = send
+        self.encoding = encoding
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+        self.buffer = b""
+
+    def _should_compress(self, message) -> bool:
+        if message["status"] in SKIP_STATUS:
+            return False
+        content_type = ""
+        for name, value in message.get("headers", []):
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            if self._should_compress(message):
+                self.start_message = message
+            else:
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            # Responses from BaseHTTPMiddleware arrive in chunks even when small,
+            # so buffer until the threshold is crossed or the body ends
+            self.buffer += body
+            if more_body and len(self.buffer) < self.middleware.minimum_size:
+                return
+            body, self.buffer = self.buffer, b""
+
+            if not more_body and len(body) < self.middleware.minimum_size:
+                # Small complete body: not worth the CPU
+                self.passthrough = True
+                self._set_vary(self.start_message)
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+
+            self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            headers = [
+                (name, value) for name, value in self.start_message.get("headers", [])
+                if name != b"content-length"
+            ]
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+            self.start_message["headers"] = headers
+            self._set_vary(self.start_message)
+            if not more_body:
+                compressed = self.compressor.finish(body)
+                headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            await self.send(self.start_message)
+
+        if more_body:
+            chunk = self.compressor.compress(body)
+            if chunk:
+                await self.send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            await self.send({"type": "http.response.body", "body": self.compressor.finish(body)})
+
+    @staticmethod
+    def _set_vary(message):
+        headers = message.setdefault("headers", [])
+        for index, (name, value) in enumerate(headers):
+            if name == b"vary":
+                if b"accept-encoding" not in value.lower():
+                    headers[index] = (name, value + b", Accept-Encoding")
+                return
+        headers.append((b"vary", b"Accept-Encoding"))
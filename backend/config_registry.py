@@ -0,0 +1,71 @@
+"""
+Configuration Registry
+In-memory singleton settings documents with typed defaults
+
+Each entry is cached together with the VersionStore token it was loaded
+under. Writers call invalidate(), which bumps the token; other workers see
+the new token on their next VersionStore poll (within a second) and reload.
+"""
+import copy
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from resource_versions import VersionStore
+
+
+@dataclass
+class ConfigEntry:
+    collection: object  # Motor collection
+    query: dict
+    model: Optional[Type[BaseModel]]  # Typed defaults; None means "document or None"
+    version_key: str
+
+    @property
+    def defaults(self) -> Optional[dict]:
+        if self.model is None:
+            return None
+        # Equality filters (e.g. {"id": "main"}) are part of the document's shape
+        return {**self.query, **self.model().model_dump()}
+
+
+class ConfigRegistry:
+    def __init__(self, versions: VersionStore):
+        self.versions = versions
+        self._entries: Dict[str, ConfigEntry] = {}
+        self._cache: Dict[str, Tuple[str, Optional[dict]]] = {}
+
+    @property
+    def resources(self):
+        return sorted({entry.version_key for entry in self._entries.values()})
+
+    def register(self, name: str, collection, query: dict, model: Type[BaseModel] = None, version_key: str = None):
+        self._entries[name] = ConfigEntry(collection, query, model, version_key or name)
+
+    async def get(self, name: str, defaults: bool = True) -> Optional[dict]:
+        """
+        Current value of a setting, merged over its defaults. Callers get their own copy.
+        With defaults=False the stored document (or None) is returned, for gates where
+        a setting that was never saved means "disabled".
+        """
+        entry = self._entries[name]
+        version = self.versions.get(entry.version_key)
+        cached = self._cache.get(name)
+        if cached is None or version is None or cached[0] != version:
+            doc = await entry.collection.find_one(entry.query, {"_id": 0})
+            if version is not None:
+                self._cache[name] = (version, doc)
+        else:
+            doc = cached[1]
+        base = entry.defaults if defaults else None
+        if base is None:
+            return copy.deepcopy(doc)
+        return copy.deepcopy({**base, **(doc or {})})
+
+    async def invalidate(self, version_key: str):
+        """Call after writing a setting; reloads it here now and in other workers within a poll"""
+        await self.versions.bump(version_key)
+        for name, entry in self._entries.items():
+            if entry.version_key == version_key:
+                self._cache.pop(name, None)
@@ -0,0 +1,331 @@
+"""
+Daily Stats
+Per-day rollups of orders, revenue, cancellations, unique visits and profit
+
+One small document per Nepal-local day in the `daily_stats` collection:
+    {_id: "2025-01-31", orders, revenue, cancelled, visits,
+     completed_revenue, cost, updated_at}
+
+The order and visit write paths keep the rows current with $inc, so the
+analytics overview and profit report sum a few dozen rows instead of
+scanning orders and visits. Revenue excludes cancelled orders, as the
+overview always has; completed_revenue and cost cover completed/delivered
+orders only. Cost comes from the cost_price each item captured when the
+order was placed, so later price changes don't rewrite past profit.
+
+If a rollup write is lost (or the rules change) rebuild from the raw
+collections. Orders from before the cost snapshot can be given one from
+today's product costs (best effort), which also rebuilds:
+
+Usage:
+    python daily_stats.py rebuild
+    python daily_stats.py backfill-costs
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from dotenv import load_dotenv
+from pymongo import ReplaceOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+STATS_COLLECTION = "daily_stats"
+NEPAL_TZ = timezone(timedelta(hours=5, minutes=45))
+NEPAL_OFFSET = "+05:45"  # Same zone for MongoDB's date operators
+COUNTERS = ("orders", "revenue", "cancelled", "visits", "completed_revenue", "cost")
+COMPLETED_STATUSES = ("completed", "delivered")
+
+# Order fields the rollups depend on; project these when fetching the pre-update document
+STATS_FIELDS = {"_id": 0, "status": 1, "created_at": 1, "total_amount": 1, "cost_total": 1}
+
+
+def nepal_day(value: Union[datetime, str, None] = None) -> Optional[str]:
+    """YYYY-MM-DD of a datetime or ISO timestamp in Nepal time; None if unparseable"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # Stored timestamps are UTC
+    return value.astimezone(NEPAL_TZ).strftime("%Y-%m-%d")
+
+
+def is_cancelled(status: Optional[str]) -> bool:
+    return (status or "").lower() == "cancelled"
+
+
+def is_completed(status: Optional[str]) -> bool:
+    return (status or "").lower() in COMPLETED_STATUSES
+
+
+def _number(value) -> float:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def order_amount(order: dict) -> float:
+    return _number(order.get("total_amount"))
+
+
+def order_counters(order: dict, sign: int = 1) -> Dict[str, float]:
+    """What one order contributes to its day's row"""
+    status = order.get("status")
+    if is_cancelled(status):
+        counters = {"orders": 1, "cancelled": 1}
+    else:
+        counters = {"orders": 1, "revenue": order_amount(order)}
+    if is_completed(status):
+        counters["completed_revenue"] = order_amount(order)
+        counters["cost"] = _number(order.get("cost_total"))
+    return {name: sign * value for name, value in counters.items()}
+
+
+def cost_total(items: Iterable[dict]) -> float:
+    """Cost of an order's items from their captured cost_price; unknown costs count as 0"""
+    return sum(_number(item.get("cost_price")) * _number(item.get("quantity", 1)) for item in items)
+
+
+async def snapshot_costs(db, items: List[dict]) -> float:
+    """Copy each item's current variation cost_price onto it; returns the order's total cost"""
+    product_ids = list({item["product_id"] for item in items if item.get("product_id")})
+    costs = {}
+    if product_ids:
+        async for product in db.products.find(
+            {"id": {"$in": product_ids}}, {"_id": 0, "id": 1, "variations.id": 1, "variations.cost_price": 1}
+        ):
+            for variation in product.get("variations", []):
+                costs[(product["id"], variation.get("id"))] = variation.get("cost_price")
+    for item in items:
+        item["cost_price"] = costs.get((item.get("product_id"), item.get("variation_id")))
+    return cost_total(items)
+
+
+def windows(today: str) -> Dict[str, tuple]:
+    """Overview period -> inclusive (first, last) day; the month before `today`'s is a calendar month"""
+    day = date.fromisoformat(today)
+    first_of_month = day.replace(day=1)
+    last_month_end = first_of_month - timedelta(days=1)
+    return {
+        "today": (today, today),
+        "week": ((day - timedelta(days=6)).isoformat(), today),
+        "month": ((day - timedelta(days=29)).isoformat(), today),
+        "lastMonth": (last_month_end.replace(day=1).isoformat(), last_month_end.isoformat()),
+    }
+
+
+def period_sums(rows: Iterable[dict], totals: dict, today: str) -> Dict[str, Dict[str, float]]:
+    """Period -> summed counters, from the recent rows plus the all-time totals"""
+    periods = windows(today)
+    sums = {name: dict.fromkeys(COUNTERS, 0) for name in periods}
+    for row in rows:
+        for name, (first, last) in periods.items():
+            if first <= row["_id"] <= last:
+                for counter in COUNTERS:
+                    sums[name][counter] += row.get(counter, 0)
+    sums["total"] = {counter: totals.get(counter, 0) for counter in COUNTERS}
+    return sums
+
+
+def summarize(rows: Iterable[dict], totals: dict, today: str) -> dict:
+    """Overview response from the recent rows plus the all-time totals"""
+    sums = period_sums(rows, totals, today)
+    result = {name: {"orders": s["orders"], "revenue": s["revenue"]} for name, s in sums.items()}
+    result["visits"] = {name: s["visits"] for name, s in sums.items()}
+    return result
+
+
+def summarize_profit(rows: Iterable[dict], totals: dict, today: str) -> dict:
+    """Profit response: completed/delivered revenue less the captured cost, per period"""
+    result = {
+        name: {"revenue": s["completed_revenue"], "cost": s["cost"], "profit": s["completed_revenue"] - s["cost"]}
+        for name, s in period_sums(rows, totals, today).items()
+    }
+    result["all_time"] = result["total"]
+    return result
+
+
+class DailyStats:
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db[STATS_COLLECTION]
+
+    async def _inc(self, day: Optional[str], counters: Dict[str, float]):
+        # A failed rollup write must not fail the order or visit; `rebuild` repairs drift
+        counters = {k: v for k, v in counters.items() if v}
+        if not day or not counters:
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": day},
+                {"$inc": counters, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to update daily stats for {day}: {e}")
+
+    # ---- Write paths ----
+
+    async def order_created(self, order: dict):
+        await self._inc(nepal_day(order.get("created_at")), order_counters(order))
+
+    async def order_status_changed(self, order: dict, new_status: str):
+        """`order` is the document as it was before the update"""
+        before = order_counters(order)
+        after = order_counters({**order, "status": new_status})
+        await self._inc(nepal_day(order.get("created_at")), {
+            name: after.get(name, 0) - before.get(name, 0) for name in set(before) | set(after)
+        })
+
+    async def order_deleted(self, order: dict):
+        await self._inc(nepal_day(order.get("created_at")), order_counters(order, sign=-1))
+
+    async def visit(self, day: str):
+        await self._inc(day, {"visits": 1})
+
+    # ---- Reads ----
+
+    async def _read(self, now: Optional[datetime]):
+        today = nepal_day(now)
+        since = min(first for first, _ in windows(today).values())
+        rows = await self.collection.find({"_id": {"$gte": since}}).to_list(None)
+        totals = await self.collection.aggregate([
+            {"$group": {"_id": None, **{name: {"$sum": f"${name}"} for name in COUNTERS}}},
+        ]).to_list(1)
+        return rows, totals[0] if totals else {}, today
+
+    async def overview(self, now: Optional[datetime] = None) -> dict:
+        return summarize(*await self._read(now))
+
+    async def profit(self, now: Optional[datetime] = None) -> dict:
+        return summarize_profit(*await self._read(now))
+
+    # ---- Rebuild ----
+
+    async def rebuild(self) -> int:
+        """Recompute every row from orders and visits; returns the number of days written"""
+        days: Dict[str, Dict[str, float]] = {}
+
+        status = {"$toLower": {"$ifNull": ["$status", ""]}}
+        cancelled = {"$eq": [status, "cancelled"]}
+        completed = {"$in": [status, list(COMPLETED_STATUSES)]}
+        amount = {"$cond": [{"$isNumber": "$total_amount"}, "$total_amount", 0]}
+        cost = {"$cond": [{"$isNumber": "$cost_total"}, "$cost_total", 0]}
+        order_fields = ("orders", "revenue", "cancelled", "completed_revenue", "cost")
+        async for row in self.db.orders.aggregate([
+            {"$group": {
+                "_id": _day_expression("$created_at"),
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": {"$cond": [cancelled, 0, amount]}},
+                "cancelled": {"$sum": {"$cond": [cancelled, 1, 0]}},
+                "completed_revenue": {"$sum": {"$cond": [completed, amount, 0]}},
+                "cost": {"$sum": {"$cond": [completed, cost, 0]}},
+            }},
+        ], allowDiskUse=True):
+            if row["_id"]:
+                days.setdefault(row["_id"], {}).update({name: row[name] for name in order_fields})
+
+        async for row in self.db.visits.aggregate([
+            {"$group": {"_id": {"day": _day_expression("$created_at"), "visitor": "$visitor_id"}}},
+            {"$group": {"_id": "$_id.day", "visits": {"$sum": 1}}},
+        ], allowDiskUse=True):
+            if row["_id"]:
+                days.setdefault(row["_id"], {})["visits"] = row["visits"]
+
+        now = datetime.now(timezone.utc).isoformat()
+        ops = [
+            ReplaceOne({"_id": day}, {**{name: values.get(name, 0) for name in COUNTERS}, "updated_at": now}, upsert=True)
+            for day, values in days.items()
+        ]
+        for start in range(0, len(ops), 1000):
+            await self.collection.bulk_write(ops[start:start + 1000], ordered=False)
+        await self.collection.delete_many({"_id": {"$nin": list(days)}})
+        return len(days)
+
+    async def ensure_built(self):
+        """Build the rollups once for a database that predates them"""
+        try:
+            if await self.collection.find_one({}, {"_id": 1}) is None and await self.db.orders.find_one({}, {"_id": 1}):
+                days = await self.rebuild()
+                logger.info(f"Built daily stats for {days} days")
+        except Exception as e:
+            logger.error(f"Failed to build daily stats: {e}")
+
+
+async def backfill_costs(db) -> int:
+    """
+    Give orders placed before the cost snapshot one from today's product costs.
+    Items are matched by product/variation id, or by name for items saved
+    without ids. Returns the number of orders updated.
+    """
+    by_id, by_name = {}, {}
+    async for product in db.products.find({}, {"_id": 0, "id": 1, "name": 1, "variations": 1}):
+        for variation in product.get("variations", []):
+            by_id[(product.get("id"), variation.get("id"))] = variation.get("cost_price")
+            by_name[(product.get("name"), variation.get("name"))] = variation.get("cost_price")
+
+    ops, updated = [], 0
+    async for order in db.orders.find({"cost_total": {"$exists": False}}, {"_id": 1, "items": 1}):
+        items = order.get("items") or []
+        for item in items:
+            if item.get("cost_price") is None:
+                key = (item.get("product_id"), item.get("variation_id"))
+                item["cost_price"] = by_id.get(key) if key in by_id else by_name.get((item.get("name"), item.get("variation")))
+        ops.append(UpdateOne({"_id": order["_id"]}, {"$set": {"items": items, "cost_total": cost_total(items)}}))
+        if len(ops) >= 500:
+            await db.orders.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.orders.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+def _day_expression(field: str) -> dict:
+    return {"$dateToString": {
+        "format": "%Y-%m-%d",
+        "timezone": NEPAL_OFFSET,
+        "date": {"$dateFromString": {"dateString": field, "onError": None, "onNull": None}},
+    }}
+
+
+async def main(command: str):
+    ROOT_DIR = Path(__file__).parent
+    load_dotenv(ROOT_DIR / '.env')
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    try:
+        if command == "rebuild":
+            days = await DailyStats(db).rebuild()
+            print(f"✓ Rebuilt daily stats for {days} days")
+            return 0
+
+        if command == "backfill-costs":
+            orders = await backfill_costs(db)
+            print(f"✓ Captured costs for {orders} orders")
+            days = await DailyStats(db).rebuild()
+            print(f"✓ Rebuilt daily stats for {days} days")
+            return 0
+
+        print(__doc__)
+        return 2
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "")))
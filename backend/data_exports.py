@@ -0,0 +1,236 @@
+"""
+Data Exports
+Streams orders, customers and credit logs as CSV, NDJSON or Parquet
+
+Documents are read from a cursor in batches and each batch is encoded and
+sent before the next one is fetched, so memory stays flat however many
+rows match. Parquet is written one row group per batch.
+"""
+import asyncio
+import csv
+import io
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+import orjson
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet is optional; CSV and NDJSON need nothing
+    pyarrow = None
+
+BATCH_SIZE = 2000
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    collection: str
+    columns: Tuple[Tuple[str, str], ...]  # (field, "string" | "float")
+    status_field: Optional[str] = None
+    date_field: str = "created_at"
+
+    @property
+    def projection(self) -> dict:
+        return {"_id": 0, **{field: 1 for field, _ in self.columns}}
+
+
+EXPORTS = {
+    "orders": ExportSpec("orders", (
+        ("id", "string"),
+        ("takeapp_order_number", "string"),
+        ("customer_name", "string"),
+        ("customer_phone", "string"),
+        ("customer_email", "string"),
+        ("items_text", "string"),
+        ("total_amount", "float"),
+        ("credits_used", "float"),
+        ("status", "string"),
+        ("payment_method", "string"),
+        ("remark", "string"),
+        ("created_at", "string"),
+        ("updated_at", "string"),
+    ), status_field="status"),
+    "customers": ExportSpec("customers", (
+        ("id", "string"),
+        ("email", "string"),
+        ("name", "string"),
+        ("phone", "string"),
+        ("whatsapp_number", "string"),
+        ("credit_balance", "float"),
+        ("referral_code", "string"),
+        ("created_at", "string"),
+        ("last_login", "string"),
+    )),
+    "credit_logs": ExportSpec("credit_logs", (
+        ("id", "string"),
+        ("customer_id", "string"),
+        ("customer_email", "string"),
+        ("amount", "float"),
+        ("reason", "string"),
+        ("balance_before", "float"),
+        ("balance_after", "float"),
+        ("created_by", "string"),
+        ("created_at", "string"),
+    )),
+}
+
+
+def export_query(spec: ExportSpec, start: Optional[str] = None, end: Optional[str] = None,
+                 statuses: Optional[List[str]] = None) -> dict:
+    """Date range on ISO strings: start inclusive, end exclusive"""
+    query = {}
+    if start or end:
+        query[spec.date_field] = {}
+        if start:
+            query[spec.date_field]["$gte"] = start
+        if end:
+            query[spec.date_field]["$lt"] = end
+    if statuses:
+        if not spec.status_field:
+            raise ValueError(f"{spec.collection} has no status to filter on")
+        query[spec.status_field] = {"$in": statuses}
+    return query
+
+
+async def batches(collection, query: dict, projection: dict, sort_field: str,
+                  batch_size: int = BATCH_SIZE) -> AsyncIterator[List[dict]]:
+    cursor = collection.find(query, projection).sort(sort_field, 1).batch_size(batch_size)
+    batch = []
+    try:
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        await cursor.close()  # Client disconnected mid-export
+
+
+def _float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _string(value):
+    return None if value is None else str(value)
+
+
+CONVERTERS = {"string": _string, "float": _float}
+
+
+# ==================== ENCODERS ====================
+
+class CSVEncoder:
+    def __init__(self, spec: ExportSpec):
+        self.fields = [field for field, _ in spec.columns]
+
+    def header(self) -> bytes:
+        return self._rows([self.fields])
+
+    def encode(self, docs: List[dict]) -> bytes:
+        return self._rows([[doc.get(field, "") for field in self.fields] for doc in docs])
+
+    def finish(self) -> bytes:
+        return b""
+
+    @staticmethod
+    def _rows(rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+
+class NDJSONEncoder:
+    def __init__(self, spec: ExportSpec):
+        self.fields = [field for field, _ in spec.columns]
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, docs: List[dict]) -> bytes:
+        return b"".join(
+            orjson.dumps({field: doc.get(field) for field in self.fields}, default=str) + b"\n" for doc in docs
+        )
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file for ParquetWriter whose contents are taken after each row group"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+class ParquetEncoder:
+    TYPES = {"string": "string", "float": "float64"}
+
+    def __init__(self, spec: ExportSpec):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export needs pyarrow installed")
+        self.columns = spec.columns
+        self.schema = pyarrow.schema([(field, self.TYPES[kind]) for field, kind in spec.columns])
+        self.sink = _DrainableSink()
+        self.writer = pyarrow.parquet.ParquetWriter(self.sink, self.schema, compression="snappy")
+
+    def header(self) -> bytes:
+        return self.sink.drain()
+
+    def encode(self, docs: List[dict]) -> bytes:
+        table = pyarrow.table(
+            {field: [CONVERTERS[kind](doc.get(field)) for doc in docs] for field, kind in self.columns},
+            schema=self.schema,
+        )
+        self.writer.write_table(table)
+        return self.sink.drain()
+
+    def finish(self) -> bytes:
+        self.writer.close()  # Writes the footer
+        return self.sink.drain()
+
+
+ENCODERS: dict = {"csv": CSVEncoder, "ndjson": NDJSONEncoder, "parquet": ParquetEncoder}
+
+
+async def stream_export(spec: ExportSpec, fmt: str, docs: AsyncIterator[List[dict]],
+                        offload: Callable = asyncio.to_thread) -> AsyncIterator[bytes]:
+    """Encode batches as they arrive; encoding runs off the event loop"""
+    encoder = ENCODERS[fmt](spec)
+    header = encoder.header()
+    if header:
+        yield header
+    async for batch in docs:
+        chunk = await offload(encoder.encode, batch)
+        if chunk:
+            yield chunk
+    tail = encoder.finish()
+    if tail:
+        yield tail
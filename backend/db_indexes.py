@@ -0,0 +1,302 @@
+"""
+MongoDB Index Manifest
+Declares every index the API relies on, applies them idempotently and
+verifies with explain() that the main query shapes never collection-scan
+
+Usage:
+    python db_indexes.py apply    # create missing indexes
+    python db_indexes.py check    # exit 1 if any query shape does a COLLSCAN
+"""
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+def unique_id(field: str = "id") -> IndexModel:
+    # Sparse so legacy documents seeded without an "id" don't collide on null
+    return IndexModel([(field, ASCENDING)], unique=True, sparse=True, name=f"{field}_unique")
+
+
+def index(*keys, name: str, **options) -> IndexModel:
+    return IndexModel(list(keys), name=name, **options)
+
+
+# Collection -> indexes. Names are fixed so re-applying the manifest is a no-op.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "admins": [
+        index(("username", ASCENDING), name="username_unique", unique=True),
+    ],
+    "permissions": [unique_id()],
+    "customers": [
+        unique_id(),
+        index(("email", ASCENDING), name="email"),
+        index(("phone_key", ASCENDING), name="phone_key_unique", unique=True, sparse=True),
+        index(("referral_code", ASCENDING), name="referral_code_unique", unique=True, sparse=True),
+        index(("created_at", DESCENDING), name="created_at"),
+        index(("updated_at", ASCENDING), ("_id", ASCENDING), name="updated_at_id"),
+    ],
+    "otp_records": [
+        index(("email", ASCENDING), ("otp", ASCENDING), name="email_otp"),
+    ],
+    "orders": [
+        unique_id(),
+        index(("customer_email", ASCENDING), ("created_at", DESCENDING), name="customer_email_created_at"),
+        index(("phone_key", ASCENDING), name="phone_key", sparse=True),
+        index(("created_at", DESCENDING), name="created_at"),
+        index(("status", ASCENDING), ("created_at", DESCENDING), name="status_created_at"),
+        index(("takeapp_order_id", ASCENDING), name="takeapp_order_id", sparse=True),
+        index(("takeapp_order_number", ASCENDING), name="takeapp_order_number", sparse=True),
+        index(("updated_at", ASCENDING), ("_id", ASCENDING), name="updated_at_id"),
+    ],
+    "order_status_history": [
+        index(("order_id", ASCENDING), ("created_at", ASCENDING), name="order_id_created_at"),
+    ],
+    "wishlists": [
+        index(("visitor_id", ASCENDING), ("product_id", ASCENDING), ("variation_id", ASCENDING), name="visitor_product"),
+        index(("email", ASCENDING), name="email", sparse=True),
+    ],
+    "categories": [
+        unique_id(),
+        index(("slug", ASCENDING), name="slug"),
+    ],
+    "products": [
+        unique_id(),
+        index(("slug", ASCENDING), name="slug"),
+        index(("is_active", ASCENDING), ("sort_order", ASCENDING), ("created_at", DESCENDING), name="active_sort_order"),
+        index(("category_id", ASCENDING), ("is_active", ASCENDING), name="category_active"),
+        index(("tags", ASCENDING), name="tags"),
+        index(("sort_order", DESCENDING), name="sort_order"),
+    ],
+    "reviews": [
+        unique_id(),
+        index(("review_date", DESCENDING), name="review_date"),
+        index(("source", ASCENDING), ("reviewer_name", ASCENDING), name="source_reviewer"),
+    ],
+    "trustpilot_config": [
+        index(("key", ASCENDING), name="key_unique", unique=True),
+    ],
+    "faqs": [
+        unique_id(),
+        index(("sort_order", ASCENDING), name="sort_order"),
+    ],
+    "pages": [
+        index(("page_key", ASCENDING), name="page_key_unique", unique=True),
+    ],
+    "social_links": [unique_id()],
+    "payment_methods": [
+        unique_id(),
+        index(("sort_order", ASCENDING), name="sort_order"),
+    ],
+    "notification_bar": [
+        unique_id(),
+        index(("is_active", ASCENDING), name="is_active"),
+    ],
+    "blog_posts": [
+        unique_id(),
+        index(("slug", ASCENDING), name="slug"),
+        index(("is_published", ASCENDING), ("created_at", DESCENDING), name="published_created_at"),
+    ],
+    "site_settings": [unique_id()],
+    "credit_settings": [unique_id()],
+    "referral_settings": [unique_id()],
+    "daily_reward_settings": [unique_id()],
+    "promo_codes": [
+        unique_id(),
+        index(("code", ASCENDING), ("is_active", ASCENDING), name="code_active"),
+        index(("auto_apply", ASCENDING), ("is_active", ASCENDING), name="auto_apply_active"),
+        index(("created_at", DESCENDING), name="created_at"),
+    ],
+    "promo_usage": [
+        index(("promo_code", ASCENDING), ("customer_email", ASCENDING), name="promo_customer"),
+    ],
+    "credit_logs": [
+        index(("customer_id", ASCENDING), ("created_at", DESCENDING), name="customer_id_created_at"),
+        index(("customer_email", ASCENDING), ("created_at", DESCENDING), name="customer_email_created_at"),
+        index(("created_at", ASCENDING), name="created_at"),
+    ],
+    "bundles": [
+        unique_id(),
+        index(("is_active", ASCENDING), ("sort_order", ASCENDING), name="active_sort_order"),
+    ],
+    "newsletter": [
+        index(("email", ASCENDING), name="email_unique", unique=True),
+        index(("is_active", ASCENDING), ("subscribed_at", DESCENDING), name="active_subscribed_at"),
+        index(("is_active", ASCENDING), ("_id", ASCENDING), name="active_id"),  # Campaign cursor
+    ],
+    "sheet_sync_jobs": [
+        unique_id(),
+        index(("status", ASCENDING), ("updated_at", DESCENDING), name="status_updated_at"),
+    ],
+    "newsletter_campaigns": [
+        unique_id(),
+        index(("status", ASCENDING), ("lease_expires_at", ASCENDING), name="status_lease"),
+    ],
+    "visits": [
+        # One row per visitor per day; track_visit counts a visit only when it inserts one
+        index(("visitor_id", ASCENDING), ("date", ASCENDING), name="visitor_date_unique", unique=True),
+        index(("date", ASCENDING), name="date"),
+        index(("created_at", ASCENDING), name="created_at"),
+    ],
+    "daily_stats": [],  # _id is the day, so range reads use the _id index
+    "referrals": [
+        index(("referrer_email", ASCENDING), ("created_at", DESCENDING), name="referrer_created_at"),
+        index(("created_at", DESCENDING), name="created_at"),
+    ],
+    "resource_versions": [
+        index(("resource", ASCENDING), name="resource_unique", unique=True),
+    ],
+    "multiplier_events": [
+        unique_id(),
+        index(("is_active", ASCENDING), ("start_time", ASCENDING), ("end_time", ASCENDING), name="active_window"),
+        index(("start_time", DESCENDING), name="start_time"),
+    ],
+}
+
+# Representative filters/sorts from server.py that must be served by an index
+QUERY_SHAPES = [
+    ("admins", {"username": "x"}, None),
+    ("customers", {"id": "x"}, None),
+    ("customers", {"email": "x"}, None),
+    ("customers", {"phone_key": "+9779800000000"}, None),
+    ("customers", {"referral_code": "X"}, None),
+    ("customers", {}, [("created_at", DESCENDING)]),
+    ("otp_records", {"email": "x", "otp": "1", "verified": False}, None),
+    ("orders", {"id": "x"}, None),
+    ("orders", {"customer_email": "x"}, [("created_at", DESCENDING)]),
+    ("orders", {"phone_key": "+9779800000000"}, [("created_at", DESCENDING)]),
+    ("orders", {}, [("created_at", DESCENDING)]),
+    ("orders", {"created_at": {"$gte": "2025-01-01"}}, None),
+    ("orders", {"status": {"$in": ["completed", "Completed", "delivered"]}}, None),
+    ("orders", {"$or": [{"id": "x"}, {"takeapp_order_id": "x"}, {"takeapp_order_number": "x"}]}, None),
+    ("orders", {"created_at": {"$gte": "2025-01-01", "$lt": "2025-02-01"}, "status": {"$in": ["completed"]}}, [("created_at", ASCENDING)]),
+    ("orders", {"updated_at": {"$gt": "2025-01-01"}}, [("updated_at", ASCENDING), ("_id", ASCENDING)]),
+    ("order_status_history", {"order_id": "x"}, [("created_at", ASCENDING)]),
+    ("wishlists", {"visitor_id": "x"}, None),
+    ("wishlists", {"email": "x"}, None),
+    ("categories", {"id": "x"}, None),
+    ("products", {"id": "x"}, None),
+    ("products", {"slug": "x"}, None),
+    ("products", {"$or": [{"slug": "x"}, {"id": "x"}]}, None),
+    ("products", {"is_active": True}, [("sort_order", ASCENDING), ("created_at", DESCENDING)]),
+    ("products", {"category_id": "x", "is_active": True}, None),
+    ("reviews", {}, [("review_date", DESCENDING)]),
+    ("reviews", {"source": "trustpilot"}, None),
+    ("trustpilot_config", {"key": "last_sync"}, None),
+    ("faqs", {}, [("sort_order", ASCENDING)]),
+    ("pages", {"page_key": "about"}, None),
+    ("payment_methods", {"id": "x"}, None),
+    ("notification_bar", {"is_active": True}, None),
+    ("blog_posts", {"slug": "x", "is_published": True}, None),
+    ("blog_posts", {"is_published": True}, [("created_at", DESCENDING)]),
+    ("site_settings", {"id": "main"}, None),
+    ("credit_settings", {"id": "main"}, None),
+    ("referral_settings", {"id": "main"}, None),
+    ("daily_reward_settings", {"id": "main"}, None),
+    ("promo_codes", {"code": "X", "is_active": True}, None),
+    ("promo_codes", {"is_active": True, "auto_apply": True}, None),
+    ("promo_usage", {"promo_code": "X", "customer_email": "x"}, None),
+    ("credit_logs", {"customer_id": "x"}, [("created_at", DESCENDING)]),
+    ("credit_logs", {"created_at": {"$gte": "2025-01-01"}}, [("created_at", ASCENDING)]),
+    ("bundles", {"is_active": True}, [("sort_order", ASCENDING)]),
+    ("newsletter", {"email": "x"}, None),
+    ("newsletter", {"is_active": True}, [("subscribed_at", DESCENDING)]),
+    ("newsletter", {"is_active": True, "_id": {"$gt": ObjectId("000000000000000000000000")}}, [("_id", ASCENDING)]),
+    ("visits", {"visitor_id": "x", "date": "2025-01-01"}, None),
+    ("visits", {"created_at": {"$gte": "2025-01-01"}}, None),
+    ("daily_stats", {"_id": {"$gte": "2025-01-01"}}, None),
+    ("referrals", {"referrer_email": "x"}, [("created_at", DESCENDING)]),
+    ("multiplier_events", {"is_active": True, "start_time": {"$lte": "x"}, "end_time": {"$gte": "x"}}, None),
+]
+
+
+async def ensure_indexes(db, collections: Optional[List[str]] = None) -> dict:
+    """
+    Create every index in the manifest. Already-existing indexes are a no-op.
+    A conflicting or failing index is logged and skipped so one bad index
+    (e.g. legacy duplicates blocking a unique one) can't stop the rest.
+    """
+    created, failed = 0, []
+    for collection, models in INDEXES.items():
+        if collections and collection not in collections:
+            continue
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+                created += 1
+            except OperationFailure as e:
+                name = model.document["name"]
+                logger.error(f"Failed to create index {collection}.{name}: {e}")
+                failed.append(f"{collection}.{name}")
+    logger.info(f"Indexes ensured: {created} ok, {len(failed)} failed")
+    return {"ensured": created, "failed": failed}
+
+
+def find_collscan(plan) -> bool:
+    """Walk an explain() plan tree looking for a COLLSCAN stage"""
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(find_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(find_collscan(item) for item in plan)
+    return False
+
+
+async def check_query_shapes(db) -> List[str]:
+    """Returns a description of every query shape whose winning plan is a COLLSCAN"""
+    offenders = []
+    for collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if find_collscan(winning_plan):
+            offenders.append(f"{collection}: filter={query} sort={sort}")
+    return offenders
+
+
+async def main(command: str):
+    ROOT_DIR = Path(__file__).parent
+    load_dotenv(ROOT_DIR / '.env')
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    try:
+        if command == "apply":
+            result = await ensure_indexes(db)
+            print(f"✓ Ensured {result['ensured']} indexes")
+            for name in result["failed"]:
+                print(f"✗ Failed: {name}")
+            return 1 if result["failed"] else 0
+
+        if command == "check":
+            offenders = await check_query_shapes(db)
+            for offender in offenders:
+                print(f"✗ COLLSCAN: {offender}")
+            if offenders:
+                return 1
+            print(f"✓ All {len(QUERY_SHAPES)} query shapes use an index")
+            return 0
+
+        print(__doc__)
+        return 2
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "")))
@@ -0,0 +1,154 @@
+"""
+Email Templates
+Transactional email rendered from precompiled Jinja2 templates
+
+Each email in templates/email is three files: <name>.subject, <name>.html
+and <name>.txt. HTML templates use the classes in styles.css; the loader
+rewrites them into inline style attributes when a template is compiled, so
+the CSS work happens once per process and a send only fills in the values.
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from jinja2 import BaseLoader, Environment, FileSystemLoader, Template, TemplateNotFound, select_autoescape
+from markupsafe import escape
+
+TEMPLATE_DIR = Path(__file__).parent / "templates" / "email"
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_RULE = re.compile(r"\.([\w-]+)\s*\{([^}]*)\}")
+_TAG = re.compile(r"<[a-zA-Z][^>]*>")
+_CLASS_ATTR = re.compile(r'\s+class="([^"]*)"')
+_STYLE_ATTR = re.compile(r'\s+style="([^"]*)"')
+
+
+def parse_css(css: str) -> Dict[str, str]:
+    """Single-class rules only: {class name: "prop: value; ..."}"""
+    rules = {}
+    for name, body in _CSS_RULE.findall(_CSS_COMMENT.sub("", css)):
+        declarations = [d.strip() for d in body.split(";") if d.strip()]
+        rules[name] = "; ".join(declarations) + ";"
+    return rules
+
+
+def inline_css(html: str, rules: Dict[str, str]) -> str:
+    """
+    Replace class="..." with the matching declarations, ahead of any existing
+    style attribute so per-element overrides still win
+    """
+
+    def rewrite_tag(match):
+        tag = match.group(0)
+        classes = _CLASS_ATTR.search(tag)
+        if not classes:
+            return tag
+        missing = [name for name in classes.group(1).split() if name not in rules]
+        if missing:
+            raise ValueError(f"Unknown email CSS class: {', '.join(missing)}")
+        style = " ".join(rules[name] for name in classes.group(1).split())
+        tag = _CLASS_ATTR.sub("", tag, count=1)
+        existing = _STYLE_ATTR.search(tag)
+        if existing:
+            return tag[:existing.start(1)] + style + " " + existing.group(1) + tag[existing.end(1):]
+        end = -2 if tag.endswith("/>") else -1
+        return f'{tag[:end]} style="{style}"{tag[end:]}'
+
+    return _TAG.sub(rewrite_tag, html)
+
+
+class InliningLoader(BaseLoader):
+    """FileSystemLoader that inlines styles.css into .html templates as they are loaded"""
+
+    def __init__(self, directory: Path):
+        self.files = FileSystemLoader(str(directory))
+        self.rules = parse_css((directory / "styles.css").read_text(encoding="utf-8"))
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = self.files.get_source(environment, template)
+        if template.endswith(".html"):
+            source = inline_css(source, self.rules)
+        return source, filename, uptodate
+
+
+# Merge fields are rendered as \ue000name\ue000 (a private-use character that is neither
+# whitespace nor escaped, so strip() and autoescaping leave it alone)
+_MERGE_FIELD = re.compile("\ue000([a-z_]+)\ue000")
+
+
+def merge_placeholders(fields: Iterable[str]) -> Dict[str, str]:
+    return {field: f"\ue000{field}\ue000" for field in fields}
+
+
+class MergeTemplate:
+    """
+    Output rendered once with placeholder merge fields. fill() is a join of
+    the static parts with per-recipient values, for bulk sends.
+    """
+
+    def __init__(self, rendered: str, html: bool = False):
+        parts = _MERGE_FIELD.split(rendered)
+        self.static: List[str] = parts[0::2]
+        self.fields: List[str] = parts[1::2]
+        self.html = html
+
+    def fill(self, values: Dict[str, str]) -> str:
+        out = [self.static[0]]
+        for field, static in zip(self.fields, self.static[1:]):
+            value = str(values.get(field) or "")
+            out.append(str(escape(value)) if self.html else value)
+            out.append(static)
+        return "".join(out)
+
+
+def rupees(value) -> str:
+    return f"{float(value or 0):,.0f}"
+
+
+class EmailTemplates:
+    """Compiles every email once; render() returns (subject, html, text)"""
+
+    def __init__(self, directory: Path = TEMPLATE_DIR, site_globals: dict = None):
+        self.directory = directory
+        self.env = Environment(
+            loader=InliningLoader(directory),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,  # Templates only change on deploy; skip per-render mtime checks
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self.env.filters["rupees"] = rupees
+        self.env.globals.update(site_globals or {})
+        self._compiled: Dict[str, Tuple[Template, Template, Template]] = {}
+
+    @property
+    def names(self):
+        return sorted(path.stem for path in self.directory.glob("*.subject"))
+
+    def compile_all(self):
+        for name in self.names:
+            self._compile(name)
+
+    def _compile(self, name: str) -> Tuple[Template, Template, Template]:
+        try:
+            compiled = tuple(self.env.get_template(f"{name}.{part}") for part in ("subject", "html", "txt"))
+        except TemplateNotFound as e:
+            raise KeyError(f"Unknown email template: {name}") from e
+        self._compiled[name] = compiled
+        return compiled
+
+    def render(self, name: str, /, **context) -> Tuple[str, str, str]:
+        subject, html, text = self._compiled.get(name) or self._compile(name)
+        return subject.render(context).strip(), html.render(context), text.render(context)
+
+    def render_merge(self, name: str, fields: Iterable[str], /, **context) -> Tuple[MergeTemplate, MergeTemplate, MergeTemplate]:
+        """Render with the given fields left as placeholders, to be filled per recipient"""
+        subject, html, text = self.render(name, **context, **merge_placeholders(fields))
+        return MergeTemplate(subject), MergeTemplate(html, html=True), MergeTemplate(text)
+
+
+templates = EmailTemplates(site_globals={
+    "shop_name": "GameShop Nepal",
+    "whatsapp": "+977 9743488871",
+})
+templates.compile_all()
@@ -0,0 +1,392 @@
+"""
+Export Pipeline
+Continuous export of order and customer changes to Google Sheets and local files
+
+Changes are read from a MongoDB change stream when the server supports one
+(replica set, including a single-node one), otherwise from a poller that
+follows each collection's updated_at high-water mark. They are delivered in
+batches to every sink; the read position (resume token or high-water mark)
+is saved in `export_state` only after all sinks accepted the batch, so a
+failing sink or an API quota only delays the export.
+
+One worker runs the pipeline at a time, guarded by a lease in export_state.
+The poller only sees writes that set updated_at; run the full Sheets resync
+once after enabling it to cover older documents. It also trails the clock by
+POLL_SETTLE_SECONDS, because updated_at is computed before the write commits:
+a write that takes longer than that to commit (or a worker clock that far
+behind) can still be missed. The change stream has no such gap.
+"""
+import asyncio
+import csv
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+import google_sheets_service
+
+logger = logging.getLogger(__name__)
+
+STATE_COLLECTION = "export_state"
+EXPORTED_COLLECTIONS = ("orders", "customers")
+
+# Never leaves the database
+EXCLUDED_FIELDS = {"otp": 0, "otp_expires": 0}
+
+# Raised by watch() on a standalone server
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+
+# The poller only reads documents whose updated_at is at least this old
+POLL_SETTLE_SECONDS = 5.0
+
+
+@dataclass
+class ChangeEvent:
+    collection: str
+    op: str  # "upsert" or "delete"
+    document_id: str  # str(_id); deletes carry nothing else
+    document: Optional[dict] = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _plain(document: dict) -> dict:
+    document = {k: v for k, v in document.items() if k not in EXCLUDED_FIELDS}
+    document.pop("_id", None)
+    return document
+
+
+# ==================== SOURCES ====================
+
+class ChangeStreamSource:
+    """Tails a database-level change stream filtered to the exported collections"""
+
+    name = "change_stream"
+
+    def __init__(self, db, collections=EXPORTED_COLLECTIONS, batch_size: int = 500, max_wait: float = 2.0):
+        self.db = db
+        self.collections = list(collections)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+    async def batches(self, resume_token) -> AsyncIterator[Tuple[List[ChangeEvent], object]]:
+        """Yields (events, checkpoint); empty batches every max_wait keep the lease alive"""
+        pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+        async with self.db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=resume_token,
+            max_await_time_ms=int(self.max_wait * 1000),
+        ) as stream:
+            while stream.alive:
+                events = []
+                deadline = asyncio.get_running_loop().time() + self.max_wait
+                while len(events) < self.batch_size and asyncio.get_running_loop().time() < deadline:
+                    change = await stream.try_next()
+                    if change is None:
+                        break
+                    event = self.to_event(change)
+                    if event:
+                        events.append(event)
+                yield events, stream.resume_token
+
+    @staticmethod
+    def to_event(change: dict) -> Optional[ChangeEvent]:
+        collection = change["ns"]["coll"]
+        document_id = str(change["documentKey"]["_id"])
+        if change["operationType"] == "delete":
+            return ChangeEvent(collection, "delete", document_id)
+        document = change.get("fullDocument")
+        if document is None:
+            return None  # Deleted again before the lookup; the delete event follows
+        return ChangeEvent(collection, "upsert", document_id, _plain(document))
+
+
+class PollingSource:
+    """
+    Follows updated_at per collection; (updated_at, _id) breaks ties so
+    documents written in the same millisecond are neither skipped nor repeated.
+    Only documents older than `settle` seconds are read, so writes still in
+    flight when the mark moves are picked up on a later poll.
+    """
+
+    name = "poll"
+
+    def __init__(self, db, collections=EXPORTED_COLLECTIONS, batch_size: int = 500, interval: float = 2.0,
+                 settle: float = POLL_SETTLE_SECONDS):
+        self.db = db
+        self.collections = list(collections)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.settle = settle
+
+    async def batches(self, marks: Optional[dict]) -> AsyncIterator[Tuple[List[ChangeEvent], dict]]:
+        # Start from now; history is covered by the full resync
+        marks = dict(marks or {})
+        for collection in self.collections:
+            marks.setdefault(collection, {"updated_at": _now().isoformat(), "_id": None})
+        while True:
+            events = []
+            for collection in self.collections:
+                events.extend(await self._changes(collection, marks))
+            yield events, {k: dict(v) for k, v in marks.items()}
+            if not events:
+                await asyncio.sleep(self.interval)
+
+    async def _changes(self, collection: str, marks: dict) -> List[ChangeEvent]:
+        mark = marks[collection]
+        if mark["_id"] is None:
+            after = {"updated_at": {"$gt": mark["updated_at"]}}
+        else:
+            after = {"$or": [
+                {"updated_at": {"$gt": mark["updated_at"]}},
+                {"updated_at": mark["updated_at"], "_id": {"$gt": mark["_id"]}},
+            ]}
+        settled = {"updated_at": {"$lte": (_now() - timedelta(seconds=self.settle)).isoformat()}}
+        query = {"$and": [after, settled]}
+        docs = await self.db[collection].find(query, EXCLUDED_FIELDS).sort(
+            [("updated_at", 1), ("_id", 1)]
+        ).to_list(self.batch_size)
+        if docs:
+            marks[collection] = {"updated_at": docs[-1]["updated_at"], "_id": docs[-1]["_id"]}
+        return [ChangeEvent(collection, "upsert", str(doc["_id"]), _plain(doc)) for doc in docs]
+
+
+# ==================== SINKS ====================
+
+class SheetsSink:
+    """Upserts rows through the batched Sheets writer; deletes are not mirrored, as before"""
+
+    name = "sheets"
+    KEYS = {"orders": ("id", google_sheets_service.order_row), "customers": ("email", google_sheets_service.customer_row)}
+
+    def __init__(self, writer=None):
+        self.writer = writer or google_sheets_service.sheets_writer
+
+    async def write(self, events: List[ChangeEvent]):
+        for event in events:
+            if event.op != "upsert" or event.collection not in self.KEYS:
+                continue
+            key, row = self.KEYS[event.collection]
+            self.writer.enqueue(event.collection, event.document.get(key, ""), row(event.document))
+        await self.writer.flush(raise_errors=True)
+
+
+class NDJSONSink:
+    """One JSON line per change in <directory>/<collection>-<YYYY-MM-DD>.ndjson"""
+
+    name = "ndjson"
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    async def write(self, events: List[ChangeEvent]):
+        await asyncio.to_thread(self._write, events, _now())
+
+    def _write(self, events: List[ChangeEvent], now: datetime):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lines: Dict[Path, List[str]] = {}
+        for event in events:
+            path = self.directory / f"{event.collection}-{now.date().isoformat()}.ndjson"
+            record = {"exported_at": now.isoformat(), "op": event.op, "_id": event.document_id, "document": event.document}
+            lines.setdefault(path, []).append(json.dumps(record, default=str, ensure_ascii=False))
+        for path, batch in lines.items():
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(batch) + "\n")
+
+
+class CSVSink:
+    """Sheet-shaped rows plus exported_at/op columns in <directory>/<collection>-<YYYY-MM-DD>.csv"""
+
+    name = "csv"
+    COLUMNS = {
+        "orders": (google_sheets_service.ORDER_HEADERS, google_sheets_service.order_row),
+        "customers": (google_sheets_service.CUSTOMER_HEADERS, google_sheets_service.customer_row),
+    }
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    async def write(self, events: List[ChangeEvent]):
+        await asyncio.to_thread(self._write, events, _now())
+
+    def _write(self, events: List[ChangeEvent], now: datetime):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        rows: Dict[str, List[list]] = {}
+        for event in events:
+            headers, row = self.COLUMNS[event.collection]
+            values = row(event.document) if event.document else [""] * len(headers)
+            rows.setdefault(event.collection, []).append([now.isoformat(), event.op, event.document_id, *values])
+        for collection, batch in rows.items():
+            path = self.directory / f"{collection}-{now.date().isoformat()}.csv"
+            new_file = not path.exists()
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["Exported At", "Op", "_id", *self.COLUMNS[collection][0]])
+                writer.writerows(batch)
+
+
+# ==================== PIPELINE ====================
+
+class ExportPipeline:
+    def __init__(self, db, sinks: list, source: str = "auto", batch_size: int = 500,
+                 interval: float = 2.0, lease_seconds: int = 60, max_backoff: float = 300):
+        self.db = db
+        self.sinks = sinks
+        self.source_mode = source  # "auto", "change_stream" or "poll"
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.max_backoff = max_backoff
+        self.owner = uuid.uuid4().hex
+        self.status: Dict[str, object] = {"running": False, "source": None, "exported": 0, "last_error": None}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def state(self):
+        return self.db[STATE_COLLECTION]
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.state.update_one({"_id": "lease", "owner": self.owner}, {"$set": {"expires_at": None}})
+
+    async def _acquire_lease(self) -> bool:
+        now = _now()
+        try:
+            lease = await self.state.find_one_and_update(
+                {"_id": "lease", "$or": [
+                    {"owner": self.owner},
+                    {"expires_at": None},
+                    {"expires_at": {"$lt": now.isoformat()}},
+                ]},
+                {"$set": {"owner": self.owner, "expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False  # Another worker holds it (the upsert collided with its document)
+        return lease is not None
+
+    async def _run_forever(self):
+        backoff = 1.0
+        while True:
+            try:
+                if await self._acquire_lease():
+                    self.status["running"] = True
+                    await self._run()
+                    backoff = 1.0
+                else:
+                    self.status["running"] = False
+                    await asyncio.sleep(self.lease_seconds / 2)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.status["last_error"] = str(e)
+                logger.warning(f"Export pipeline stopped, restarting in {backoff:.0f}s: {e}")
+            self.status["running"] = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _source(self):
+        """Pick the source and load its saved position"""
+        if self.source_mode in ("auto", "change_stream"):
+            saved = await self.state.find_one({"_id": "change_stream"})
+            source = ChangeStreamSource(self.db, batch_size=self.batch_size, max_wait=self.interval)
+            batches = source.batches(saved.get("resume_token") if saved else None)
+            try:
+                first = await batches.__anext__()
+                return source, batches, first
+            except OperationFailure as e:
+                if self.source_mode == "change_stream" or e.code not in CHANGE_STREAMS_UNSUPPORTED:
+                    raise
+                logger.info("Change streams unavailable (not a replica set); polling updated_at instead")
+        saved = await self.state.find_one({"_id": "poll"})
+        source = PollingSource(self.db, batch_size=self.batch_size, interval=self.interval)
+        batches = source.batches(saved.get("marks") if saved else None)
+        return source, batches, await batches.__anext__()
+
+    async def _run(self):
+        source, batches, first = await self._source()
+        self.status["source"] = source.name
+        pending = [first]
+        while True:
+            events, checkpoint = pending.pop() if pending else await batches.__anext__()
+            if events:
+                if not await self._deliver(events):
+                    logger.warning("Export pipeline lost its lease while retrying a sink; stopping")
+                    return
+                self.status["exported"] += len(events)
+            await self._commit(source.name, checkpoint)
+            if not await self._acquire_lease():
+                logger.warning("Export pipeline lost its lease; stopping")
+                return
+
+    async def _deliver(self, events: List[ChangeEvent]) -> bool:
+        """
+        Hand the batch to every sink, retrying only the sinks that failed.
+        Returns False if the lease was lost meanwhile; the new holder redelivers.
+        """
+        remaining = list(self.sinks)
+        backoff = 1.0
+        while remaining:
+            failed = []
+            for sink in remaining:
+                try:
+                    await sink.write(events)
+                except Exception as e:
+                    self.status["last_error"] = f"{sink.name}: {e}"
+                    logger.warning(f"Export sink {sink.name} failed, retrying in {backoff:.0f}s: {e}")
+                    failed.append(sink)
+            remaining = failed
+            if remaining:
+                # Renewed between sleeps, so a sleep must end well inside the lease
+                await asyncio.sleep(min(backoff, self.lease_seconds / 2))
+                backoff = min(backoff * 2, self.max_backoff)
+                if not await self._acquire_lease():
+                    return False
+        return True
+
+    async def _commit(self, source: str, checkpoint):
+        if source == "change_stream":
+            update = {"resume_token": checkpoint}
+        else:
+            update = {"marks": checkpoint}
+        await self.state.update_one(
+            {"_id": source}, {"$set": {**update, "updated_at": _now().isoformat()}}, upsert=True
+        )
+
+
+def create_export_pipeline(db, export_dir: Path, env: Callable[[str, str], str]) -> Optional[ExportPipeline]:
+    """Build the pipeline from EXPORT_* settings; None when EXPORT_PIPELINE=false"""
+    if env("EXPORT_PIPELINE", "true").lower() == "false":
+        return None
+    sink_names = [name.strip() for name in env("EXPORT_SINKS", "sheets").split(",") if name.strip()]
+    factories = {
+        "sheets": lambda: SheetsSink(),
+        "csv": lambda: CSVSink(export_dir),
+        "ndjson": lambda: NDJSONSink(export_dir),
+    }
+    unknown = [name for name in sink_names if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown EXPORT_SINKS: {', '.join(unknown)}")
+    return ExportPipeline(
+        db,
+        [factories[name]() for name in sink_names],
+        source=env("EXPORT_SOURCE", "auto"),
+        interval=float(env("EXPORT_INTERVAL", "2")),
+    )
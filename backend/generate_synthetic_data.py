@@ -0,0 +1,472 @@
+"""
+Generate production-sized synthetic data for local performance work
+Extends seed_database.py with configurable volumes and a fixed seed, so two
+runs with the same arguments produce identical documents
+
+Usage:
+    python generate_synthetic_data.py --drop
+    python generate_synthetic_data.py --products 500 --orders 20000 --customers 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from daily_stats import STATS_COLLECTION, DailyStats, cost_total
+from db_indexes import ensure_indexes
+from phone_utils import normalize_phone
+
+CATEGORY_NAMES = [
+    "Gaming", "Streaming", "Gift Cards", "Software", "Mobile Top-up", "Game Currency",
+    "Subscriptions", "VPN", "Music", "Productivity", "Education", "Design Tools",
+]
+BRANDS = [
+    "Netflix", "Spotify", "PUBG Mobile", "Free Fire", "Steam", "PlayStation", "Xbox",
+    "Valorant", "YouTube Premium", "Canva", "ChatGPT Plus", "Discord Nitro", "Amazon Prime",
+    "Google Play", "iTunes", "Mobile Legends", "Roblox", "Minecraft", "NordVPN", "Microsoft 365",
+]
+PRODUCT_KINDS = ["Gift Card", "Subscription", "Top-up", "Account", "Voucher", "Pass"]
+FIRST_NAMES = [
+    "Aarav", "Anisha", "Bibek", "Binita", "Dipesh", "Kriti", "Manish", "Nisha", "Prakash",
+    "Pooja", "Rajan", "Sabina", "Sanjay", "Srijana", "Sujan", "Sunita", "Ujjwal", "Yamuna",
+]
+LAST_NAMES = [
+    "Adhikari", "Bhandari", "Gurung", "KC", "Karki", "Lama", "Maharjan", "Poudel",
+    "Rai", "Sharma", "Shrestha", "Tamang", "Thapa", "Yadav",
+]
+PAYMENT_METHODS = ["eSewa", "Khalti", "Fonepay", "Bank Transfer", "Store Credits"]
+USER_AGENTS = [
+    "Mozilla/5.0 (Linux; Android 14; SM-A546E) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 Version/17.5 Mobile Safari/604.1",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/126.0 Safari/537.36",
+]
+
+# Final status -> the path an order took to get there
+STATUS_PATHS = [
+    (0.70, ["pending", "Confirmed", "Processing", "Completed"]),
+    (0.08, ["pending", "Cancelled"]),
+    (0.04, ["pending", "Confirmed", "Cancelled"]),
+    (0.06, ["pending", "Confirmed", "Processing"]),
+    (0.05, ["pending", "Confirmed"]),
+    (0.07, ["pending"]),
+]
+
+REFERRAL_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+REFERRAL_SPACE = 36 ** 8
+REFERRAL_MULTIPLIER = 2_654_435_761  # Coprime with 36^8, so index -> code is one-to-one
+
+COLLECTIONS = [
+    "categories", "products", "customers", "orders", "order_status_history",
+    "credit_logs", "referrals", "wishlists", "visits", STATS_COLLECTION,
+]
+
+
+def rng_for(seed: int, name: str) -> random.Random:
+    # Independent stream per document: changing one volume never reshuffles the rest
+    return random.Random(f"{seed}:{name}")
+
+
+def make_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def iso(dt: datetime) -> str:
+    return dt.isoformat()
+
+
+def skewed_index(rng: random.Random, count: int, power: float = 2.5) -> int:
+    """Popularity skew: low indexes are picked far more often (best sellers, loyal customers)"""
+    return min(count - 1, int(count * rng.random() ** power))
+
+
+def referral_code_for(index: int) -> str:
+    value = (index * REFERRAL_MULTIPLIER) % REFERRAL_SPACE
+    chars = []
+    for _ in range(8):
+        value, digit = divmod(value, 36)
+        chars.append(REFERRAL_ALPHABET[digit])
+    return "".join(chars)
+
+
+def customer_phone(index: int) -> str:
+    # 98XXXXXXXX / 97XXXXXXXX mobile numbers, unique per customer index
+    return f"{98 - (index // 100_000_000) % 2}{index % 100_000_000:08d}"
+
+
+def customer_email(index: int) -> str:
+    return f"customer{index}@example.com"
+
+
+class Generator:
+    def __init__(self, seed: int, end: datetime, days: int, counts: dict):
+        self.seed = seed
+        self.end = end
+        self.start = end - timedelta(days=days)
+        self.days = days
+        self.counts = counts
+        self.category_ids = [make_uuid(rng_for(seed, f"category:{i}")) for i in range(len(CATEGORY_NAMES))]
+        self.product_ids = [make_uuid(rng_for(seed, f"product-id:{i}")) for i in range(counts["products"])]
+        self.customer_ids = [make_uuid(rng_for(seed, f"customer-id:{i}")) for i in range(counts["customers"])]
+        self._products = {}
+
+    def random_time(self, rng: random.Random, after: datetime = None) -> datetime:
+        start = after or self.start
+        span = (self.end - start).total_seconds()
+        return start + timedelta(seconds=rng.random() * max(span, 1))
+
+    def customer_name(self, index: int) -> str:
+        rng = rng_for(self.seed, f"customer-name:{index}")
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    def product(self, index: int) -> dict:
+        # Orders and wishlists look products up constantly; build each one once
+        if index not in self._products:
+            self._products[index] = self._build_product(index)
+        return self._products[index]
+
+    def _build_product(self, index: int) -> dict:
+        rng = rng_for(self.seed, f"product:{index}")
+        brand = rng.choice(BRANDS)
+        name = f"{brand} {rng.choice(PRODUCT_KINDS)} {index}"
+        base_price = rng.choice([99, 199, 299, 499, 999, 1499, 2499])
+        variations = []
+        for tier, multiplier in enumerate([1, 2, 5, 10][:rng.randint(1, 4)]):
+            price = float(base_price * multiplier)
+            variations.append({
+                "id": make_uuid(rng),
+                "name": f"Tier {tier + 1}",
+                "price": price,
+                "original_price": round(price * rng.uniform(1.05, 1.3)),
+                "cost_price": round(price * rng.uniform(0.7, 0.92), 2),
+                "description": None,
+            })
+        return {
+            "id": self.product_ids[index],
+            "name": name,
+            "slug": name.lower().replace(" ", "-"),
+            "description": f"<p>{name}. Instant delivery in Nepal. Pay with eSewa, Khalti or bank transfer.</p>",
+            "image_url": f"https://i.ibb.co/synthetic/{index}.webp",
+            "category_id": self.category_ids[index % len(self.category_ids)],
+            "variations": variations,
+            "tags": [brand.lower(), rng.choice(["instant", "bestseller", "new", "sale"])],
+            "sort_order": index,
+            "custom_fields": [],
+            "is_active": rng.random() < 0.95,
+            "is_sold_out": rng.random() < 0.03,
+            "stock_quantity": None,
+            "flash_sale_end": None,
+            "flash_sale_label": None,
+            "created_at": iso(self.random_time(rng)),
+        }
+
+    def customer(self, index: int) -> dict:
+        rng = rng_for(self.seed, f"customer:{index}")
+        created = self.random_time(rng)
+        phone = customer_phone(index)
+        customer = {
+            "id": self.customer_ids[index],
+            "email": customer_email(index),
+            "name": self.customer_name(index),
+            "phone": phone,
+            "phone_key": normalize_phone(phone),
+            "whatsapp_number": phone if rng.random() < 0.6 else None,
+            "credit_balance": round(rng.choice([0, 0, 0, rng.uniform(5, 500)]), 2),
+            "created_at": iso(created),
+            "last_login": iso(self.random_time(rng, created)),
+        }
+        if rng.random() < 0.3:
+            customer["referral_code"] = referral_code_for(index)
+        return customer
+
+    def order(self, index: int):
+        """Returns the order and its status history entries"""
+        rng = rng_for(self.seed, f"order:{index}")
+        created = self.random_time(rng)
+
+        if self.counts["customers"] and rng.random() < 0.85:
+            customer_index = skewed_index(rng, self.counts["customers"], power=1.8)
+            name = self.customer_name(customer_index)
+            phone = customer_phone(customer_index)
+            email = customer_email(customer_index) if rng.random() < 0.8 else None
+        else:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            phone = f"98{rng.randrange(100_000_000):08d}"
+            email = None
+
+        items = []
+        for _ in range(rng.choices([1, 2, 3], weights=[80, 15, 5])[0]):
+            product = self.product(skewed_index(rng, self.counts["products"]))
+            variation = rng.choice(product["variations"])
+            items.append({
+                "name": product["name"],
+                "price": variation["price"],
+                "quantity": rng.choices([1, 2, 3], weights=[90, 8, 2])[0],
+                "variation": variation["name"],
+                "product_id": product["id"],
+                "variation_id": variation["id"],
+                "cost_price": variation["cost_price"],  # Snapshot at sale, as create_order takes it
+            })
+        total = sum(item["price"] * item["quantity"] for item in items)
+        path = rng.choices([p for _, p in STATUS_PATHS], weights=[w for w, _ in STATUS_PATHS])[0]
+
+        order_id = make_uuid(rng)
+        history = []
+        changed = created
+        for old_status, new_status in zip(path, path[1:]):
+            changed = changed + timedelta(minutes=rng.randint(2, 600))
+            history.append({
+                "id": make_uuid(rng),
+                "order_id": order_id,
+                "old_status": old_status,
+                "new_status": new_status,
+                "note": None,
+                "updated_by": "admin@example.com",
+                "created_at": iso(changed),
+            })
+
+        order = {
+            "id": order_id,
+            "customer_name": name,
+            "customer_phone": "977" + phone,
+            "phone_key": normalize_phone(phone),
+            "customer_email": email,
+            "items": items,
+            "total_amount": total,
+            "total": total,
+            "cost_total": cost_total(items),
+            "remark": None,
+            "items_text": ", ".join(f"{i['quantity']}x {i['name']} ({i['variation']})" for i in items),
+            "status": path[-1],
+            "payment_screenshot": f"https://i.ibb.co/screenshots/{index}.jpg" if len(path) > 1 else None,
+            "payment_method": rng.choice(PAYMENT_METHODS) if len(path) > 1 else None,
+            "credits_used": 0,
+            "created_at": iso(created),
+        }
+        if history:
+            order["updated_at"] = history[-1]["created_at"]
+        return order, history
+
+    def credit_log(self, index: int) -> dict:
+        rng = rng_for(self.seed, f"credit-log:{index}")
+        customer_index = skewed_index(rng, self.counts["customers"], power=1.5)
+        kind, reason, amount = rng.choices([
+            ("cashback", "Cashback for order", round(rng.uniform(5, 250), 2)),
+            ("daily_reward", "Daily login reward", 10.0),
+            ("manual", "Manual adjustment", float(rng.choice([-100, -50, 50, 100]))),
+        ], weights=[60, 35, 5])[0]
+        before = round(rng.uniform(0, 500), 2)
+        return {
+            "id": make_uuid(rng),
+            "customer_id": self.customer_ids[customer_index],
+            "customer_email": customer_email(customer_index),
+            "amount": amount,
+            "reason": reason,
+            "type": kind,
+            "balance_before": before,
+            "balance_after": max(0, round(before + amount, 2)),
+            "created_at": iso(self.random_time(rng)),
+        }
+
+    def referral(self, index: int) -> dict:
+        rng = rng_for(self.seed, f"referral:{index}")
+        referrer = skewed_index(rng, self.counts["customers"], power=3)
+        # Each referee is used once; offset keeps them away from the top referrers
+        referee = (index * 7919 + self.counts["customers"] // 2) % self.counts["customers"]
+        if referee == referrer:
+            referee = (referee + 1) % self.counts["customers"]
+        credited = rng.random() < 0.8
+        return {
+            "id": make_uuid(rng),
+            "referrer_email": customer_email(referrer),
+            "referee_email": customer_email(referee),
+            "referral_code": referral_code_for(referrer),
+            "referee_reward": 25.0,
+            "referrer_reward": 50.0 if credited else 0,
+            "referrer_pending_reward": 0 if credited else 50.0,
+            "referrer_credited": credited,
+            "multiplier_applied": 1.0,
+            "created_at": iso(self.random_time(rng)),
+        }
+
+    def wishlist(self, index: int) -> dict:
+        rng = rng_for(self.seed, f"wishlist:{index}")
+        product = self.product(skewed_index(rng, self.counts["products"]))
+        variation = rng.choice(product["variations"])
+        has_account = self.counts["customers"] and rng.random() < 0.5
+        return {
+            "id": make_uuid(rng),
+            "visitor_id": make_uuid(rng_for(self.seed, f"visitor:{index % max(1, self.counts['wishlists'] // 3)}")),
+            "product_id": product["id"],
+            "variation_id": variation["id"],
+            "email": customer_email(rng.randrange(self.counts["customers"])) if has_account else None,
+            "price_when_added": variation["price"],
+            "created_at": iso(self.random_time(rng)),
+        }
+
+    def visit(self, index: int) -> dict:
+        rng = rng_for(self.seed, f"visit:{index}")
+        pool = max(1, self.counts["visits"] // 20)
+        visitor = index % pool
+        # Step through days with a stride coprime to the window so a visitor never repeats a day
+        day = ((index // pool) * 17 + visitor) % self.days
+        date = (self.start + timedelta(days=day + 1)).date()
+        created = datetime.combine(date, datetime.min.time(), timezone.utc) + timedelta(seconds=rng.randrange(86400))
+        return {
+            "visitor_id": make_uuid(rng_for(self.seed, f"visitor:{visitor}")),
+            "date": date.isoformat(),
+            "user_agent": rng.choice(USER_AGENTS),
+            "created_at": iso(created),
+        }
+
+    def categories(self):
+        return [
+            {"id": self.category_ids[i], "name": name, "slug": name.lower().replace(" ", "-")}
+            for i, name in enumerate(CATEGORY_NAMES)
+        ]
+
+
+def batches(make, count: int, size: int):
+    for start in range(0, count, size):
+        yield [make(i) for i in range(start, min(start + size, count))]
+
+
+class BatchWriter:
+    """Runs insert_many batches with bounded concurrency"""
+
+    def __init__(self, db, concurrency: int):
+        self.db = db
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = set()
+        self.inserted = {}
+
+    async def write(self, collection: str, docs: list):
+        if not docs:
+            return
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._insert(collection, docs))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _insert(self, collection, docs):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+            self.inserted[collection] = self.inserted.get(collection, 0) + len(docs)
+        finally:
+            self.semaphore.release()
+
+    async def flush(self):
+        if self.pending:
+            await asyncio.gather(*self.pending)
+
+
+async def generate(db, generator: Generator, batch_size: int, concurrency: int, drop: bool):
+    counts = generator.counts
+    if drop:
+        for name in COLLECTIONS:
+            await db[name].delete_many({})
+        print("✓ Cleared existing data")
+
+    writer = BatchWriter(db, concurrency)
+    started = time.perf_counter()
+
+    await writer.write("categories", generator.categories())
+    for batch in batches(generator.product, counts["products"], batch_size):
+        await writer.write("products", batch)
+    for batch in batches(generator.customer, counts["customers"], batch_size):
+        await writer.write("customers", batch)
+
+    for start in range(0, counts["orders"], batch_size):
+        orders, history = [], []
+        for i in range(start, min(start + batch_size, counts["orders"])):
+            order, entries = generator.order(i)
+            orders.append(order)
+            history.extend(entries)
+        await writer.write("orders", orders)
+        await writer.write("order_status_history", history)
+        if (start // batch_size) % 10 == 0:
+            print(f"  … orders {start + len(orders):,}/{counts['orders']:,}")
+
+    if counts["customers"]:
+        for name, make in [("credit_logs", generator.credit_log), ("referrals", generator.referral)]:
+            for batch in batches(make, counts[name], batch_size):
+                await writer.write(name, batch)
+    for batch in batches(generator.wishlist, counts["wishlists"], batch_size):
+        await writer.write("wishlists", batch)
+    for batch in batches(generator.visit, counts["visits"], batch_size):
+        await writer.write("visits", batch)
+
+    await writer.flush()
+    elapsed = time.perf_counter() - started
+    for name in COLLECTIONS:
+        if name != STATS_COLLECTION:
+            print(f"✓ {name}: {writer.inserted.get(name, 0):,}")
+    print(f"⏱ Inserted in {elapsed:.1f}s")
+
+    # The dashboards read rollups, which the bulk inserts above bypass
+    days = await DailyStats(db).rebuild()
+    print(f"✓ {STATS_COLLECTION}: rebuilt {days:,} days")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--customers", type=int, default=200_000)
+    parser.add_argument("--orders", type=int, default=500_000)
+    parser.add_argument("--credit-logs", type=int, default=300_000)
+    parser.add_argument("--referrals", type=int, default=20_000)
+    parser.add_argument("--wishlists", type=int, default=100_000)
+    parser.add_argument("--visits", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365, help="History window ending at --end-date")
+    parser.add_argument("--end-date", default=None, help="YYYY-MM-DD (default: today, UTC)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight")
+    parser.add_argument("--drop", action="store_true", help="Clear the generated collections first")
+    parser.add_argument("--skip-indexes", action="store_true")
+    args = parser.parse_args()
+
+    if args.products < 1:
+        parser.error("--products must be at least 1 (orders reference products)")
+    if args.referrals >= args.customers > 0:
+        parser.error("--referrals must be smaller than --customers")
+
+    if args.end_date:
+        end = datetime.strptime(args.end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    else:
+        end = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    counts = {
+        "products": args.products,
+        "customers": args.customers,
+        "orders": args.orders,
+        "credit_logs": args.credit_logs,
+        "referrals": args.referrals,
+        "wishlists": args.wishlists,
+        "visits": args.visits,
+    }
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], maxPoolSize=max(10, args.concurrency * 2))
+    db = client[os.environ['DB_NAME']]
+
+    print(f"🌱 Generating synthetic data (seed={args.seed}, ending {end.date()})...")
+    try:
+        await generate(db, Generator(args.seed, end, args.days, counts), args.batch_size, args.concurrency, args.drop)
+        if not args.skip_indexes:
+            # Built after the load; cheaper than maintaining them during bulk inserts
+            result = await ensure_indexes(db, collections=COLLECTIONS)
+            print(f"✓ Ensured {result['ensured']} indexes")
+    finally:
+        client.close()
+    print("\n✅ Synthetic data generation completed successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
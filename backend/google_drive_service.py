@@ -1,14 +1,26 @@
 """
 Google Drive Service for Payment Screenshots
 Uses service account for simple, admin-controlled storage
+
+The Drive client is built once (static discovery document, credentials read
+once) and shared. httplib2 connections are not thread-safe, so each worker
+thread gets its own authorized Http. Uploads are resumable and sent in
+chunks, each chunk retried with backoff. Public-read grants for uploads
+finishing close together go out as one batch request.
 """
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+from googleapiclient.http import MediaIoBaseUpload
+import google_auth_httplib2
+import httplib2
+import asyncio
 import os
 import io
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Union
 
 logger = logging.getLogger(__name__)
 
@@ -23,70 +35,188 @@ DRIVE_FOLDER_ID = os.getenv('GOOGLE_DRIVE_FOLDER_ID', None)
 # Scopes
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Resumable chunk size; Drive requires a multiple of 256 KiB
+CHUNK_SIZE = int(os.getenv('GOOGLE_DRIVE_CHUNK_SIZE', str(1024 * 1024)))
+NUM_RETRIES = int(os.getenv('GOOGLE_DRIVE_RETRIES', '5'))
+WORKERS = int(os.getenv('GOOGLE_DRIVE_WORKERS', '4'))
+HTTP_TIMEOUT = 60
+
+# Seconds to gather permission grants into one batch request (max 100 per batch)
+PERMISSION_WINDOW = 0.2
+MAX_BATCH = 100
+
+PUBLIC_READ = {'type': 'anyone', 'role': 'reader'}
+
+
+def _default_http_factory() -> Callable[[], httplib2.Http]:
+    credentials = service_account.Credentials.from_service_account_file(
+        str(SERVICE_ACCOUNT_FILE),
+        scopes=SCOPES
+    )
+    return lambda: google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+
+
+class DriveClient:
+    """Shared Drive client; blocking calls run in a bounded thread pool"""
+
+    def __init__(self, http_factory: Optional[Callable[[], httplib2.Http]] = None, folder_id: Optional[str] = DRIVE_FOLDER_ID,
+                 workers: int = WORKERS, chunk_size: int = CHUNK_SIZE, num_retries: int = NUM_RETRIES,
+                 permission_window: float = PERMISSION_WINDOW):
+        self._http_factory = http_factory
+        self.folder_id = folder_id
+        self.chunk_size = chunk_size
+        self.num_retries = num_retries
+        self.permission_window = permission_window
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive")
+        self._service = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._grants: Dict[str, asyncio.Future] = {}
+        self._grant_task: Optional[asyncio.Task] = None
+
+    # ---- Blocking helpers (worker threads) ----
+
+    def http(self) -> httplib2.Http:
+        """This thread's authorized Http"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = self._get_http_factory()()
+        return http
+
+    def _get_http_factory(self):
+        with self._lock:
+            if self._http_factory is None:
+                self._http_factory = _default_http_factory()
+            return self._http_factory
+
+    def service(self):
+        """Build the Drive API object once; requests are executed with a per-thread Http"""
+        if self._service is None:
+            http = self.http()
+            with self._lock:
+                if self._service is None:
+                    self._service = build('drive', 'v3', http=http, cache_discovery=False, static_discovery=True)
+        return self._service
+
+    def upload_sync(self, file: BinaryIO, filename: str, mime_type: str) -> dict:
+        service = self.service()
+        media = MediaIoBaseUpload(file, mimetype=mime_type, chunksize=self.chunk_size, resumable=True)
+        request = service.files().create(
+            body={'name': filename, 'parents': [self.folder_id] if self.folder_id else []},
+            media_body=media,
+            fields='id, webViewLink, webContentLink'
+        )
+        response = None
+        while response is None:
+            # Retries 5xx/429/connection errors with backoff and resumes from the last confirmed byte
+            _, response = request.next_chunk(http=self.http(), num_retries=self.num_retries)
+        return response
+
+    def grant_public_read_sync(self, file_ids: List[str]) -> Dict[str, Optional[Exception]]:
+        """Make files publicly readable in batch requests; returns file_id -> error (None on success)"""
+        service = self.service()
+        results: Dict[str, Optional[Exception]] = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = exception
+
+        for start in range(0, len(file_ids), MAX_BATCH):
+            batch = service.new_batch_http_request(callback=callback)
+            for file_id in file_ids[start:start + MAX_BATCH]:
+                batch.add(service.permissions().create(fileId=file_id, body=PUBLIC_READ, fields='id'), request_id=file_id)
+            batch.execute(http=self.http())
+        return results
+
+    # ---- Async API ----
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def upload(self, content: Union[bytes, BinaryIO], filename: str, mime_type: str = 'image/jpeg',
+                     public: bool = True) -> dict:
+        file = io.BytesIO(content) if isinstance(content, bytes) else content
+        uploaded = await self.run(self.upload_sync, file, filename, mime_type)
+        if public:
+            await self._grant_public_read(uploaded['id'])
+        return uploaded
+
+    async def _grant_public_read(self, file_id: str):
+        future = asyncio.get_running_loop().create_future()
+        self._grants[file_id] = future
+        if self._grant_task is None or self._grant_task.done():
+            self._grant_task = asyncio.create_task(self._flush_grants())
+        await future
+
+    async def _flush_grants(self):
+        # Grants queued while a batch is in flight go out in the next one
+        while self._grants:
+            await asyncio.sleep(self.permission_window)
+            pending, self._grants = self._grants, {}
+            try:
+                results = await self.run(self.grant_public_read_sync, list(pending))
+            except Exception as e:
+                results = {file_id: e for file_id in pending}
+            for file_id, future in pending.items():
+                error = results.get(file_id, RuntimeError("No batch response"))
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+drive = DriveClient()
+
+
 def get_drive_service():
-    """Get Google Drive service using service account"""
+    """Get the shared Google Drive service (built once)"""
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            str(SERVICE_ACCOUNT_FILE),
-            scopes=SCOPES
-        )
-        service = build('drive', 'v3', credentials=credentials)
-        return service
+        return drive.service()
     except Exception as e:
         logger.error(f"Failed to create Drive service: {str(e)}")
         raise
 
+
+def _links(file_id: str, file: dict) -> dict:
+    return {
+        'file_id': file_id,
+        'view_link': f"https://drive.google.com/uc?id={file_id}&export=view",
+        'web_view_link': file.get('webViewLink'),
+        'download_link': file.get('webContentLink')
+    }
+
+
+async def upload_payment_screenshot_async(content: Union[bytes, BinaryIO], filename: str, mime_type: str = 'image/jpeg'):
+    """
+    Upload payment screenshot to Google Drive without blocking the event loop
+    Returns public shareable link
+    """
+    try:
+        file = await drive.upload(content, filename, mime_type)
+        logger.info(f"Uploaded payment screenshot to Drive: {filename} (ID: {file['id']})")
+        return _links(file['id'], file)
+    except Exception as e:
+        logger.error(f"Failed to upload to Drive: {str(e)}")
+        raise Exception(f"Drive upload failed: {str(e)}")
+
+
 def upload_payment_screenshot(file_content: bytes, filename: str, mime_type: str = 'image/jpeg'):
     """
-    Upload payment screenshot to Google Drive
+    Upload payment screenshot to Google Drive (blocking, for scripts)
     Returns public shareable link
     """
     try:
-        service = get_drive_service()
-        
-        # Prepare file metadata
-        file_metadata = {
-            'name': filename,
-            'parents': [DRIVE_FOLDER_ID] if DRIVE_FOLDER_ID else []
-        }
-        
-        # Upload file
-        media = MediaIoBaseUpload(
-            io.BytesIO(file_content),
-            mimetype=mime_type,
-            resumable=True
-        )
-        
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id, webViewLink, webContentLink'
-        ).execute()
-        
+        file = drive.upload_sync(io.BytesIO(file_content), filename, mime_type)
         file_id = file.get('id')
-        
-        # Make file publicly viewable
-        permission = {
-            'type': 'anyone',
-            'role': 'reader'
-        }
-        service.permissions().create(
-            fileId=file_id,
-            body=permission
-        ).execute()
-        
-        # Get direct view link
-        view_link = f"https://drive.google.com/uc?id={file_id}&export=view"
-        
+        error = drive.grant_public_read_sync([file_id]).get(file_id)
+        if error:
+            raise error
         logger.info(f"Uploaded payment screenshot to Drive: {filename} (ID: {file_id})")
-        
-        return {
-            'file_id': file_id,
-            'view_link': view_link,
-            'web_view_link': file.get('webViewLink'),
-            'download_link': file.get('webContentLink')
-        }
-    
+        return _links(file_id, file)
     except Exception as e:
         logger.error(f"Failed to upload to Drive: {str(e)}")
         raise Exception(f"Drive upload failed: {str(e)}")
@@ -95,7 +225,7 @@ def delete_payment_screenshot(file_id: str):
     """Delete file from Google Drive"""
     try:
         service = get_drive_service()
-        service.files().delete(fileId=file_id).execute()
+        service.files().delete(fileId=file_id).execute(http=drive.http(), num_retries=NUM_RETRIES)
         logger.info(f"Deleted file from Drive: {file_id}")
         return True
     except Exception as e:
@@ -109,7 +239,7 @@ def get_file_info(file_id: str):
         file = service.files().get(
             fileId=file_id,
             fields='id, name, mimeType, size, createdTime, webViewLink'
-        ).execute()
+        ).execute(http=drive.http(), num_retries=NUM_RETRIES)
         return file
     except Exception as e:
         logger.error(f"Failed to get file info: {str(e)}")
@@ -119,21 +249,22 @@ def create_folder_if_not_exists(folder_name: str = "Payment Screenshots"):
     """Create a folder in Google Drive and return its ID"""
     try:
         service = get_drive_service()
-        
+        http = drive.http()
+
         # Check if folder already exists
         query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
         results = service.files().list(
             q=query,
             spaces='drive',
             fields='files(id, name)'
-        ).execute()
-        
+        ).execute(http=http, num_retries=NUM_RETRIES)
+
         folders = results.get('files', [])
         if folders:
             folder_id = folders[0]['id']
             logger.info(f"Found existing folder: {folder_name} (ID: {folder_id})")
             return folder_id
-        
+
         # Create new folder
         file_metadata = {
             'name': folder_name,
@@ -142,13 +273,13 @@ def create_folder_if_not_exists(folder_name: str = "Payment Screenshots"):
         folder = service.files().create(
             body=file_metadata,
             fields='id'
-        ).execute()
-        
+        ).execute(http=http, num_retries=NUM_RETRIES)
+
         folder_id = folder.get('id')
         logger.info(f"Created new folder: {folder_name} (ID: {folder_id})")
-        
+
         return folder_id
-    
+
     except Exception as e:
         logger.error(f"Failed to create folder: {str(e)}")
         raise
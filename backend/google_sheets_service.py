@@ -4,9 +4,14 @@ Uses Service Account authentication via environment variable
 """
 import gspread
 from google.oauth2.service_account import Credentials
+import asyncio
 import logging
 import os
 import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -60,109 +65,317 @@ def get_or_create_worksheet(spreadsheet, sheet_name, headers):
         logger.info(f"Created new worksheet: {sheet_name}")
     return worksheet
 
-def sync_customer_to_sheets(customer: dict):
-    """Sync customer data to Google Sheets"""
-    try:
-        client = get_sheets_client()
-        if not client:
-            logger.warning("Google Sheets client not available, skipping sync")
-            return False
-        
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        
-        # Define headers for Customers sheet
-        headers = ["ID", "Email", "Name", "Phone", "WhatsApp", "Created At", "Last Login", "Total Orders", "Total Spent"]
-        worksheet = get_or_create_worksheet(spreadsheet, CUSTOMERS_SHEET, headers)
-        
-        # Check if customer already exists (by email)
+CUSTOMER_HEADERS = ["ID", "Email", "Name", "Phone", "WhatsApp", "Created At", "Last Login", "Total Orders", "Total Spent"]
+ORDER_HEADERS = ["Order ID", "Customer Name", "Customer Phone", "Customer Email", "Items", "Total Amount", "Status", "Payment Method", "Created At", "Notes"]
+
+# Seconds to collect writes before flushing them as one batch
+FLUSH_WINDOW = float(os.environ.get("SHEETS_FLUSH_WINDOW", "2"))
+# Re-read the key column this often, in case rows were edited by hand
+INDEX_TTL = 300
+MAX_ATTEMPTS = 3
+# Rows per batch_update / append_rows request during a full resync
+RESYNC_CHUNK_ROWS = 500
+
+
+def customer_row(customer: dict) -> list:
+    return [
+        customer.get("id", ""),
+        customer.get("email", ""),
+        customer.get("name", ""),
+        customer.get("phone", ""),
+        customer.get("whatsapp_number", ""),
+        customer.get("created_at", ""),
+        customer.get("last_login", ""),
+        customer.get("total_orders", 0),
+        customer.get("total_spent", 0)
+    ]
+
+
+def order_row(order: dict) -> list:
+    return [
+        order.get("id", ""),
+        order.get("customer_name", ""),
+        order.get("customer_phone", ""),
+        order.get("customer_email", ""),
+        order.get("items_text", ""),
+        order.get("total_amount", 0),
+        order.get("status", "pending"),
+        order.get("payment_method", ""),
+        order.get("created_at", ""),
+        order.get("remark", "")
+    ]
+
+
+_APPENDED_RANGE = re.compile(r"![A-Z]+(\d+)")
+
+
+class SheetsUnavailable(Exception):
+    """No credentials configured; queued rows are dropped like the old per-record sync did"""
+
+
+@dataclass
+class SheetTable:
+    """A worksheet keyed by one column, with a cached key -> row number index"""
+    title: str
+    headers: List[str]
+    key_column: int  # 1-based
+    worksheet: object = None
+    index: Dict[str, int] = field(default_factory=dict)
+    index_loaded_at: float = 0.0
+
+    @property
+    def last_column(self) -> str:
+        return gspread.utils.rowcol_to_a1(1, len(self.headers)).rstrip("1")
+
+
+def cell_value(value) -> str:
+    """Normalise a cell for comparison; Sheets returns 100.0 as 100 and None as ''"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def diff_rows(table: SheetTable, sheet_values: List[list], rows: Dict[str, list]) -> Tuple[List[Tuple[int, list]], List[list], int]:
+    """
+    Compare the sheet (all values, header first) with the desired rows by key.
+    Returns (changed rows as (row number, row), rows to append, unchanged count).
+    Sheet rows with no matching record are left alone.
+    """
+    width = len(table.headers)
+    existing: Dict[str, Tuple[int, List[str]]] = {}
+    for row_number, values in enumerate(sheet_values[1:], start=2):
+        key = cell_value(values[table.key_column - 1]) if len(values) >= table.key_column else ""
+        if key and key not in existing:
+            padded = [cell_value(v) for v in values[:width]]
+            existing[key] = (row_number, padded + [""] * (width - len(padded)))
+
+    changed, appends, unchanged = [], [], 0
+    for key, row in rows.items():
+        if key in existing:
+            row_number, current = existing[key]
+            if [cell_value(v) for v in row] == current:
+                unchanged += 1
+            else:
+                changed.append((row_number, row))
+        else:
+            appends.append(row)
+    return sorted(changed, key=lambda item: item[0]), appends, unchanged
+
+
+def range_updates(table: SheetTable, changed: List[Tuple[int, list]]) -> List[dict]:
+    """Merge consecutive changed rows into one range each"""
+    updates = []
+    for row_number, row in changed:
+        last = updates[-1] if updates else None
+        if last and last["end"] == row_number - 1:
+            last["values"].append(row)
+            last["end"] = row_number
+        else:
+            updates.append({"start": row_number, "end": row_number, "values": [row]})
+    return [
+        {"range": f"A{u['start']}:{table.last_column}{u['end']}", "values": u["values"]}
+        for u in updates
+    ]
+
+
+class SheetsWriter:
+    """
+    Coalesces customer/order writes and applies them off the event loop
+    
+    enqueue() only records the latest row per key. After FLUSH_WINDOW a single
+    thread-executor job sends one batch_update for rows already in the sheet
+    and one append_rows for new ones, using the cached row index instead of a
+    find() per record. Spreadsheet and worksheet handles are opened once.
+    """
+    
+    def __init__(self, client_factory: Callable = None, spreadsheet_id: str = SPREADSHEET_ID, window: float = FLUSH_WINDOW):
+        self.client_factory = client_factory or get_sheets_client
+        self.spreadsheet_id = spreadsheet_id
+        self.window = window
+        self.tables = {
+            "customers": SheetTable(CUSTOMERS_SHEET, CUSTOMER_HEADERS, key_column=2),
+            "orders": SheetTable(ORDERS_SHEET, ORDER_HEADERS, key_column=1),
+        }
+        self._spreadsheet = None
+        self._pending: Dict[str, Dict[str, list]] = {name: {} for name in self.tables}
+        self._attempts = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+    
+    def enqueue(self, table: str, key: str, row: list):
+        if not key:
+            return
+        self._pending[table][key] = row
         try:
-            cell = worksheet.find(customer.get("email", ""), in_column=2)
-            row_num = cell.row
-            # Update existing row
-            worksheet.update(f"A{row_num}:I{row_num}", [[
-                customer.get("id", ""),
-                customer.get("email", ""),
-                customer.get("name", ""),
-                customer.get("phone", ""),
-                customer.get("whatsapp_number", ""),
-                customer.get("created_at", ""),
-                customer.get("last_login", ""),
-                customer.get("total_orders", 0),
-                customer.get("total_spent", 0)
-            ]])
-            logger.info(f"Updated customer in sheets: {customer.get('email')}")
-        except gspread.exceptions.CellNotFound:
-            # Add new row
-            worksheet.append_row([
-                customer.get("id", ""),
-                customer.get("email", ""),
-                customer.get("name", ""),
-                customer.get("phone", ""),
-                customer.get("whatsapp_number", ""),
-                customer.get("created_at", ""),
-                customer.get("last_login", ""),
-                customer.get("total_orders", 0),
-                customer.get("total_spent", 0)
-            ])
-            logger.info(f"Added new customer to sheets: {customer.get('email')}")
-        
-        return True
-    except Exception as e:
-        logger.error(f"Failed to sync customer to sheets: {e}")
-        return False
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from a script; write straight away
+            try:
+                self._write(self._take_pending())
+            except SheetsUnavailable:
+                pass
+            except Exception as e:
+                logger.error(f"Failed to sync {table} to sheets: {e}")
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        # Writes queued (or requeued) from here on schedule their own flush
+        self._flush_task = None
+        await self.flush()
+    
+    def _take_pending(self) -> Dict[str, Dict[str, list]]:
+        pending, self._pending = self._pending, {name: {} for name in self.tables}
+        return pending
+    
+    async def flush(self, raise_errors: bool = False):
+        """
+        Write everything queued so far; also called on shutdown and by bulk syncs.
+        With raise_errors the rows are requeued and the error re-raised, leaving
+        retries to the caller (the export pipeline backs off).
+        """
+        async with self._lock:
+            pending = self._take_pending()
+            if not any(pending.values()):
+                return
+            try:
+                await asyncio.to_thread(self._write, pending)
+                self._attempts = 0
+            except SheetsUnavailable:
+                logger.warning("Google Sheets client not available, skipping sync")
+            except Exception as e:
+                # Row numbers may be stale after an error; rebuild handles and indexes next time
+                self._reset()
+                if raise_errors:
+                    self._requeue(pending)
+                    raise
+                self._attempts += 1
+                if self._attempts < MAX_ATTEMPTS:
+                    logger.warning(f"Google Sheets flush failed (attempt {self._attempts}), retrying: {e}")
+                    self._requeue(pending)
+                    if self._flush_task is None or self._flush_task.done():
+                        self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+                else:
+                    logger.error(f"Google Sheets flush failed {self._attempts} times, dropping batch: {e}")
+                    self._attempts = 0
+    
+    def _requeue(self, pending: Dict[str, Dict[str, list]]):
+        for table, rows in pending.items():
+            for key, row in rows.items():
+                self._pending[table].setdefault(key, row)  # Keep newer writes
+    
+    def _reset(self):
+        self._spreadsheet = None
+        for table in self.tables.values():
+            table.worksheet = None
+            table.index = {}
+            table.index_loaded_at = 0.0
+    
+    def _open(self, table: SheetTable):
+        if table.worksheet is None:
+            if self._spreadsheet is None:
+                client = self.client_factory()
+                if not client:
+                    raise SheetsUnavailable()
+                self._spreadsheet = client.open_by_key(self.spreadsheet_id)
+            table.worksheet = get_or_create_worksheet(self._spreadsheet, table.title, table.headers)
+        return table.worksheet
+    
+    def _worksheet(self, table: SheetTable):
+        """Worksheet handle with a fresh enough key -> row index"""
+        self._open(table)
+        if time.monotonic() - table.index_loaded_at > INDEX_TTL:
+            keys = table.worksheet.col_values(table.key_column)
+            table.index = {}
+            for row_number, key in enumerate(keys, start=1):
+                if row_number > 1 and key:
+                    table.index.setdefault(str(key), row_number)  # First match, like find()
+            table.index_loaded_at = time.monotonic()
+        return table.worksheet
+    
+    async def resync(self, name: str, rows: Dict[str, list], progress: Callable[[dict], Awaitable] = None) -> dict:
+        """
+        Full resync of one sheet: read it once, diff against rows (key -> row)
+        in memory, and write only changed ranges and new rows in chunks.
+        Incremental flushes wait until it finishes.
+        """
+        table = self.tables[name]
+        stats = {"total": len(rows), "updated": 0, "added": 0, "unchanged": 0, "phase": "reading"}
+
+        async def report(**changes):
+            stats.update(changes)
+            if progress:
+                await progress(dict(stats))
+
+        async with self._lock:
+            await report()
+            try:
+                worksheet = await asyncio.to_thread(self._open, table)
+                sheet_values = await asyncio.to_thread(
+                    worksheet.get_all_values, value_render_option=gspread.utils.ValueRenderOption.unformatted
+                )
+                changed, appends, unchanged = await asyncio.to_thread(diff_rows, table, sheet_values, rows)
+                await report(phase="writing", unchanged=unchanged, to_update=len(changed), to_add=len(appends))
+
+                for start in range(0, len(changed), RESYNC_CHUNK_ROWS):
+                    chunk = changed[start:start + RESYNC_CHUNK_ROWS]
+                    await asyncio.to_thread(worksheet.batch_update, range_updates(table, chunk))
+                    await report(updated=stats["updated"] + len(chunk))
+                for start in range(0, len(appends), RESYNC_CHUNK_ROWS):
+                    chunk = appends[start:start + RESYNC_CHUNK_ROWS]
+                    await asyncio.to_thread(worksheet.append_rows, chunk)
+                    await report(added=stats["added"] + len(chunk))
+            finally:
+                table.index_loaded_at = 0.0  # Rows moved; rebuild the index on the next flush
+        await report(phase="done")
+        return stats
+
+    def _write(self, pending: Dict[str, Dict[str, list]]):
+        """Runs in a worker thread: at most one batch_update and one append_rows per sheet"""
+        for name, rows in pending.items():
+            if not rows:
+                continue
+            table = self.tables[name]
+            worksheet = self._worksheet(table)
+            
+            updates = [
+                {"range": f"A{table.index[key]}:{table.last_column}{table.index[key]}", "values": [row]}
+                for key, row in rows.items() if key in table.index
+            ]
+            new_keys = [key for key in rows if key not in table.index]
+            if updates:
+                worksheet.batch_update(updates)
+            if new_keys:
+                result = worksheet.append_rows([rows[key] for key in new_keys])
+                match = _APPENDED_RANGE.search(result.get("updates", {}).get("updatedRange", ""))
+                if match:
+                    first_row = int(match.group(1))
+                    for offset, key in enumerate(new_keys):
+                        table.index[key] = first_row + offset
+                else:
+                    table.index_loaded_at = 0.0  # Unknown positions; re-read the column next flush
+            logger.info(f"Synced {name} to sheets: {len(updates)} updated, {len(new_keys)} added")
+
+
+sheets_writer = SheetsWriter()
+
+
+def sync_customer_to_sheets(customer: dict):
+    """Queue a customer row for the next batched Sheets write"""
+    sheets_writer.enqueue("customers", customer.get("email", ""), customer_row(customer))
+    return True
+
 
 def sync_order_to_sheets(order: dict):
-    """Sync order data to Google Sheets"""
-    try:
-        client = get_sheets_client()
-        if not client:
-            logger.warning("Google Sheets client not available, skipping sync")
-            return False
-        
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        
-        # Define headers for Orders sheet
-        headers = ["Order ID", "Customer Name", "Customer Phone", "Customer Email", "Items", "Total Amount", "Status", "Payment Method", "Created At", "Notes"]
-        worksheet = get_or_create_worksheet(spreadsheet, ORDERS_SHEET, headers)
-        
-        # Check if order already exists
-        try:
-            cell = worksheet.find(order.get("id", ""), in_column=1)
-            row_num = cell.row
-            # Update existing row
-            worksheet.update(f"A{row_num}:J{row_num}", [[
-                order.get("id", ""),
-                order.get("customer_name", ""),
-                order.get("customer_phone", ""),
-                order.get("customer_email", ""),
-                order.get("items_text", ""),
-                order.get("total_amount", 0),
-                order.get("status", "pending"),
-                order.get("payment_method", ""),
-                order.get("created_at", ""),
-                order.get("remark", "")
-            ]])
-            logger.info(f"Updated order in sheets: {order.get('id')}")
-        except gspread.exceptions.CellNotFound:
-            # Add new row
-            worksheet.append_row([
-                order.get("id", ""),
-                order.get("customer_name", ""),
-                order.get("customer_phone", ""),
-                order.get("customer_email", ""),
-                order.get("items_text", ""),
-                order.get("total_amount", 0),
-                order.get("status", "pending"),
-                order.get("payment_method", ""),
-                order.get("created_at", ""),
-                order.get("remark", "")
-            ])
-            logger.info(f"Added new order to sheets: {order.get('id')}")
-        
-        return True
-    except Exception as e:
-        logger.error(f"Failed to sync order to sheets: {e}")
-        return False
+    """Queue an order row for the next batched Sheets write"""
+    sheets_writer.enqueue("orders", order.get("id", ""), order_row(order))
+    return True
 
 def get_all_customers_from_sheets():
     """Get all customers from Google Sheets"""
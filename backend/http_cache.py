@@ -0,0 +1,102 @@
+"""
+HTTP Caching
+Conditional GET support for public read endpoints
+
+Each cached route depends on one or more resources in the VersionStore. The
+ETag is built from their version tokens, so If-None-Match is answered with a
+304 straight from memory without running the handler or querying MongoDB.
+"""
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import List, Optional, Tuple
+
+from resource_versions import VersionStore
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    resources: Tuple[str, ...]  # Version keys the response is built from
+    max_age: int = 0
+    stale_while_revalidate: int = 0
+
+    @property
+    def cache_control(self) -> str:
+        if self.max_age == 0 and self.stale_while_revalidate == 0:
+            # Always revalidate; with an ETag that is a cheap 304
+            return "public, no-cache"
+        value = f"public, max-age={self.max_age}"
+        if self.stale_while_revalidate:
+            value += f", stale-while-revalidate={self.stale_while_revalidate}"
+        return value
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2); the compression middleware may re-encode the body
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+class HTTPCacheMiddleware:
+    """
+    policies: [(path glob, CachePolicy or None)], first match wins; None
+    excludes a path a broader glob would catch. Requests carrying an
+    Authorization header are never cached, so admin views stay fresh.
+    """
+
+    def __init__(self, app, store: VersionStore, policies: List[Tuple[str, Optional[CachePolicy]]]):
+        self.app = app
+        self.store = store
+        self.policies = policies
+
+    def policy_for(self, path: str) -> Optional[CachePolicy]:
+        for pattern, policy in self.policies:
+            if fnmatch(path, pattern):
+                return policy
+        return None
+
+    def etag_for(self, policy: CachePolicy) -> Optional[str]:
+        versions = [self.store.get(resource) for resource in policy.resources]
+        if not all(versions):
+            return None
+        return f'W/"{".".join(versions)}"'
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policy_for(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        etag = self.etag_for(policy)
+        if etag is None or b"authorization" in headers:
+            await self.app(scope, receive, send)
+            return
+
+        cache_headers = [
+            (b"etag", etag.encode("latin-1")),
+            (b"cache-control", policy.cache_control.encode("latin-1")),
+        ]
+
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match and etag_matches(if_none_match.decode("latin-1"), etag):
+            await send({"type": "http.response.start", "status": 304, "headers": cache_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cache_headers(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                existing = {name for name, _ in message.get("headers", [])}
+                message["headers"] = list(message.get("headers", [])) + [
+                    header for header in cache_headers if header[0] not in existing
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
@@ -0,0 +1,230 @@
+"""
+Image Pipeline
+Turns an uploaded image into resized WebP/AVIF variants plus a blurhash placeholder
+
+Files are named by the SHA-256 of the upload, so uploading the same image
+again reuses the stored variants. Decoding and encoding run in a small
+thread pool. The result is a manifest that the storefront turns into
+<picture>/srcset markup:
+
+    {"hash", "width", "height", "url", "blurhash",
+     "sources": [{"type": "image/avif", "srcset": "... 320w, ... 640w"}, ...],
+     "variants": [{"url", "type", "width", "height", "bytes"}, ...]}
+"""
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+WIDTHS = tuple(int(w) for w in os.environ.get("IMAGE_WIDTHS", "320,640,960,1280").split(","))
+MAX_UPLOAD_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+# Larger images are refused before decoding. Pillow itself only raises at
+# twice MAX_IMAGE_PIXELS (and warns below that), so _open checks the header size.
+MAX_PIXELS = 40_000_000
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+# Most capable format first; AVIF only when this Pillow build can encode it
+OUTPUT_FORMATS: List[Tuple[str, str, str, dict]] = [
+    (name, mime, ext, options)
+    for name, mime, ext, options, feature in [
+        ("AVIF", "image/avif", "avif", {"quality": 50, "speed": 8}, "avif"),
+        ("WEBP", "image/webp", "webp", {"quality": 80, "method": 4}, "webp"),
+    ]
+    if features.check(feature)
+]
+
+INPUT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    thread_name_prefix="image",
+)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def run_in_pool(fn, *args) -> asyncio.Future:
+    """Schedule blocking image work on the shared image thread pool"""
+    return asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+# ==================== BLURHASH ====================
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def blurhash(image: Image.Image, x_components: int = 4, y_components: int = 3) -> str:
+    """Encode a blurhash (https://blurha.sh) from a 32px thumbnail"""
+    thumb = image.convert("RGB")
+    thumb.thumbnail((32, 32))
+    width, height = thumb.size
+    pixels = [tuple(_to_linear(c) for c in pixel) for pixel in thumb.get_flattened_data()]
+
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for f in ac for c in f) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _base83(0, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+    for f in ac:
+        r, g, b = (max(0, min(18, int(_sign_pow(c / max_value, 0.5) * 9 + 9.5))) for c in f)
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+# ==================== PROCESSING ====================
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _atomic_write(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _open(data: bytes) -> Image.Image:
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise InvalidImage(f"Image too large: {image.width}x{image.height} pixels")
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f"Could not read image: {e}")
+    if image.format not in INPUT_EXTENSIONS:
+        raise InvalidImage(f"Unsupported image format: {image.format}")
+    return image
+
+
+def _variant_widths(width: int) -> List[int]:
+    """Configured widths below the original, plus the original when it is smaller than the largest"""
+    widths = [w for w in WIDTHS if w < width]
+    if width <= max(WIDTHS) and width not in widths:
+        widths.append(width)
+    return widths
+
+
+def process_image(data: bytes, directory: Path, url_prefix: str) -> dict:
+    """Blocking: write the original, variants and manifest for `data`; reuses an existing manifest"""
+    digest = content_hash(data)
+    manifest_path = directory / f"{digest}.json"
+    if manifest_path.exists():
+        return json.loads(manifest_path.read_bytes())
+
+    image = _open(data)
+    extension = INPUT_EXTENSIONS[image.format]
+    animated = getattr(image, "is_animated", False)
+    _atomic_write(directory / f"{digest}.{extension}", data)
+
+    image = ImageOps.exif_transpose(image)  # Phone photos carry rotation in EXIF only
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    width, height = image.size
+
+    manifest = {
+        "hash": digest,
+        "width": width,
+        "height": height,
+        "url": f"{url_prefix}/{digest}.{extension}",
+        "blurhash": blurhash(image),
+        "sources": [],
+        "variants": [],
+    }
+    # Animated GIFs keep their original only; resizing would drop the animation
+    if not animated:
+        for name, mime, ext, options in OUTPUT_FORMATS:
+            srcset = []
+            for target in _variant_widths(width):
+                resized = image if target == width else image.resize(
+                    (target, max(1, round(height * target / width))), Image.LANCZOS
+                )
+                buffer = io.BytesIO()
+                resized.save(buffer, name, **options)
+                filename = f"{digest}-{target}.{ext}"
+                _atomic_write(directory / filename, buffer.getvalue())
+                url = f"{url_prefix}/{filename}"
+                manifest["variants"].append({
+                    "url": url, "type": mime, "width": target,
+                    "height": resized.height, "bytes": buffer.tell(),
+                })
+                srcset.append(f"{url} {target}w")
+            manifest["sources"].append({"type": mime, "srcset": ", ".join(srcset)})
+
+    # Manifest last: its presence means every file above is complete
+    _atomic_write(manifest_path, json.dumps(manifest).encode())
+    return manifest
+
+
+class ImagePipeline:
+    """Runs process_image off the event loop; concurrent uploads of the same bytes share one job"""
+
+    def __init__(self, directory: Path, url_prefix: str = "/api/uploads"):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def process(self, data: bytes) -> dict:
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise InvalidImage(f"Image larger than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+        digest = content_hash(data)
+        future = self._inflight.get(digest)
+        if future is None:
+            future = run_in_pool(process_image, data, self.directory, self.url_prefix)
+            self._inflight[digest] = future
+            future.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        return await asyncio.shield(future)
+
+    def manifest(self, digest: str) -> Optional[dict]:
+        path = self.directory / f"{digest}.json"
+        return json.loads(path.read_bytes()) if path.exists() else None
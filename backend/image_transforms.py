@@ -0,0 +1,236 @@
+"""
+Image Transforms
+Resized/re-encoded copies of uploads, made on first request and kept in a disk LRU
+
+/api/uploads/{filename}?width=480&format=webp&quality=70 renders once; the
+result is stored under a key made from the source's content hash and the
+parameters, so a changed source never serves a stale copy. The cache
+directory is capped at IMAGE_CACHE_MAX_BYTES, evicting least recently used
+files. Concurrent identical requests wait for a single render.
+
+The endpoint is public, so width snaps up to one of IMAGE_WIDTHS and quality
+to the nearest preset: a client walking the parameters can cause at most a
+handful of renders per image and format.
+
+Each worker process tracks recency for the files it has seen; a file
+evicted by another worker is simply rendered again.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from image_pipeline import OUTPUT_FORMATS, WIDTHS, run_in_pool
+from upload_files import HASHED_NAME, FileInfo
+
+MIN_WIDTH, MAX_WIDTH = 16, 2560
+QUALITY_PRESETS = (50, 65, 80, 90)
+
+# format -> (Pillow name, mime, extension, default quality, save options)
+FORMATS: Dict[str, Tuple[str, str, str, int, dict]] = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg", 80, {"optimize": True, "progressive": True}),
+    "png": ("PNG", "image/png", "png", 0, {"optimize": True}),
+    "webp": ("WEBP", "image/webp", "webp", 80, {"method": 4}),
+}
+if any(name == "AVIF" for name, *_ in OUTPUT_FORMATS):
+    FORMATS["avif"] = ("AVIF", "image/avif", "avif", 50, {"speed": 8})
+
+
+class InvalidTransform(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TransformParams:
+    width: Optional[int]
+    format: str
+    quality: int
+    auto: bool = False  # Format picked from Accept; the response must Vary on it
+
+
+def parse_params(width: Optional[int], format: Optional[str], quality: Optional[int], accept: str = "") -> Optional[TransformParams]:
+    """None when no transform was asked for; format=auto picks AVIF/WebP from the Accept header"""
+    if width is None and format is None and quality is None:
+        return None
+    if width is not None:
+        if not MIN_WIDTH <= width <= MAX_WIDTH:
+            raise InvalidTransform(f"width must be between {MIN_WIDTH} and {MAX_WIDTH}")
+        width = next((w for w in sorted(WIDTHS) if w >= width), max(WIDTHS))
+    auto = format in (None, "auto")
+    if auto:
+        format = next((f for f in ("avif", "webp") if f in FORMATS and f"image/{f}" in accept), "jpeg")
+    elif format == "jpg":
+        format = "jpeg"
+    if format not in FORMATS:
+        raise InvalidTransform(f"format must be one of: auto, {', '.join(FORMATS)}")
+    if quality is None:
+        quality = FORMATS[format][3]
+    elif not 30 <= quality <= 95:
+        raise InvalidTransform("quality must be between 30 and 95")
+    else:
+        quality = min(QUALITY_PRESETS, key=lambda preset: abs(preset - quality))
+    return TransformParams(width, format, quality, auto)
+
+
+def render(source: Path, params: TransformParams, target: Path) -> int:
+    """Blocking: write the transformed image to target; returns its size"""
+    name, _, _, _, options = FORMATS[params.format]
+    try:
+        with Image.open(source) as image:
+            if params.width and image.format == "JPEG":
+                image.draft("RGB", (params.width, params.width))  # Let libjpeg downscale while decoding
+            image = ImageOps.exif_transpose(image)
+            if params.width and params.width < image.width:
+                height = max(1, round(image.height * params.width / image.width))
+                image = image.resize((params.width, height), Image.LANCZOS)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            if name == "JPEG":
+                if has_alpha:
+                    image = image.convert("RGBA")
+                    flattened = Image.new("RGB", image.size, (255, 255, 255))
+                    flattened.paste(image, mask=image.getchannel("A"))
+                    image = flattened
+                else:
+                    image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if has_alpha else "RGB")
+            buffer = io.BytesIO()
+            if name != "PNG":
+                options = {**options, "quality": params.quality}
+            image.save(buffer, name, **options)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidTransform(f"Not a transformable image: {e}")
+    tmp = target.with_name(f".{target.name}.tmp")
+    tmp.write_bytes(buffer.getvalue())
+    os.replace(tmp, target)
+    return buffer.tell()
+
+
+class DiskLRU:
+    """Size-bounded directory of cache files; recency survives restarts through mtimes"""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total = 0
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                st = entry.stat()
+                files.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total += size
+        self._evict()
+
+    def get(self, name: str) -> Optional[Tuple[Path, int]]:
+        size = self.entries.get(name)
+        if size is None:
+            return None
+        path = self.directory / name
+        try:
+            os.utime(path)  # Persist recency for the next startup's ordering
+        except FileNotFoundError:
+            self.discard(name)
+            return None
+        self.entries.move_to_end(name)
+        return path, size
+
+    def put(self, name: str, size: int):
+        if name in self.entries:
+            self.total -= self.entries[name]
+        self.entries[name] = size
+        self.entries.move_to_end(name)
+        self.total += size
+        self._evict()
+
+    def discard(self, name: str):
+        self.total -= self.entries.pop(name, 0)
+
+    def _evict(self):
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+
+class ImageTransformer:
+    def __init__(self, cache: DiskLRU):
+        self.cache = cache
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._source_hashes: Dict[Tuple[str, float, int], str] = {}
+
+    async def source_hash(self, info: FileInfo) -> str:
+        name = info.path.name
+        if HASHED_NAME.match(name):
+            return name.split(".")[0]  # The name already is the content hash
+        key = (name, info.mtime, info.size)
+        digest = self._source_hashes.get(key)
+        if digest is None:
+            digest = await run_in_pool(_file_hash, info.path)
+            self._source_hashes[key] = digest
+        return digest
+
+    async def transform(self, info: FileInfo, params: TransformParams) -> FileInfo:
+        """Cached transformed copy of `info`; renders at most once per key at a time"""
+        _, mime, extension, _, _ = FORMATS[params.format]
+        source_hash = await self.source_hash(info)
+        key = hashlib.sha256(
+            f"{source_hash}|{params.width}|{params.format}|{params.quality}".encode()
+        ).hexdigest()[:32]
+        name = f"{key}.{extension}"
+
+        cached = self.cache.get(name)
+        if cached is None:
+            future = self._inflight.get(name)
+            if future is None:
+                future = run_in_pool(render, info.path, params, self.cache.directory / name)
+                self._inflight[name] = future
+                future.add_done_callback(lambda _: self._inflight.pop(name, None))
+            size = await asyncio.shield(future)
+            self.cache.put(name, size)
+            cached = (self.cache.directory / name, size)
+
+        path, size = cached
+        return FileInfo(
+            path=path,
+            size=size,
+            mtime=info.mtime,
+            etag=f'"{key}"',
+            content_type=mime,
+            cache_control=info.cache_control,  # Only as cacheable as the source it was made from
+        )
+
+    async def open(self, info: FileInfo, params: TransformParams) -> Tuple[FileInfo, BinaryIO]:
+        """
+        Transformed copy plus an open handle to it. Another request may evict
+        the file between the cache lookup and the open; render it again then.
+        The handle stays readable even if the file is evicted afterwards.
+        """
+        for attempt in range(3):
+            result = await self.transform(info, params)
+            try:
+                return result, open(result.path, "rb")
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                self.cache.discard(result.path.name)
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
@@ -1,60 +1,173 @@
 """
 ImgBB Image Hosting Service
 Simple, free image hosting for payment screenshots
+
+Uploads go out as streamed multipart (no base64) through one pooled
+httpx client. Oversized phone screenshots are downscaled to JPEG before
+sending, and transient failures are retried with backoff.
 """
-import httpx
-import base64
+import asyncio
+import io
 import logging
 import os
+from typing import BinaryIO, Optional, Tuple, Union
+
+import httpx
+from PIL import Image, ImageOps, UnidentifiedImageError
 
 logger = logging.getLogger(__name__)
 
-IMGBB_UPLOAD_URL = "https://api.imgbb.com/1/upload"
+IMGBB_UPLOAD_URL = os.environ.get("IMGBB_UPLOAD_URL", "https://api.imgbb.com/1/upload")
+
+# Screenshots larger than this (either side, or in bytes) are recompressed before upload
+MAX_DIMENSION = int(os.environ.get("IMGBB_MAX_DIMENSION", "1600"))
+RECOMPRESS_OVER_BYTES = int(os.environ.get("IMGBB_RECOMPRESS_OVER_BYTES", str(1024 * 1024)))
+JPEG_QUALITY = 82
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
 
 def get_imgbb_api_key():
     """Get API key dynamically to pick up env changes"""
     return os.environ.get('IMGBB_API_KEY')
 
-async def upload_to_imgbb(image_bytes: bytes, filename: str) -> dict:
+
+def _size(file: BinaryIO) -> int:
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def prepare_screenshot(file: BinaryIO, filename: str, content_type: str) -> Tuple[BinaryIO, str, str]:
+    """
+    Blocking: return (file, filename, content_type) to upload. Small images pass
+    through untouched; large ones are fitted into MAX_DIMENSION and saved as JPEG.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            if max(width, height) <= MAX_DIMENSION and _size(file) <= RECOMPRESS_OVER_BYTES:
+                file.seek(0)
+                return file, filename, content_type
+            if getattr(image, "is_animated", False):
+                file.seek(0)
+                return file, filename, content_type
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                flattened = Image.new("RGB", image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.getchannel("A"))
+                image = flattened
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    except (UnidentifiedImageError, OSError):
+        # Let ImgBB decide; it rejects what it can't read with a clear error
+        file.seek(0)
+        return file, filename, content_type
+
+    if output.tell() >= _size(file):
+        file.seek(0)
+        return file, filename, content_type
+    output.seek(0)
+    return output, f"{os.path.splitext(filename)[0]}.jpg", "image/jpeg"
+
+
+class ImgBBClient:
+    """Long-lived client; one connection pool shared by every upload"""
+
+    def __init__(self, upload_url: str = IMGBB_UPLOAD_URL, timeout: float = 30.0,
+                 max_attempts: int = 3, backoff: float = 0.5):
+        self.upload_url = upload_url
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def upload(self, file: BinaryIO, filename: str, content_type: str, api_key: str) -> dict:
+        """POST the file as multipart; retries connection errors, 429 and 5xx"""
+        for attempt in range(1, self.max_attempts + 1):
+            file.seek(0)  # httpx streams from the file, so rewind before every attempt
+            try:
+                response = await self.client.post(
+                    self.upload_url,
+                    params={"key": api_key},
+                    data={"name": os.path.splitext(filename)[0]},
+                    files={"image": (filename, file, content_type)},
+                )
+                if response.status_code not in RETRY_STATUS or attempt == self.max_attempts:
+                    response.raise_for_status()
+                    return response.json()
+                delay = self._retry_after(response) or self.backoff * 2 ** (attempt - 1)
+                logger.warning(f"ImgBB returned {response.status_code}, retrying in {delay:.1f}s")
+            except httpx.TransportError as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1)
+                logger.warning(f"ImgBB connection failed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        try:
+            return min(float(response.headers["retry-after"]), 30.0)
+        except (KeyError, ValueError):
+            return None
+
+
+imgbb = ImgBBClient()
+
+
+async def upload_to_imgbb(image: Union[bytes, BinaryIO], filename: str, content_type: str = "application/octet-stream") -> dict:
     """
     Upload image to ImgBB and return URLs
-    
+
     Args:
-        image_bytes: Image file content as bytes
+        image: Image file object (e.g. UploadFile.file) or bytes
         filename: Original filename
-    
+        content_type: MIME type of the upload
+
     Returns:
         dict with 'url', 'display_url', 'delete_url'
     """
     api_key = get_imgbb_api_key()
     if not api_key:
         raise Exception("IMGBB_API_KEY not configured in environment")
-    
+
+    if isinstance(image, bytes):
+        image = io.BytesIO(image)
+
     try:
-        # Convert image to base64
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # Prepare payload
-        payload = {
-            'key': api_key,
-            'image': image_base64,
-            'name': filename
-        }
-        
-        # Upload to ImgBB
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(IMGBB_UPLOAD_URL, data=payload)
-            response.raise_for_status()
-            result = response.json()
-        
+        file, filename, content_type = await asyncio.to_thread(prepare_screenshot, image, filename, content_type)
+        result = await imgbb.upload(file, filename, content_type, api_key)
+
         if not result.get('success'):
             error_msg = result.get('error', {}).get('message', 'Unknown error')
             raise Exception(f"ImgBB upload failed: {error_msg}")
-        
+
         data = result['data']
-        
+
         logger.info(f"✓ Uploaded to ImgBB: {filename} -> {data['url']}")
-        
+
         return {
             'url': data['url'],  # Direct image URL
             'display_url': data['display_url'],  # ImgBB page URL
@@ -63,7 +176,7 @@ async def upload_to_imgbb(image_bytes: bytes, filename: str) -> dict:
             'thumb_url': data.get('thumb', {}).get('url'),
             'medium_url': data.get('medium', {}).get('url'),
         }
-    
+
     except httpx.HTTPStatusError as e:
         logger.error(f"ImgBB HTTP error: {e.response.status_code} - {e.response.text}")
         raise Exception(f"Image upload failed: {e.response.status_code}")
@@ -0,0 +1,33 @@
+"""
+JSON Responses
+orjson-backed trusted responses that skip response_model re-validation
+"""
+from typing import Any, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def response_defaults(model: Type[BaseModel]) -> dict:
+    """Static field defaults of a model, used to give stored documents the response shape"""
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if field.default_factory is None and not field.is_required()
+    }
+
+
+def model_projection(model: Type[BaseModel]) -> dict:
+    """Mongo projection returning only the fields a response model would keep"""
+    projection = {"_id": 0}
+    projection.update({name: 1 for name in model.model_fields})
+    return projection
+
+
+def trusted_response(content: Any, status_code: int = 200, headers: dict = None) -> ORJSONResponse:
+    """
+    Serialize straight to JSON, bypassing jsonable_encoder and response_model
+    validation. Only for data we wrote ourselves through the same model
+    (e.g. product documents read back with model_projection).
+    """
+    return ORJSONResponse(content, status_code=status_code, headers=headers)
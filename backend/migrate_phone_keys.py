@@ -0,0 +1,88 @@
+"""
+Backfill canonical phone_key on customers and orders
+Safe to re-run: keys are recomputed from the stored phone fields
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from phone_utils import normalize_phone
+from db_indexes import ensure_indexes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+BATCH_SIZE = 1000
+
+async def flush(collection, ops):
+    if not ops:
+        return
+    try:
+        await collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # On re-runs a key can still be held by a newer customer; it is reported, not fatal
+        print(f"⚠ {len(e.details.get('writeErrors', []))} {collection.name} updates skipped: duplicate phone_key")
+    ops.clear()
+
+async def backfill_customers():
+    """Oldest customer wins when several share a number; the rest get no key"""
+    seen = set()
+    ops = []
+    keyed = 0
+    conflicts = 0
+    cursor = db.customers.find({}, {"_id": 1, "phone": 1, "whatsapp_number": 1}).sort("created_at", ASCENDING)
+    async for customer in cursor:
+        phone_key = normalize_phone(customer.get("phone")) or normalize_phone(customer.get("whatsapp_number"))
+        if phone_key and phone_key in seen:
+            conflicts += 1
+            phone_key = None
+        if phone_key:
+            seen.add(phone_key)
+            keyed += 1
+            ops.append(UpdateOne({"_id": customer["_id"]}, {"$set": {"phone_key": phone_key}}))
+        else:
+            ops.append(UpdateOne({"_id": customer["_id"]}, {"$unset": {"phone_key": ""}}))
+        if len(ops) >= BATCH_SIZE:
+            await flush(db.customers, ops)
+    await flush(db.customers, ops)
+    print(f"✓ Customers: {keyed} keyed, {conflicts} duplicate numbers left unkeyed")
+
+async def backfill_orders():
+    ops = []
+    keyed = 0
+    async for order in db.orders.find({}, {"_id": 1, "customer_phone": 1}):
+        phone_key = normalize_phone(order.get("customer_phone"))
+        if phone_key:
+            keyed += 1
+            ops.append(UpdateOne({"_id": order["_id"]}, {"$set": {"phone_key": phone_key}}))
+        else:
+            ops.append(UpdateOne({"_id": order["_id"]}, {"$unset": {"phone_key": ""}}))
+        if len(ops) >= BATCH_SIZE:
+            await flush(db.orders, ops)
+    await flush(db.orders, ops)
+    print(f"✓ Orders: {keyed} keyed")
+
+async def create_indexes():
+    # Built after the backfill so legacy duplicates can't block the unique index
+    result = await ensure_indexes(db, collections=["customers", "orders"])
+    print(f"✓ Ensured {result['ensured']} customer/order indexes")
+    for name in result["failed"]:
+        print(f"✗ Failed: {name}")
+
+async def migrate_phone_keys():
+    print("📞 Backfilling phone keys...")
+    await backfill_customers()
+    await backfill_orders()
+    await create_indexes()
+    print("\n✅ Phone key migration completed successfully!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_phone_keys())
@@ -0,0 +1,67 @@
+"""
+Make visits unique per visitor per day
+Removes duplicate (visitor_id, date) rows, keeping the earliest, replaces the
+old non-unique visitor_date index with visitor_date_unique and rebuilds the
+daily_stats rollups so visit counts match. Safe to re-run.
+
+Until this has run on an existing database, startup logs the unique index as
+failed and visits keep working without it.
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from daily_stats import DailyStats
+from db_indexes import ensure_indexes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+BATCH_SIZE = 1000
+
+async def remove_duplicates():
+    """Keep the first visit of each visitor/day; concurrent requests could insert more before the unique index"""
+    pipeline = [
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": {"visitor_id": "$visitor_id", "date": "$date"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    extra = []
+    removed = 0
+    async for group in db.visits.aggregate(pipeline, allowDiskUse=True):
+        extra.extend(group["ids"][1:])
+        if len(extra) >= BATCH_SIZE:
+            removed += (await db.visits.delete_many({"_id": {"$in": extra}})).deleted_count
+            extra = []
+    if extra:
+        removed += (await db.visits.delete_many({"_id": {"$in": extra}})).deleted_count
+    print(f"✓ Visits: {removed} duplicate rows removed")
+
+async def replace_index():
+    try:
+        await db.visits.drop_index("visitor_date")
+        print("✓ Dropped non-unique visitor_date index")
+    except OperationFailure:
+        pass  # Already gone (re-run or new database)
+    result = await ensure_indexes(db, collections=["visits"])
+    print(f"✓ Ensured {result['ensured']} visit indexes")
+    for name in result["failed"]:
+        print(f"✗ Failed: {name}")
+
+async def migrate_unique_visits():
+    print("👣 Deduplicating visits...")
+    await remove_duplicates()
+    await replace_index()
+    days = await DailyStats(db).rebuild()
+    print(f"✓ Rebuilt daily stats for {days} days")
+    print("\n✅ Visit migration completed successfully!")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_unique_visits())
@@ -0,0 +1,309 @@
+"""
+Newsletter Campaigns
+Sends a campaign to every active subscriber in throttled batches
+
+The campaign is rendered once with merge fields left as placeholders; each
+recipient only costs a string join. Subscribers are streamed in _id order,
+and after every batch the campaign document records the last _id sent and
+renews the sending worker's lease. If that worker dies, another one claims
+the campaign once the lease expires and continues from the checkpoint.
+Delivery is at-least-once: a crash mid-batch can resend that one batch.
+
+When most of a batch fails the SMTP server is treated as down: the failed
+recipients are retried with backoff, and if that doesn't help the campaign
+is paused at the previous checkpoint instead of burning through the list.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from jinja2.sandbox import SandboxedEnvironment
+from markupsafe import Markup
+from pymongo import ReturnDocument
+
+from email_service import build_message
+from email_templates import EmailTemplates, MergeTemplate, merge_placeholders
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGNS_COLLECTION = "newsletter_campaigns"
+MERGE_FIELDS = ("name", "email", "unsubscribe_url")
+
+# Seconds between retries of a batch whose sends mostly failed; then the campaign pauses
+RETRY_DELAYS = (10, 30, 60)
+
+# Campaign subject/body are admin-authored Jinja; sandboxed so they can only use merge fields
+_campaign_env = SandboxedEnvironment()
+_TAGS = re.compile(r"<[^>]+>")
+
+
+def unsubscribe_token(email: str, secret: str) -> str:
+    """Stateless token proving the link was issued for this address"""
+    digest = hmac.new(secret.encode(), email.lower().encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
+
+
+def verify_unsubscribe_token(email: str, token: str, secret: str) -> bool:
+    return hmac.compare_digest(unsubscribe_token(email, secret), token or "")
+
+
+def compile_campaign(templates: EmailTemplates, campaign: dict) -> Tuple[MergeTemplate, MergeTemplate, MergeTemplate]:
+    """Render a campaign into (subject, html, text) merge templates; raises jinja2.TemplateError on bad markup"""
+    placeholders = merge_placeholders(MERGE_FIELDS)
+    subject = _campaign_env.from_string(campaign["subject"]).render(placeholders)
+    body_html = _campaign_env.from_string(campaign["html"]).render(placeholders)
+    if campaign.get("text"):
+        body_text = _campaign_env.from_string(campaign["text"]).render(placeholders)
+    else:
+        body_text = _TAGS.sub("", body_html).strip()
+    return templates.render_merge(
+        "newsletter", MERGE_FIELDS, subject=subject, body_html=Markup(body_html), body_text=body_text
+    )
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class CampaignSender:
+    """
+    Owns campaign delivery for one worker. start() launches a poller that
+    resumes campaigns whose sender's lease has lapsed; send() and pause() are
+    called from the admin endpoints.
+    """
+
+    def __init__(self, db, pool, templates: EmailTemplates, secret: str, unsubscribe_url: str,
+                 batch_size: int = 50, per_minute: int = 600, lease_seconds: int = 120, poll_interval: float = 30,
+                 retry_delays: Tuple[float, ...] = RETRY_DELAYS):
+        self.db = db
+        self.pool = pool  # Anything with `async send(message)`, normally email_service.smtp_pool
+        self.templates = templates
+        self.secret = secret
+        self.unsubscribe_url = unsubscribe_url
+        self.batch_size = batch_size
+        self.per_minute = per_minute
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_delays = retry_delays
+        self.owner = uuid.uuid4().hex
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[CAMPAIGNS_COLLECTION]
+
+    # ---- Admin actions ----
+
+    async def create(self, subject: str, html: str, text: Optional[str] = None) -> dict:
+        campaign = {
+            "id": str(uuid.uuid4()),
+            "subject": subject,
+            "html": html,
+            "text": text,
+            "status": "draft",
+            "checkpoint": None,
+            "sent": 0,
+            "failed": 0,
+            "failures": [],
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "created_at": _now().isoformat(),
+        }
+        compile_campaign(self.templates, campaign)  # Reject broken templates before they are stored
+        await self.collection.insert_one(campaign)
+        campaign.pop("_id", None)
+        return campaign
+
+    async def send(self, campaign_id: str) -> bool:
+        """Start (or resume a paused) campaign; False if it is not in a sendable state"""
+        result = await self.collection.update_one(
+            {"id": campaign_id, "status": {"$in": ["draft", "paused"]}},
+            {"$set": {"status": "sending", "started_at": _now().isoformat()}, "$unset": {"error": ""}},
+        )
+        if result.modified_count == 0:
+            return False
+        self.launch(campaign_id)
+        return True
+
+    async def pause(self, campaign_id: str) -> bool:
+        """The sender stops at its next checkpoint"""
+        result = await self.collection.update_one(
+            {"id": campaign_id, "status": "sending"},
+            {"$set": {"status": "paused", "paused_at": _now().isoformat()}},
+        )
+        return result.modified_count > 0
+
+    # ---- Background delivery ----
+
+    def launch(self, campaign_id: str):
+        task = self._running.get(campaign_id)
+        if task is None or task.done():
+            self._running[campaign_id] = asyncio.create_task(self.run(campaign_id))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._resume_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+
+    async def _resume_loop(self):
+        while True:
+            try:
+                now = _now().isoformat()
+                async for campaign in self.collection.find(
+                    {"status": "sending", "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]},
+                    {"_id": 0, "id": 1},
+                ):
+                    logger.info(f"Resuming newsletter campaign {campaign['id']}")
+                    self.launch(campaign["id"])
+            except Exception as e:
+                logger.warning(f"Failed to check for stalled newsletter campaigns: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _lease(self) -> str:
+        return (_now() + timedelta(seconds=self.lease_seconds)).isoformat()
+
+    async def _claim(self, campaign_id: str) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            {
+                "id": campaign_id,
+                "status": "sending",
+                "$or": [
+                    {"lease_owner": None},
+                    {"lease_owner": self.owner},
+                    {"lease_expires_at": {"$lt": _now().isoformat()}},
+                ],
+            },
+            {"$set": {"lease_owner": self.owner, "lease_expires_at": self._lease()}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _release(self, campaign_id: str, **fields):
+        await self.collection.update_one(
+            {"id": campaign_id, "lease_owner": self.owner},
+            {"$set": {"lease_owner": None, "lease_expires_at": None, **fields}},
+        )
+
+    async def run(self, campaign_id: str):
+        campaign = await self._claim(campaign_id)
+        if campaign is None:
+            return  # Not sending, or another worker holds the lease
+        try:
+            compiled = compile_campaign(self.templates, campaign)
+            query = {"is_active": True}
+            if campaign.get("checkpoint") is not None:
+                query["_id"] = {"$gt": campaign["checkpoint"]}
+            cursor = self.db.newsletter.find(query, {"email": 1, "name": 1}).sort("_id", 1).batch_size(self.batch_size)
+
+            batch = []
+            async for subscriber in cursor:
+                batch.append(subscriber)
+                if len(batch) >= self.batch_size:
+                    if not await self._send_batch(campaign_id, batch, compiled):
+                        await cursor.close()
+                        return
+                    batch = []
+            if batch and not await self._send_batch(campaign_id, batch, compiled):
+                return
+
+            await self._release(campaign_id, status="completed", completed_at=_now().isoformat())
+            logger.info(f"Newsletter campaign {campaign_id} completed")
+        except asyncio.CancelledError:
+            raise  # Shutdown; the lease lapses and the campaign resumes elsewhere
+        except Exception as e:
+            logger.error(f"Newsletter campaign {campaign_id} failed: {e}")
+            await self._release(campaign_id, status="failed", error=str(e))
+        finally:
+            self._running.pop(campaign_id, None)
+
+    async def _renew(self, campaign_id: str) -> bool:
+        """Extend the lease while waiting; False if it was lost or the campaign was paused"""
+        renewed = await self.collection.find_one_and_update(
+            {"id": campaign_id, "lease_owner": self.owner, "status": "sending"},
+            {"$set": {"lease_expires_at": self._lease()}},
+            projection={"_id": 0, "id": 1},
+        )
+        if renewed is None:
+            await self._release(campaign_id)
+            return False
+        return True
+
+    async def _send_batch(self, campaign_id: str, batch: List[dict], compiled) -> bool:
+        """Send, checkpoint and throttle one batch; False when the campaign should stop"""
+        started = time.monotonic()
+        pending = batch
+        for delay in (0, *self.retry_delays):
+            if delay:
+                logger.warning(f"Newsletter campaign {campaign_id}: {len(pending)}/{len(batch)} sends failed, "
+                               f"retrying in {delay}s")
+                await asyncio.sleep(delay)
+                if not await self._renew(campaign_id):
+                    return False
+            results = await asyncio.gather(*[self._send_one(subscriber, compiled) for subscriber in pending])
+            pending = [subscriber for subscriber, ok in zip(pending, results) if not ok]
+            if len(pending) * 2 <= len(batch):
+                break  # A few bad addresses, not an outage
+        else:
+            # Keep the checkpoint so a resume starts again from this batch
+            logger.error(f"Newsletter campaign {campaign_id} paused: SMTP sends keep failing")
+            await self._release(campaign_id, status="paused", paused_at=_now().isoformat(),
+                                error=f"{len(pending)} of {len(batch)} sends in a batch failed; paused")
+            return False
+        failures = [subscriber["email"] for subscriber in pending]
+
+        updated = await self.collection.find_one_and_update(
+            {"id": campaign_id, "lease_owner": self.owner},
+            {
+                "$set": {"checkpoint": batch[-1]["_id"], "lease_expires_at": self._lease()},
+                "$inc": {"sent": len(batch) - len(failures), "failed": len(failures)},
+                "$push": {"failures": {"$each": failures, "$slice": -100}},
+            },
+            projection={"_id": 0, "status": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated is None:
+            logger.warning(f"Lost lease on newsletter campaign {campaign_id}; stopping")
+            return False
+        if updated["status"] != "sending":
+            await self._release(campaign_id)
+            return False
+
+        # Throttle to per_minute regardless of how fast the SMTP server accepts
+        remaining = len(batch) * 60 / self.per_minute - (time.monotonic() - started)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        return True
+
+    def unsubscribe_link(self, email: str) -> str:
+        return f"{self.unsubscribe_url}?{urlencode({'email': email, 'token': unsubscribe_token(email, self.secret)})}"
+
+    async def _send_one(self, subscriber: dict, compiled) -> bool:
+        subject, html, text = compiled
+        email = subscriber["email"]
+        link = self.unsubscribe_link(email)
+        values = {"name": subscriber.get("name") or "", "email": email, "unsubscribe_url": link}
+        message = build_message(
+            email, subject.fill(values), html.fill(values), text.fill(values),
+            headers={"List-Unsubscribe": f"<{link}>", "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"},
+        )
+        try:
+            await self.pool.send(message)
+            return True
+        except Exception as e:
+            logger.warning(f"Newsletter send to {email} failed: {e}")
+            return False
@@ -0,0 +1,46 @@
+"""
+Phone Number Normalization
+Canonical E.164 keys used to match customers and orders by phone
+"""
+from typing import Optional
+
+# Numbers entered without a country code are assumed to be Nepali
+DEFAULT_COUNTRY_CODE = "977"
+
+# Shortest local number we accept (Nepali landlines are 7-8 digits) and the E.164 maximum
+MIN_NATIONAL_DIGITS = 7
+MAX_DIGITS = 15
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Normalize a user-entered phone number to E.164 (e.g. +9779812345678)
+
+    Accepts the formats we see in the wild: "9812345678", "09812345678",
+    "977-981-2345678", "+977 9812345678" and "009779812345678".
+    Returns None when the input doesn't look like a phone number.
+    """
+    if not phone:
+        return None
+
+    raw = str(phone).strip()
+    digits = "".join(ch for ch in raw if ch.isdigit())
+    if not digits:
+        return None
+
+    if not raw.startswith("+"):
+        if digits.startswith("00"):
+            # International dialing prefix, country code follows
+            digits = digits[2:]
+        else:
+            digits = digits.lstrip("0")
+            # National numbers (up to 10 digits) get the default country code
+            if len(digits) <= 10:
+                if len(digits) < MIN_NATIONAL_DIGITS:
+                    return None
+                digits = DEFAULT_COUNTRY_CODE + digits
+
+    if not MIN_NATIONAL_DIGITS < len(digits) <= MAX_DIGITS:
+        return None
+
+    return f"+{digits}"
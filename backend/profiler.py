@@ -0,0 +1,234 @@
+"""
+On-Demand Sampling Profiler
+Samples stack traces of selected live requests and stores them as collapsed
+stacks (flamegraph.pl / speedscope input) in a capped collection or on disk
+
+Enabled at runtime through the admin API, no restart needed. While a request
+is profiled a daemon thread snapshots every thread's stack at a fixed interval
+and keeps the stacks that run through the route's endpoint function. Samples
+where the endpoint isn't on any stack are counted as "[awaiting]", i.e. time
+spent suspended on I/O, so the flame graph adds up to wall-clock time.
+"""
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+PROFILES_COLLECTION = "profiles"
+PROFILES_COLLECTION_BYTES = 64 * 1024 * 1024
+MAX_CONCURRENT_SESSIONS = 4
+AWAITING_FRAME = "[awaiting]"
+
+
+class ProfilerConfig(BaseModel):
+    enabled: bool = False
+    routes: List[str] = []  # Route template globs, e.g. "/api/analytics/profit"
+    sample_one_in: int = Field(0, ge=0)  # Also profile 1 in N requests of any route (0 = off)
+    interval_ms: float = Field(5.0, ge=1.0, le=1000.0)
+    max_duration: float = Field(60.0, gt=0, le=600)  # Stop sampling runaway requests
+    storage: str = Field("mongo", pattern="^(mongo|disk)$")
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """Collects stacks containing target_code until stopped"""
+
+    def __init__(self, target_code, interval: float, max_duration: float):
+        super().__init__(daemon=True, name="profiler-sampler")
+        self.target_code = target_code
+        self.interval = interval
+        self.max_duration = max_duration
+        self.counts: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_duration
+        root = frame_label(self.target_code)
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            stacks = self.sample()
+            if stacks:
+                self.counts.update(stacks)
+            else:
+                self.counts[f"{root};{AWAITING_FRAME}"] += 1
+
+    def sample(self) -> List[str]:
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident:
+                continue
+            chain = []
+            while frame is not None:
+                chain.append(frame.f_code)
+                if frame.f_code is self.target_code:
+                    # Drop everything above the endpoint (event loop, middleware)
+                    stacks.append(";".join(frame_label(code) for code in reversed(chain)))
+                    break
+                frame = frame.f_back
+        return stacks
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.counts
+
+
+def to_collapsed(counts: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+def to_speedscope(collapsed: str, name: str, interval_ms: float) -> dict:
+    """Convert collapsed stacks into a speedscope sampled profile"""
+    frames, frame_index, samples, weights = [], {}, [], []
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        indexes = []
+        for label in stack.split(";"):
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append({"name": label})
+            indexes.append(frame_index[label])
+        samples.append(indexes)
+        weights.append(int(count) * interval_ms)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "profiler.py",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+class ProfileSession:
+    def __init__(self, route: str, request_path: str, method: str, endpoint, config: ProfilerConfig):
+        self.route = route
+        self.path = request_path
+        self.method = method
+        self.endpoint = endpoint
+        self.interval_ms = config.interval_ms
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._start = time.perf_counter()
+        self.sampler = Sampler(endpoint.__code__, config.interval_ms / 1000, config.max_duration)
+        self.sampler.start()
+
+    def stop(self) -> dict:
+        counts = self.sampler.stop()
+        return {
+            "id": f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}",
+            "route": self.route,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self._start) * 1000, 1),
+            "interval_ms": self.interval_ms,
+            "sample_count": sum(counts.values()),
+            "collapsed": to_collapsed(counts),
+        }
+
+
+class Profiler:
+    def __init__(self, db, directory: Path):
+        self.db = db
+        self.directory = directory
+        self.config = ProfilerConfig()
+        self._requests_seen = 0
+        self._active = set()  # Endpoints being sampled; concurrent samples would mix
+        self._collection_ready = False
+
+    def start(self, scope, routes) -> Optional[ProfileSession]:
+        """Returns a running session if this request was selected for profiling"""
+        if not self.config.enabled or len(self._active) >= MAX_CONCURRENT_SESSIONS:
+            return None
+
+        for route in routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                break
+        else:
+            return None
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is None or not hasattr(endpoint, "__code__") or endpoint in self._active:
+            return None
+
+        selected = any(fnmatch(route.path, pattern) for pattern in self.config.routes)
+        if not selected and self.config.sample_one_in:
+            self._requests_seen += 1
+            selected = self._requests_seen % self.config.sample_one_in == 0
+        if not selected:
+            return None
+
+        self._active.add(endpoint)
+        return ProfileSession(route.path, scope["path"], scope["method"], endpoint, self.config)
+
+    async def finish(self, session: ProfileSession):
+        profile = await asyncio.to_thread(session.stop)
+        self._active.discard(session.endpoint)
+        try:
+            if self.config.storage == "disk":
+                await asyncio.to_thread(self._write_file, profile)
+            else:
+                await self._ensure_collection()
+                await self.db[PROFILES_COLLECTION].insert_one(dict(profile))
+        except Exception as e:
+            logger.error(f"Failed to store profile for {session.route}: {e}")
+
+    async def _ensure_collection(self):
+        if self._collection_ready:
+            return
+        if PROFILES_COLLECTION not in await self.db.list_collection_names():
+            # Capped so old profiles roll off on their own
+            await self.db.create_collection(PROFILES_COLLECTION, capped=True, size=PROFILES_COLLECTION_BYTES)
+        self._collection_ready = True
+
+    def _write_file(self, profile: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{profile['id']}.json").write_text(json.dumps(profile))
+
+    async def list_profiles(self, limit: int = 100) -> List[dict]:
+        """Newest first, without the stack data"""
+        if self.config.storage == "disk":
+            def read_summaries():
+                if not self.directory.exists():
+                    return []
+                files = sorted(self.directory.glob("*.json"), reverse=True)[:limit]
+                summaries = []
+                for path in files:
+                    profile = json.loads(path.read_text())
+                    profile.pop("collapsed", None)
+                    summaries.append(profile)
+                return summaries
+            return await asyncio.to_thread(read_summaries)
+        return await self.db[PROFILES_COLLECTION].find(
+            {}, {"_id": 0, "collapsed": 0}
+        ).sort("$natural", -1).to_list(limit)
+
+    async def get_profile(self, profile_id: str) -> Optional[dict]:
+        if self.config.storage == "disk":
+            path = self.directory / f"{Path(profile_id).name}.json"
+            if not path.exists():
+                return None
+            return json.loads(await asyncio.to_thread(path.read_text))
+        return await self.db[PROFILES_COLLECTION].find_one({"id": profile_id}, {"_id": 0})
@@ -0,0 +1,114 @@
+"""
+MongoDB Query Metrics
+Per-route command counts, durations and documents returned, collected with a
+PyMongo CommandListener and exported as Prometheus histograms
+"""
+import os
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+from pymongo import monitoring
+
+# Opt-in Server-Timing header so browsers' devtools show DB time per request
+SERVER_TIMING_ENABLED = os.environ.get("QUERY_METRICS_SERVER_TIMING", "false").lower() == "true"
+
+DB_COMMANDS = Histogram(
+    "mongo_commands_per_request",
+    "MongoDB commands issued while handling a request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_DURATION = Histogram(
+    "mongo_duration_per_request_seconds",
+    "Total MongoDB command time while handling a request",
+    ["route"],
+)
+DB_DOCUMENTS = Histogram(
+    "mongo_documents_per_request",
+    "Documents returned by MongoDB while handling a request",
+    ["route"],
+    buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000),
+)
+DB_COMMANDS_TOTAL = Counter(
+    "mongo_commands_total",
+    "MongoDB commands by name and outcome",
+    ["command", "outcome"],
+)
+
+
+class RequestStats:
+    """
+    Mutable per-request accumulator. Motor runs commands on executor threads
+    with a copy of the request's context, so the contextvar resolves to the
+    same object there; the lock covers concurrent gathers within one request.
+    """
+
+    __slots__ = ("commands", "duration", "documents", "_lock")
+
+    def __init__(self):
+        self.commands = 0
+        self.duration = 0.0
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    def add(self, duration: float, documents: int):
+        with self._lock:
+            self.commands += 1
+            self.duration += duration
+            self.documents += documents
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("query_metrics_stats", default=None)
+
+
+def _documents_returned(reply) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if batch is not None:
+            return len(batch)
+    # count / distinct / write commands report n, not documents
+    return 0
+
+
+class QueryMetricsListener(monitoring.CommandListener):
+    """Attributes every MongoDB command to the request that issued it"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        DB_COMMANDS_TOTAL.labels(event.command_name, "ok").inc()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add(event.duration_micros / 1_000_000, _documents_returned(event.reply))
+
+    def failed(self, event):
+        DB_COMMANDS_TOTAL.labels(event.command_name, "error").inc()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add(event.duration_micros / 1_000_000, 0)
+
+
+def start_request() -> RequestStats:
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def route_label(scope) -> str:
+    # Path templates only, so metric cardinality stays bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe(route: str, stats: RequestStats):
+    DB_COMMANDS.labels(route).observe(stats.commands)
+    DB_DURATION.labels(route).observe(stats.duration)
+    DB_DOCUMENTS.labels(route).observe(stats.documents)
+
+
+def server_timing(stats: RequestStats) -> str:
+    return f'db;dur={stats.duration * 1000:.1f};desc="{stats.commands} queries"'
@@ -0,0 +1,159 @@
+"""
+Rate Limiting
+Sliding-window-counter limiter with per-route policies and a pluggable backend
+
+Each key keeps two counters (current and previous fixed window). The request
+rate is estimated as previous * (remaining share of the window) + current,
+so every check is O(1) regardless of how many requests a client made.
+"""
+import os
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from time import time
+from typing import List, Optional
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Redis backend is optional; the in-memory backend needs nothing
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    limit: int  # Requests allowed per window
+    window: int  # Window length in seconds
+    message: str = "Too many requests. Please slow down."
+
+
+def _sliding_estimate(previous: int, current: int, now: float, window_start: float, window: int) -> float:
+    """Weighted request count across the previous and current fixed windows"""
+    elapsed = now - window_start
+    return previous * max(0.0, 1.0 - elapsed / window) + current
+
+
+class MemoryBackend:
+    """
+    Per-process backend. Keys are kept in LRU order and the least recently
+    seen clients are evicted once max_keys is reached, so memory stays bounded.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._windows: "OrderedDict[str, list]" = OrderedDict()
+
+    async def hit(self, key: str, limit: int, window: int, now: float) -> bool:
+        window_start = now - (now % window)
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = [window_start, 0, 0]  # [window_start, previous, current]
+            self._windows[key] = entry
+        else:
+            self._windows.move_to_end(key)
+            if entry[0] != window_start:
+                # Roll over: the old current window becomes previous if it is adjacent
+                entry[1] = entry[2] if window_start - entry[0] == window else 0
+                entry[2] = 0
+                entry[0] = window_start
+
+        if _sliding_estimate(entry[1], entry[2], now, window_start, window) >= limit:
+            return False
+
+        entry[2] += 1
+        while len(self._windows) > self.max_keys:
+            self._windows.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._windows)
+
+
+class RedisBackend:
+    """
+    Shared backend for multiple uvicorn workers. Counters live in Redis under
+    {prefix}{key}:{window_index} and expire on their own, so idle keys cost nothing.
+    Allowed requests take one round trip; rejected ones take a second to undo the increment.
+    """
+
+    def __init__(self, client, prefix: str = "rl:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def hit(self, key: str, limit: int, window: int, now: float) -> bool:
+        index = int(now // window)
+        current_key = f"{self.prefix}{key}:{index}"
+        previous_key = f"{self.prefix}{key}:{index - 1}"
+
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(previous_key)
+        current, _, previous = await pipe.execute()
+
+        estimate = _sliding_estimate(int(previous or 0), int(current) - 1, now, index * window, window)
+        if estimate >= limit:
+            await self.client.decr(current_key)
+            return False
+        return True
+
+
+class RateLimiter:
+    """Picks the first policy whose pattern matches the request path"""
+
+    def __init__(self, backend, policies: List[tuple], default: RateLimitPolicy, exempt: List[str] = None):
+        self.backend = backend
+        self.policies = policies  # [(path glob, RateLimitPolicy), ...]
+        self.default = default
+        self.exempt = exempt or []
+
+    def policy_for(self, path: str) -> Optional[RateLimitPolicy]:
+        if any(fnmatch(path, pattern) for pattern in self.exempt):
+            return None
+        for pattern, policy in self.policies:
+            if fnmatch(path, pattern):
+                return policy
+        return self.default
+
+    async def check(self, path: str, client_id: str, now: Optional[float] = None) -> Optional[RateLimitPolicy]:
+        """Returns the violated policy, or None if the request is allowed"""
+        policy = self.policy_for(path)
+        if policy is None:
+            return None
+        try:
+            allowed = await self.backend.hit(f"{policy.name}:{client_id}", policy.limit, policy.window, now or time())
+        except Exception as e:
+            # Never take the API down because the limiter backend is unreachable
+            logger.warning(f"Rate limiter backend error, allowing request: {e}")
+            return None
+        return None if allowed else policy
+
+
+# Login endpoints are more relaxed than OTP senders, which can be abused to spam inboxes
+DEFAULT_POLICY = RateLimitPolicy("default", limit=100, window=60)
+ROUTE_POLICIES = [
+    ("*/auth/login", RateLimitPolicy("login", limit=30, window=60, message="Too many login attempts. Please try again later.")),
+    ("*/auth/customer/send-otp", RateLimitPolicy("otp", limit=10, window=60, message="Too many code requests. Please try again later.")),
+    ("*/customers/login", RateLimitPolicy("otp", limit=10, window=60, message="Too many code requests. Please try again later.")),
+]
+EXEMPT_PATHS = ["/health"]
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    """Build the app limiter from env; RATE_LIMIT_REDIS_URL shares limits across workers"""
+    if os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "false":
+        return None
+
+    redis_url = os.environ.get("RATE_LIMIT_REDIS_URL")
+    if redis_url and redis is not None:
+        backend = RedisBackend(redis.from_url(redis_url))
+        logger.info("Rate limiter using Redis backend")
+    else:
+        if redis_url:
+            logger.warning("RATE_LIMIT_REDIS_URL set but redis package not installed, using in-memory rate limits")
+        backend = MemoryBackend(max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "10000")))
+
+    return RateLimiter(backend, ROUTE_POLICIES, DEFAULT_POLICY, exempt=EXEMPT_PATHS)
@@ -0,0 +1,75 @@
+"""
+Resource Versions
+Shared version tokens for cacheable resources, bumped on every admin write
+
+Tokens live in the `resource_versions` collection so all workers agree on
+them. Each worker keeps an in-memory copy refreshed by a background poller,
+so reading a version never touches MongoDB on the request path.
+"""
+import asyncio
+import logging
+import secrets
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_COLLECTION = "resource_versions"
+
+
+def new_token() -> str:
+    return secrets.token_hex(8)
+
+
+class VersionStore:
+    def __init__(self, db, poll_interval: float = 1.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._versions: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[VERSIONS_COLLECTION]
+
+    def get(self, resource: str) -> Optional[str]:
+        return self._versions.get(resource)
+
+    async def bump(self, *resources: str):
+        """Give each resource a new version; call after every write that changes it"""
+        for resource in resources:
+            token = new_token()
+            await self.collection.update_one(
+                {"resource": resource},
+                {"$set": {"resource": resource, "version": token}},
+                upsert=True,
+            )
+            # Visible in this worker at once; other workers pick it up on their next poll
+            self._versions[resource] = token
+
+    async def refresh(self):
+        async for doc in self.collection.find({}, {"_id": 0, "resource": 1, "version": 1}):
+            self._versions[doc["resource"]] = doc["version"]
+
+    async def start(self, resources: Iterable[str] = ()):
+        # Seed missing resources without overwriting another worker's token
+        for resource in resources:
+            await self.collection.update_one(
+                {"resource": resource},
+                {"$setOnInsert": {"resource": resource, "version": new_token()}},
+                upsert=True,
+            )
+        await self.refresh()
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to refresh resource versions: {e}")
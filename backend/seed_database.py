@@ -7,6 +7,7 @@ import os
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from pathlib import Path
+from resource_versions import VersionStore
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -319,6 +320,9 @@ async def seed_database():
     await db.payment_methods.insert_many(payment_methods)
     print(f"✓ Seeded {len(payment_methods)} payment methods")
     
+    # Invalidate cached storefront responses (ETags) for everything reseeded
+    await VersionStore(db).bump("categories", "reviews", "blog_posts", "faqs", "notification_bar", "social_links", "payment_methods")
+    
     print("\n✅ Database seeding completed successfully!")
 
 if __name__ == "__main__":
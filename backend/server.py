@@ -1,11 +1,14 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Body, Request, Header
 import fastapi
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse, ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
@@ -15,11 +18,34 @@ from datetime import datetime, timezone, timedelta
 import hashlib
 import jwt
 import secrets
-import shutil
 import httpx
-from email_service import send_email, get_order_confirmation_email, get_order_status_update_email, get_welcome_email
-from imgbb_service import upload_to_imgbb
+from email_service import (
+    send_email_async, smtp_pool, get_order_confirmation_email, get_order_status_update_email, get_welcome_email,
+    get_customer_otp_email, get_order_completed_email,
+)
+from imgbb_service import upload_to_imgbb, imgbb
+from phone_utils import normalize_phone
+from rate_limiter import create_rate_limiter
+from db_indexes import ensure_indexes
+import query_metrics
+from profiler import Profiler, ProfilerConfig, to_speedscope
+from compression import CompressionMiddleware
+from resource_versions import VersionStore
+from config_registry import ConfigRegistry
+from http_cache import HTTPCacheMiddleware, CachePolicy
+from json_responses import trusted_response, model_projection, response_defaults
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import google_sheets_service
+import email_service
+import jinja2
+from email_templates import templates as email_templates
+from newsletter_campaigns import CampaignSender, verify_unsubscribe_token
+from export_pipeline import create_export_pipeline
+import data_exports
+import image_pipeline
+import image_transforms
+from upload_files import UploadStore
+from daily_stats import DailyStats, STATS_FIELDS, nepal_day, snapshot_costs
 
 
 ROOT_DIR = Path(__file__).parent
@@ -28,23 +54,52 @@ load_dotenv(ROOT_DIR / '.env')
 # Create uploads directory
 UPLOADS_DIR = ROOT_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+images = image_pipeline.ImagePipeline(UPLOADS_DIR)
+# Set UPLOADS_ACCEL_PREFIX to an nginx `internal` location aliased to UPLOADS_DIR to let nginx send the files
+upload_files = UploadStore(UPLOADS_DIR, accel_prefix=os.environ.get("UPLOADS_ACCEL_PREFIX"))
+# Transformed copies (?width=&format=&quality=) live in a size-capped LRU next to the uploads
+image_transformer = image_transforms.ImageTransformer(image_transforms.DiskLRU(
+    Path(os.environ.get("IMAGE_CACHE_DIR", ROOT_DIR / "image_cache")),
+    max_bytes=int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+))
 
 # JWT Config
 JWT_SECRET = os.environ.get('JWT_SECRET', secrets.token_hex(32))
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url, event_listeners=[query_metrics.QueryMetricsListener()])
+db = client[os.environ['DB_NAME']]
+
+# Version tokens behind the ETags of cached public endpoints; bump after admin writes
+versions = VersionStore(db)
+
+# Singleton settings documents, cached in memory and reloaded when their version changes
+config = ConfigRegistry(versions)
+
+# Per-day order/revenue/visit rollups behind the analytics overview
+daily_stats = DailyStats(db)
+
+# Newsletter campaigns; unsubscribe links are HMAC-signed per address
+NEWSLETTER_SECRET = os.environ.get('NEWSLETTER_SECRET', JWT_SECRET)
+campaigns = CampaignSender(
+    db, smtp_pool, email_templates, NEWSLETTER_SECRET,
+    unsubscribe_url=f"{os.environ.get('SITE_URL', 'https://gameshopnepal.com')}/api/newsletter/unsubscribe-link",
+    batch_size=int(os.environ.get("NEWSLETTER_BATCH_SIZE", "50")),
+    per_minute=int(os.environ.get("NEWSLETTER_RATE_PER_MINUTE", "600")),
+)
+
+# Order/customer changes streamed to Google Sheets (and optionally CSV/NDJSON files); None when disabled
+export_pipeline = create_export_pipeline(db, Path(os.environ.get("EXPORT_DIR", ROOT_DIR / "exports")), os.environ.get)
+
 # Take.app Config
 TAKEAPP_API_KEY = os.environ.get('TAKEAPP_API_KEY', '')
 TAKEAPP_BASE_URL = "https://api.take.app/v1"
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
@@ -53,50 +108,53 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 # ==================== RATE LIMITING ====================
-from collections import defaultdict
-from time import time
-
-# In-memory rate limiter (for production, use Redis)
-rate_limit_store = defaultdict(list)
-
-def rate_limit_check(ip: str, limit: int = 100, window: int = 60):
-    """Check if IP is rate limited. Returns True if allowed, False if limited."""
-    now = time()
-    # Clean old requests
-    rate_limit_store[ip] = [req_time for req_time in rate_limit_store[ip] if now - req_time < window]
-    
-    if len(rate_limit_store[ip]) >= limit:
-        return False
-    
-    rate_limit_store[ip].append(now)
-    return True
+rate_limiter = create_rate_limiter()
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     """Rate limiting middleware"""
-    client_ip = request.client.host
-    
-    # Skip rate limiting for health checks
-    if request.url.path == "/health":
+    if rate_limiter is None:
         return await call_next(request)
     
-    # More relaxed for login endpoints (30 attempts per minute)
-    if "/auth/login" in request.url.path:
-        if not rate_limit_check(client_ip, limit=30, window=60):
-            return fastapi.responses.JSONResponse(
-                status_code=429,
-                content={"detail": "Too many login attempts. Please try again later."}
-            )
-    else:
-        # General rate limit
-        if not rate_limit_check(client_ip, limit=100, window=60):
-            return fastapi.responses.JSONResponse(
-                status_code=429,
-                content={"detail": "Too many requests. Please slow down."}
-            )
+    violated = await rate_limiter.check(request.url.path, request.client.host)
+    if violated:
+        return fastapi.responses.JSONResponse(
+            status_code=429,
+            content={"detail": violated.message},
+            headers={"Retry-After": str(violated.window)}
+        )
     
     return await call_next(request)
 
+# ==================== QUERY METRICS ====================
+@app.middleware("http")
+async def query_metrics_middleware(request: Request, call_next):
+    """Attribute MongoDB commands to the matched route"""
+    stats = query_metrics.start_request()
+    response = await call_next(request)
+    query_metrics.observe(query_metrics.route_label(request.scope), stats)
+    if query_metrics.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = query_metrics.server_timing(stats)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return fastapi.responses.Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# ==================== PROFILER ====================
+profiler = Profiler(db, Path(os.environ.get("PROFILER_DIR", ROOT_DIR / "profiles")))
+
+@app.middleware("http")
+async def profiler_middleware(request: Request, call_next):
+    """Sample stacks of requests selected in the admin profiler config"""
+    session = profiler.start(request.scope, app.router.routes)
+    if session is None:
+        return await call_next(request)
+    try:
+        return await call_next(request)
+    finally:
+        await profiler.finish(session)
+
 # ==================== SECURITY HEADERS ====================
 @app.middleware("http")
 async def security_headers_middleware(request: Request, call_next):
@@ -176,6 +234,7 @@ class ProductCreate(BaseModel):
     slug: Optional[str] = None  # Custom slug, auto-generated if not provided
     description: str
     image_url: str
+    image: Optional[dict] = None  # Upload manifest (AVIF/WebP srcset + blurhash) for image_url
     category_id: str
     variations: List[ProductVariation] = []
     tags: List[str] = []
@@ -194,6 +253,7 @@ class Product(BaseModel):
     slug: Optional[str] = None
     description: str
     image_url: str
+    image: Optional[dict] = None  # Upload manifest (AVIF/WebP srcset + blurhash) for image_url
     category_id: str
     variations: List[ProductVariation] = []
     tags: List[str] = []
@@ -319,6 +379,8 @@ class CreditSettings(BaseModel):
     usable_categories: List[str] = []  # Categories where credits can be used (empty = all)
     usable_products: List[str] = []  # Products where credits can be used (empty = all)
 
+config.register("credit_settings", db.credit_settings, {"id": "main"}, CreditSettings)
+
 class CustomerCreditUpdate(BaseModel):
     customer_id: str
     amount: float  # Positive to add, negative to deduct
@@ -336,6 +398,37 @@ def create_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+async def insert_customer(customer: dict, drop_taken_phone: bool = True):
+    """
+    Insert a customer, dropping phone_key if another customer already owns that number.
+    With drop_taken_phone=False the DuplicateKeyError is raised for the caller to handle.
+    """
+    customer.setdefault("updated_at", customer.get("created_at") or datetime.now(timezone.utc).isoformat())
+    try:
+        await db.customers.insert_one(customer)
+    except DuplicateKeyError:
+        if "phone_key" not in customer or not drop_taken_phone:
+            raise
+        logger.warning(f"Phone {customer['phone_key']} already belongs to another customer")
+        customer.pop("phone_key")
+        customer.pop("_id", None)
+        await db.customers.insert_one(customer)
+
+async def update_customer_phone(customer_filter: dict, update_fields: dict, phone: Optional[str]):
+    """$set update_fields plus the canonical phone_key derived from phone"""
+    phone_key = normalize_phone(phone)
+    if phone_key:
+        try:
+            await db.customers.update_one(customer_filter, {"$set": {**update_fields, "phone_key": phone_key, "updated_at": datetime.now(timezone.utc).isoformat()}})
+            return
+        except DuplicateKeyError:
+            logger.warning(f"Phone {phone_key} already belongs to another customer")
+    # Cleared, unparseable or taken: release the old key so it can't block that number's owner
+    await db.customers.update_one(customer_filter, {
+        "$set": {**update_fields, "updated_at": datetime.now(timezone.utc).isoformat()},
+        "$unset": {"phone_key": ""},
+    })
+
 # ==================== ADMIN CREDENTIALS FROM ENV ====================
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "gsnadmin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "gsnadmin")
@@ -618,14 +711,18 @@ async def send_customer_otp(request: OTPRequest):
             "created_at": datetime.now(timezone.utc).isoformat(),
             "last_login": None
         }
-        await db.customers.insert_one(customer_data)
+        phone_key = normalize_phone(customer_data["whatsapp_number"])
+        if phone_key:
+            customer_data["phone_key"] = phone_key
+        await insert_customer(customer_data)
         logger.info(f"New customer created: {email}")
     else:
         # Update whatsapp_number if provided
         if hasattr(request, 'whatsapp_number') and request.whatsapp_number:
-            await db.customers.update_one(
+            await update_customer_phone(
                 {"email": email},
-                {"$set": {"whatsapp_number": request.whatsapp_number}}
+                {"whatsapp_number": request.whatsapp_number},
+                request.whatsapp_number
             )
     
     # Generate OTP
@@ -645,61 +742,8 @@ async def send_customer_otp(request: OTPRequest):
     
     # Send OTP via email
     try:
-        subject = f"Your GSN Login Code: {otp}"
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: Arial, sans-serif; background-color: #000000; color: #ffffff;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="text-align: center; padding: 30px 0; border-bottom: 2px solid #F5A623;">
-                    <h1 style="margin: 0; color: #F5A623; font-size: 32px; font-weight: bold;">GSN</h1>
-                    <p style="margin: 10px 0 0; color: #888;">GameShop Nepal</p>
-                </div>
-                
-                <div style="padding: 40px 0; text-align: center;">
-                    <h2 style="color: #F5A623; margin: 0 0 20px;">Your Login Code</h2>
-                    <p style="color: #cccccc; margin-bottom: 30px;">Use this code to log in to your account:</p>
-                    
-                    <div style="background: linear-gradient(145deg, #1a1a1a, #0a0a0a); border: 2px solid #F5A623; border-radius: 12px; padding: 30px; margin: 20px 0;">
-                        <div style="font-size: 48px; font-weight: bold; color: #F5A623; letter-spacing: 8px; font-family: monospace;">
-                            {otp}
-                        </div>
-                    </div>
-                    
-                    <p style="color: #888; font-size: 14px; margin-top: 30px;">
-                        This code expires in 10 minutes.
-                    </p>
-                    <p style="color: #666; font-size: 12px; margin-top: 10px;">
-                        If you didn't request this code, please ignore this email.
-                    </p>
-                </div>
-                
-                <div style="text-align: center; padding: 30px 0; border-top: 1px solid #2a2a2a;">
-                    <p style="color: #888; margin: 5px 0;">Questions? Contact us on WhatsApp</p>
-                    <p style="color: #888; margin: 5px 0;">+977 9743488871</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        text = f"""
-        GSN - GAMESHOP NEPAL
-        
-        Your Login Code: {otp}
-        
-        This code expires in 10 minutes.
-        
-        If you didn't request this code, please ignore this email.
-        
-        Questions? WhatsApp: +977 9743488871
-        """
-        
-        send_email(email, subject, html, text)
+        subject, html, text = get_customer_otp_email(otp)
+        await send_email_async(email, subject, html, text)
         logger.info(f"OTP sent to {email}")
     except Exception as e:
         logger.error(f"Failed to send OTP email: {e}")
@@ -739,7 +783,7 @@ async def verify_customer_otp(verify: OTPVerify):
     # Update customer last login
     await db.customers.update_one(
         {"email": email},
-        {"$set": {"last_login": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"last_login": datetime.now(timezone.utc).isoformat(), "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
     
     # Get customer profile
@@ -753,16 +797,11 @@ async def verify_customer_otp(verify: OTPVerify):
             "name": email.split("@")[0],
             "phone": None,
             "created_at": datetime.now(timezone.utc).isoformat(),
-            "last_login": datetime.now(timezone.utc).isoformat()
+            "last_login": datetime.now(timezone.utc).isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat()
         }
         await db.customers.insert_one(customer)
     
-    # Sync customer to Google Sheets (in background)
-    try:
-        google_sheets_service.sync_customer_to_sheets(customer)
-    except Exception as e:
-        logger.warning(f"Failed to sync customer to Google Sheets: {e}")
-    
     # Create JWT token for customer
     token = create_token(customer["id"])
     
@@ -805,21 +844,28 @@ async def get_customer_profile(current_customer: dict = Depends(get_current_cust
 
 # ==================== CUSTOMER ENDPOINTS ====================
 
+# Orders as customers may see them: without the cost snapshot used for profit
+PUBLIC_ORDER_FIELDS = {"_id": 0, "items.cost_price": 0, "cost_total": 0}
+
 @api_router.get("/customer/orders")
 async def get_customer_orders(current_customer: dict = Depends(get_current_customer)):
     """Get customer's order history with status history"""
     orders = await db.orders.find(
         {"customer_email": current_customer["email"]},
-        {"_id": 0}
+        PUBLIC_ORDER_FIELDS
     ).sort("created_at", -1).to_list(100)
     
-    # Fetch status history for each order
+    # Fetch status history for all orders in one query
+    order_ids = [order.get("id") for order in orders]
+    history = await db.order_status_history.find(
+        {"order_id": {"$in": order_ids}},
+        {"_id": 0}
+    ).sort("created_at", 1).to_list(None)
+    history_by_order = {}
+    for entry in history:
+        history_by_order.setdefault(entry["order_id"], []).append(entry)
     for order in orders:
-        history = await db.order_status_history.find(
-            {"order_id": order.get("id")},
-            {"_id": 0}
-        ).sort("created_at", 1).to_list(50)
-        order["status_history"] = history
+        order["status_history"] = history_by_order.get(order.get("id"), [])[:50]
     
     return orders
 
@@ -829,7 +875,7 @@ async def get_customer_order_detail(order_id: str, current_customer: dict = Depe
     order = await db.orders.find_one({
         "id": order_id,
         "customer_email": current_customer["email"]
-    }, {"_id": 0})
+    }, PUBLIC_ORDER_FIELDS)
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -869,9 +915,10 @@ async def get_customer_stats(current_customer: dict = Depends(get_current_custom
 @api_router.put("/auth/customer/profile")
 async def update_customer_profile(name: str, phone: Optional[str] = None, current_customer: dict = Depends(get_current_customer)):
     """Update customer profile"""
-    await db.customers.update_one(
+    await update_customer_phone(
         {"id": current_customer["id"]},
-        {"$set": {"name": name, "phone": phone}}
+        {"name": name, "phone": phone},
+        phone
     )
     
     updated = await db.customers.find_one({"id": current_customer["id"]}, {"_id": 0})
@@ -885,14 +932,14 @@ async def upload_image(file: UploadFile = File(...), current_user: dict = Depend
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, WebP, GIF allowed.")
 
-    file_ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOADS_DIR / filename
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    contents = await file.read(image_pipeline.MAX_UPLOAD_BYTES + 1)
+    try:
+        image = await images.process(contents)
+    except image_pipeline.InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return {"url": f"/api/uploads/{filename}"}
+    # url stays the original for existing callers; image carries the srcset manifest and blurhash
+    return {"url": image["url"], "image": image}
 
 @api_router.post("/upload/payment")
 async def upload_payment_image(file: UploadFile = File(...)):
@@ -901,9 +948,11 @@ async def upload_payment_image(file: UploadFile = File(...)):
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, WebP, GIF allowed.")
     
-    # Limit file size to 10MB
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
+    # Limit file size to 10MB; the upload is already spooled to disk, so check without reading it
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+    if size > 10 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File too large. Max 10MB allowed.")
     
     try:
@@ -913,8 +962,9 @@ async def upload_payment_image(file: UploadFile = File(...)):
         
         # Upload to ImgBB
         result = await upload_to_imgbb(
-            image_bytes=contents,
-            filename=filename
+            image=file.file,
+            filename=filename,
+            content_type=file.content_type
         )
         
         logger.info(f"Payment screenshot uploaded to ImgBB: {filename}")
@@ -929,12 +979,30 @@ async def upload_payment_image(file: UploadFile = File(...)):
         logger.error(f"Failed to upload payment screenshot: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to upload screenshot: {str(e)}")
 
-@api_router.get("/uploads/{filename}")
-async def get_uploaded_image(filename: str):
-    file_path = UPLOADS_DIR / filename
-    if not file_path.exists():
+@api_router.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+async def get_uploaded_image(
+    filename: str,
+    request: Request,
+    width: Optional[int] = None,
+    format: Optional[str] = None,
+    quality: Optional[int] = None
+):
+    """Serve an upload; width/format(auto, jpeg, png, webp, avif)/quality return a cached transformed copy"""
+    info = upload_files.lookup(filename)
+    if info is None:
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(file_path)
+    try:
+        params = image_transforms.parse_params(width, format, quality, request.headers.get("accept", ""))
+        if params is None or info.path.suffix == ".gif":  # GIFs may be animated; serve as uploaded
+            return upload_files.response(info, request.headers)
+        transformed, file = await image_transformer.open(info, params)
+    except image_transforms.InvalidTransform as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The cache directory isn't behind nginx's uploads alias, so no X-Accel-Redirect
+    response = upload_files.response(transformed, request.headers, accel=False, file=file)
+    if params.auto:
+        response.headers["Vary"] = "Accept"
+    return response
 
 # ==================== CATEGORY ROUTES ====================
 
@@ -948,6 +1016,7 @@ async def create_category(category_data: CategoryCreate, current_user: dict = De
     slug = category_data.name.lower().replace(" ", "-").replace("&", "and")
     category = Category(name=category_data.name, slug=slug)
     await db.categories.insert_one(category.model_dump())
+    await versions.bump("categories")
     return category
 
 @api_router.put("/categories/{category_id}", response_model=Category)
@@ -958,6 +1027,7 @@ async def update_category(category_id: str, category_data: CategoryCreate, curre
 
     slug = category_data.name.lower().replace(" ", "-").replace("&", "and")
     await db.categories.update_one({"id": category_id}, {"$set": {"name": category_data.name, "slug": slug}})
+    await versions.bump("categories")
     updated = await db.categories.find_one({"id": category_id}, {"_id": 0})
     return updated
 
@@ -966,10 +1036,15 @@ async def delete_category(category_id: str, current_user: dict = Depends(get_cur
     result = await db.categories.delete_one({"id": category_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    await versions.bump("categories")
     return {"message": "Category deleted"}
 
 # ==================== PRODUCT ROUTES ====================
 
+# Product documents are written through the Product model, so the listing can skip re-validation
+PRODUCT_PROJECTION = model_projection(Product)
+PRODUCT_DEFAULTS = response_defaults(Product)
+
 @api_router.get("/products", response_model=List[Product])
 async def get_products(category_id: Optional[str] = None, active_only: bool = True):
     query = {}
@@ -978,16 +1053,14 @@ async def get_products(category_id: Optional[str] = None, active_only: bool = Tr
     if active_only:
         query["is_active"] = True
 
-    products = await db.products.find(query, {"_id": 0}).sort([("sort_order", 1), ("created_at", -1)]).to_list(1000)
+    products = await db.products.find(query, PRODUCT_PROJECTION).sort([("sort_order", 1), ("created_at", -1)]).to_list(1000)
     
     # Convert datetime fields to ISO strings
     for product in products:
         if "created_at" in product and isinstance(product["created_at"], datetime):
             product["created_at"] = product["created_at"].isoformat()
-        if "updated_at" in product and isinstance(product["updated_at"], datetime):
-            product["updated_at"] = product["updated_at"].isoformat()
     
-    return products
+    return trusted_response([{**PRODUCT_DEFAULTS, **product} for product in products])
 
 @api_router.get("/products/search/advanced")
 async def advanced_product_search(
@@ -1155,6 +1228,15 @@ def generate_slug(name: str) -> str:
     slug = re.sub(r'-+', '-', slug)
     return slug
 
+PRODUCT_IMAGE_FIELDS = ("url", "width", "height", "blurhash", "sources")
+
+def upload_manifest(product: dict) -> Optional[dict]:
+    """The parts of the upload manifest the storefront renders, while image_url still points at that upload"""
+    image = product.get("image")
+    if not image or image.get("url") != product.get("image_url") or image.get("sources") is None:
+        return None
+    return {field: image.get(field) for field in PRODUCT_IMAGE_FIELDS}
+
 @api_router.post("/products", response_model=Product)
 async def create_product(product_data: ProductCreate, current_user: dict = Depends(get_current_user)):
     max_order = await db.products.find_one(sort=[("sort_order", -1)])
@@ -1162,6 +1244,7 @@ async def create_product(product_data: ProductCreate, current_user: dict = Depen
 
     product_dict = product_data.model_dump()
     product_dict["sort_order"] = next_order
+    product_dict["image"] = upload_manifest(product_dict)
     
     # Use custom slug if provided, otherwise auto-generate
     if product_data.slug and product_data.slug.strip():
@@ -1185,6 +1268,7 @@ async def update_product(product_id: str, product_data: ProductCreate, current_u
         raise HTTPException(status_code=404, detail="Product not found")
 
     update_data = product_data.model_dump()
+    update_data["image"] = upload_manifest(update_data)
     
     # Use custom slug if provided, otherwise keep existing or auto-generate
     if product_data.slug and product_data.slug.strip():
@@ -1233,6 +1317,7 @@ async def create_review(review_data: ReviewCreate, current_user: dict = Depends(
         review_date=review_data.review_date or datetime.now(timezone.utc).isoformat()
     )
     await db.reviews.insert_one(review.model_dump())
+    await versions.bump("reviews")
     return review
 
 @api_router.put("/reviews/{review_id}", response_model=Review)
@@ -1244,6 +1329,7 @@ async def update_review(review_id: str, review_data: ReviewCreate, current_user:
     update_data = review_data.model_dump()
     update_data["review_date"] = review_data.review_date or existing.get("review_date")
     await db.reviews.update_one({"id": review_id}, {"$set": update_data})
+    await versions.bump("reviews")
     updated = await db.reviews.find_one({"id": review_id}, {"_id": 0})
     return updated
 
@@ -1252,6 +1338,7 @@ async def delete_review(review_id: str, current_user: dict = Depends(get_current
     result = await db.reviews.delete_one({"id": review_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Review not found")
+    await versions.bump("reviews")
     return {"message": "Review deleted"}
 
 # ==================== TRUSTPILOT SYNC ====================
@@ -1259,9 +1346,12 @@ async def delete_review(review_id: str, current_user: dict = Depends(get_current
 TRUSTPILOT_DOMAIN = "gameshopnepal.com"
 TRUSTPILOT_API_KEY = os.environ.get("TRUSTPILOT_API_KEY", "")
 
+config.register("trustpilot_business_unit_id", db.trustpilot_config, {"key": "business_unit_id"}, version_key="trustpilot_config")
+config.register("trustpilot_last_sync", db.trustpilot_config, {"key": "last_sync"}, version_key="trustpilot_config")
+
 async def get_trustpilot_business_unit_id():
     """Get the business unit ID from Trustpilot using the domain"""
-    cached = await db.trustpilot_config.find_one({"key": "business_unit_id"})
+    cached = await config.get("trustpilot_business_unit_id")
     if cached and cached.get("value"):
         return cached["value"]
     
@@ -1284,6 +1374,7 @@ async def get_trustpilot_business_unit_id():
                             {"$set": {"key": "business_unit_id", "value": buid}},
                             upsert=True
                         )
+                        await config.invalidate("trustpilot_config")
                         return buid
         except Exception as e:
             logger.error(f"Error getting business unit ID: {e}")
@@ -1387,6 +1478,8 @@ async def sync_trustpilot_reviews(current_user: dict = Depends(get_current_user)
                 }
                 await db.reviews.insert_one(review)
                 synced_count += 1
+        if synced_count:
+            await versions.bump("reviews")
         
         # Update last sync time
         await db.trustpilot_config.update_one(
@@ -1394,6 +1487,7 @@ async def sync_trustpilot_reviews(current_user: dict = Depends(get_current_user)
             {"$set": {"key": "last_sync", "value": datetime.now(timezone.utc).isoformat()}},
             upsert=True
         )
+        await config.invalidate("trustpilot_config")
         
         return {
             "success": True,
@@ -1409,7 +1503,7 @@ async def sync_trustpilot_reviews(current_user: dict = Depends(get_current_user)
 @api_router.get("/reviews/trustpilot-status")
 async def get_trustpilot_status(current_user: dict = Depends(get_current_user)):
     """Get Trustpilot sync status"""
-    last_sync = await db.trustpilot_config.find_one({"key": "last_sync"})
+    last_sync = await config.get("trustpilot_last_sync")
     tp_review_count = await db.reviews.count_documents({"source": "trustpilot"})
     
     return {
@@ -1431,6 +1525,7 @@ async def create_faq(faq_data: FAQItemCreate, current_user: dict = Depends(get_c
 
     faq = FAQItem(question=faq_data.question, answer=faq_data.answer, sort_order=next_order)
     await db.faqs.insert_one(faq.model_dump())
+    await versions.bump("faqs")
     return faq
 
 @api_router.put("/faqs/reorder")
@@ -1438,6 +1533,7 @@ async def reorder_faqs(request: Request, current_user: dict = Depends(get_curren
     faq_ids = await request.json()
     for index, faq_id in enumerate(faq_ids):
         await db.faqs.update_one({"id": faq_id}, {"$set": {"sort_order": index}})
+    await versions.bump("faqs")
     return {"message": "FAQs reordered successfully"}
 
 @api_router.put("/faqs/{faq_id}", response_model=FAQItem)
@@ -1447,6 +1543,7 @@ async def update_faq(faq_id: str, faq_data: FAQItemCreate, current_user: dict =
         raise HTTPException(status_code=404, detail="FAQ not found")
 
     await db.faqs.update_one({"id": faq_id}, {"$set": faq_data.model_dump()})
+    await versions.bump("faqs")
     updated = await db.faqs.find_one({"id": faq_id}, {"_id": 0})
     return updated
 
@@ -1455,6 +1552,7 @@ async def delete_faq(faq_id: str, current_user: dict = Depends(get_current_user)
     result = await db.faqs.delete_one({"id": faq_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="FAQ not found")
+    await versions.bump("faqs")
     return {"message": "FAQ deleted"}
 
 # ==================== PAGE ROUTES ====================
@@ -1480,6 +1578,7 @@ async def update_page(page_key: str, title: str, content: str, current_user: dic
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     await db.pages.update_one({"page_key": page_key}, {"$set": page_data}, upsert=True)
+    await versions.bump("pages")
     return page_data
 
 # ==================== SOCIAL LINK ROUTES ====================
@@ -1494,6 +1593,7 @@ async def get_social_links():
 async def create_social_link(link_data: SocialLinkCreate, current_user: dict = Depends(get_current_user)):
     link = SocialLink(**link_data.model_dump())
     await db.social_links.insert_one(link.model_dump())
+    await versions.bump("social_links")
     return link
 
 @api_router.put("/social-links/{link_id}", response_model=SocialLink)
@@ -1503,6 +1603,7 @@ async def update_social_link(link_id: str, link_data: SocialLinkCreate, current_
         raise HTTPException(status_code=404, detail="Social link not found")
 
     await db.social_links.update_one({"id": link_id}, {"$set": link_data.model_dump()})
+    await versions.bump("social_links")
     updated = await db.social_links.find_one({"id": link_id}, {"_id": 0})
     return updated
 
@@ -1511,6 +1612,7 @@ async def delete_social_link(link_id: str, current_user: dict = Depends(get_curr
     result = await db.social_links.delete_one({"id": link_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Social link not found")
+    await versions.bump("social_links")
     return {"message": "Social link deleted"}
 
 # ==================== CLEAR DATA ====================
@@ -1519,6 +1621,7 @@ async def delete_social_link(link_id: str, current_user: dict = Depends(get_curr
 async def clear_products(current_user: dict = Depends(get_current_user)):
     await db.products.delete_many({})
     await db.categories.delete_many({})
+    await versions.bump("categories")
     return {"message": "All products and categories cleared"}
 
 # ==================== SEED DATA ====================
@@ -1554,6 +1657,7 @@ async def seed_data():
     for faq in default_faqs:
         await db.faqs.update_one({"id": faq["id"]}, {"$set": faq}, upsert=True)
 
+    await versions.bump("social_links", "reviews", "faqs")
     return {"message": "Data seeded successfully"}
 
 # Order creation models
@@ -1562,6 +1666,8 @@ class OrderItem(BaseModel):
     price: float
     quantity: int = 1
     variation: Optional[str] = None
+    product_id: Optional[str] = None
+    variation_id: Optional[str] = None
 
 class CreateOrderRequest(BaseModel):
     customer_name: str
@@ -1585,6 +1691,7 @@ async def create_order(order_data: CreateOrderRequest):
         return phone
 
     formatted_phone = format_phone_number(order_data.customer_phone)
+    phone_key = normalize_phone(order_data.customer_phone)
 
     items_text = ", ".join([f"{item.quantity}x {item.name}" + (f" ({item.variation})" if item.variation else "") for item in order_data.items])
 
@@ -1604,28 +1711,28 @@ async def create_order(order_data: CreateOrderRequest):
         "credits_used": order_data.credits_used,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    local_order["updated_at"] = local_order["created_at"]
+    if phone_key:
+        local_order["phone_key"] = phone_key
+    # Cost at the time of sale, so profit isn't rewritten when cost prices change later
+    local_order["cost_total"] = await snapshot_costs(db, local_order["items"])
 
     await db.orders.insert_one(local_order)
+    await daily_stats.order_created(local_order)
     
     # Don't deduct credits immediately - they will be deducted when order is confirmed
     # Just mark the order with pending credits
     if order_data.credits_used > 0:
         await db.orders.update_one(
             {"id": order_id},
-            {"$set": {"credits_pending": True}}
+            {"$set": {"credits_pending": True, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
     
-    # Sync order to Google Sheets (in background)
-    try:
-        google_sheets_service.sync_order_to_sheets(local_order)
-    except Exception as e:
-        logger.warning(f"Failed to sync order to Google Sheets: {e}")
-
     # Send order confirmation email
     if order_data.customer_email:
         try:
             subject, html, text = get_order_confirmation_email(local_order)
-            send_email(order_data.customer_email, subject, html, text)
+            await send_email_async(order_data.customer_email, subject, html, text)
             logger.info(f"Order confirmation email sent to {order_data.customer_email}")
         except Exception as e:
             logger.error(f"Failed to send order confirmation email: {e}")
@@ -1637,9 +1744,16 @@ async def create_order(order_data: CreateOrderRequest):
     }
 
 @api_router.get("/orders")
-async def get_local_orders(current_user: dict = Depends(get_current_user)):
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return orders
+async def get_local_orders(phone: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    query = {}
+    if phone:
+        # Exact match on the canonical phone key, whatever format the admin typed
+        phone_key = normalize_phone(phone)
+        if not phone_key:
+            return []
+        query["phone_key"] = phone_key
+    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    return trusted_response(orders)
 
 # ==================== PAYMENT METHODS ====================
 
@@ -1684,6 +1798,7 @@ async def create_payment_method(method: PaymentMethod, current_user: dict = Depe
     method_dict = method.model_dump()
     method_dict["id"] = str(uuid.uuid4())
     await db.payment_methods.insert_one(method_dict)
+    await versions.bump("payment_methods")
     method_dict.pop("_id", None)
     return method_dict
 
@@ -1692,11 +1807,13 @@ async def update_payment_method(method_id: str, method: PaymentMethod, current_u
     method_dict = method.model_dump()
     method_dict["id"] = method_id
     await db.payment_methods.update_one({"id": method_id}, {"$set": method_dict})
+    await versions.bump("payment_methods")
     return method_dict
 
 @api_router.delete("/payment-methods/{method_id}")
 async def delete_payment_method(method_id: str, current_user: dict = Depends(get_current_user)):
     await db.payment_methods.delete_one({"id": method_id})
+    await versions.bump("payment_methods")
     return {"message": "Payment method deleted"}
 
 # ==================== ORDER PAYMENT SCREENSHOT ====================
@@ -1731,7 +1848,7 @@ async def upload_payment_screenshot(order_id: str, data: PaymentScreenshotUpload
         except Exception as e:
             logger.warning(f"Failed to deduct credits for order {order_id}: {e}")
     
-    await db.orders.update_one(
+    previous = await db.orders.find_one_and_update(
         {"id": order_id},
         {"$set": {
             "payment_screenshot": data.screenshot_url,
@@ -1740,9 +1857,14 @@ async def upload_payment_screenshot(order_id: str, data: PaymentScreenshotUpload
             "status": "Confirmed",
             "invoice_url": invoice_url,
             "credits_pending": False,
-            "credits_deducted": credits_deducted > 0
-        }}
+            "credits_deducted": credits_deducted > 0,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        projection=STATS_FIELDS,
+        return_document=ReturnDocument.BEFORE
     )
+    if previous:
+        await daily_stats.order_status_changed(previous, "Confirmed")
     
     response = {
         "message": "Payment screenshot uploaded", 
@@ -1778,74 +1900,25 @@ async def complete_order(order_id: str, current_user: dict = Depends(get_current
             logger.warning(f"Failed to award credits for order {order_id}: {e}")
     
     # Update status to Completed with credits info
-    await db.orders.update_one(
+    previous = await db.orders.find_one_and_update(
         {"id": order_id},
         {"$set": {
             "status": "Completed",
             "completed_at": datetime.now(timezone.utc).isoformat(),
-            "credits_awarded": credits_awarded
-        }}
+            "credits_awarded": credits_awarded,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        projection=STATS_FIELDS,
+        return_document=ReturnDocument.BEFORE
     )
+    if previous:
+        await daily_stats.order_status_changed(previous, "Completed")
     
     # Send invoice email to customer if email exists
     if customer_email:
         try:
-            site_url = os.environ.get("SITE_URL", "https://gameshopnepal.com")
-            invoice_url = f"{site_url}/invoice/{order_id}"
-            trustpilot_url = "https://www.trustpilot.com/evaluate/gameshopnepal.com"
-            
-            # Credits message
-            credits_message = ""
-            if credits_awarded > 0:
-                credits_message = f"""
-                    <div style="background: linear-gradient(135deg, #22c55e 0%, #16a34a 100%); border-radius: 10px; padding: 15px; margin: 20px 0; text-align: center;">
-                        <p style="color: #fff; margin: 0; font-size: 16px;">🎉 You earned <strong>Rs {credits_awarded:.0f}</strong> in store credits!</p>
-                        <p style="color: rgba(255,255,255,0.8); margin: 5px 0 0 0; font-size: 13px;">Use it on your next purchase</p>
-                    </div>
-                """
-            
-            subject = f"Your Order #{order_id[:8]} is Complete - GameShop Nepal"
-            html = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; background: #1a1a1a; color: #fff;">
-                <div style="background: linear-gradient(135deg, #F5A623 0%, #D4920D 100%); padding: 30px; text-align: center;">
-                    <h1 style="margin: 0; color: #000; font-size: 28px;">Order Complete!</h1>
-                </div>
-                <div style="padding: 30px;">
-                    <p style="color: #ccc; font-size: 16px;">Hi {order.get('customer_name', 'Customer')},</p>
-                    <p style="color: #ccc; font-size: 16px;">Your order has been completed successfully!</p>
-                    
-                    {credits_message}
-                    
-                    <div style="background: #2a2a2a; border-radius: 10px; padding: 20px; margin: 20px 0;">
-                        <h2 style="color: #F5A623; margin-top: 0;">Order Summary</h2>
-                        <p style="color: #fff;"><strong>Order ID:</strong> #{order_id[:8]}</p>
-                        <p style="color: #fff;"><strong>Items:</strong> {order.get('items_text', 'N/A')}</p>
-                        <p style="color: #F5A623; font-size: 20px;"><strong>Total:</strong> Rs {order.get('total', order.get('total_amount', 0)):,.0f}</p>
-                    </div>
-                    
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{invoice_url}" style="display: inline-block; background: #F5A623; color: #000; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px; margin-right: 10px;">
-                            View Invoice
-                        </a>
-                    </div>
-                    
-                    <div style="text-align: center; margin: 30px 0; padding: 20px; background: #2a2a2a; border-radius: 10px;">
-                        <p style="color: #ccc; margin-bottom: 15px;">Enjoyed your experience? We'd love your feedback!</p>
-                        <a href="{trustpilot_url}" style="display: inline-block; background: #00b67a; color: #fff; padding: 12px 30px; text-decoration: none; border-radius: 5px; font-weight: bold;">
-                            ⭐ Leave a Review on Trustpilot
-                        </a>
-                    </div>
-                    
-                    <p style="color: #666; font-size: 14px; text-align: center; margin-top: 30px;">
-                        Thank you for shopping with GameShop Nepal!
-                    </p>
-                </div>
-            </div>
-            """
-            text = f"Order #{order_id[:8]} Complete!\n\nYour order has been completed.\n{'You earned Rs ' + str(int(credits_awarded)) + ' in store credits!' if credits_awarded > 0 else ''}\nView Invoice: {invoice_url}\nLeave a Review: {trustpilot_url}"
-            
-            from email_service import send_email
-            send_email(customer_email, subject, html, text)
+            subject, html, text = get_order_completed_email(order, credits_awarded)
+            await send_email_async(customer_email, subject, html, text)
         except Exception as e:
             print(f"Failed to send invoice email: {e}")
     
@@ -1868,10 +1941,11 @@ async def delete_order(order_id: str, current_user: dict = Depends(get_current_u
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Delete the order
-    result = await db.orders.delete_one({"id": order_id})
+    deleted = await db.orders.find_one_and_delete({"id": order_id}, projection=STATS_FIELDS)
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=500, detail="Failed to delete order")
+    await daily_stats.order_deleted(deleted)
     
     logger.info(f"Order deleted by {current_user.get('username')}: {order_id}")
     
@@ -1895,9 +1969,10 @@ async def bulk_delete_orders(request: BulkDeleteRequest, current_user: dict = De
     
     for order_id in request.order_ids:
         try:
-            result = await db.orders.delete_one({"id": order_id})
-            if result.deleted_count > 0:
+            deleted = await db.orders.find_one_and_delete({"id": order_id}, projection=STATS_FIELDS)
+            if deleted:
                 deleted_count += 1
+                await daily_stats.order_deleted(deleted)
                 # Also delete tracking history
                 await db.order_status_history.delete_many({"order_id": order_id})
             else:
@@ -1917,7 +1992,7 @@ async def bulk_delete_orders(request: BulkDeleteRequest, current_user: dict = De
 @api_router.get("/invoice/{order_id}")
 async def get_invoice(order_id: str):
     """Get invoice data for an order"""
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    order = await db.orders.find_one({"id": order_id}, PUBLIC_ORDER_FIELDS)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -1937,18 +2012,18 @@ class NotificationBar(BaseModel):
     bg_color: Optional[str] = "#F5A623"
     text_color: Optional[str] = "#000000"
 
+config.register("notification_bar", db.notification_bar, {"is_active": True})
+
 @api_router.get("/notification-bar")
 async def get_notification_bar():
-    notification = await db.notification_bar.find_one({"is_active": True})
-    if notification:
-        notification.pop("_id", None)
-    return notification
+    return await config.get("notification_bar")
 
 @api_router.put("/notification-bar")
 async def update_notification_bar(notification: NotificationBar, current_user: dict = Depends(get_current_user)):
     notification_dict = notification.model_dump()
     notification_dict["id"] = "main"
     await db.notification_bar.update_one({"id": "main"}, {"$set": notification_dict}, upsert=True)
+    await config.invalidate("notification_bar")
     return notification_dict
 
 # ==================== BLOG POSTS ====================
@@ -1994,6 +2069,7 @@ async def create_blog_post(post: BlogPost, current_user: dict = Depends(get_curr
     post_dict["created_at"] = datetime.now(timezone.utc).isoformat()
     post_dict["updated_at"] = post_dict["created_at"]
     await db.blog_posts.insert_one(post_dict)
+    await versions.bump("blog_posts")
     post_dict.pop("_id", None)
     return post_dict
 
@@ -2003,34 +2079,37 @@ async def update_blog_post(post_id: str, post: BlogPost, current_user: dict = De
     post_dict["id"] = post_id
     post_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.blog_posts.update_one({"id": post_id}, {"$set": post_dict})
+    await versions.bump("blog_posts")
     return post_dict
 
 @api_router.delete("/blog/{post_id}")
 async def delete_blog_post(post_id: str, current_user: dict = Depends(get_current_user)):
     await db.blog_posts.delete_one({"id": post_id})
+    await versions.bump("blog_posts")
     return {"message": "Blog post deleted"}
 
 # ==================== SITE SETTINGS ====================
 
+class SiteSettings(BaseModel):
+    # Free-form: admins can store any extra keys alongside these defaults
+    model_config = ConfigDict(extra="allow")
+    notification_bar_enabled: bool = True
+    chat_enabled: bool = True
+    service_charge: float = 0
+    tax_percentage: float = 0
+    tax_label: str = "Tax"
+
+config.register("site_settings", db.site_settings, {"id": "main"}, SiteSettings)
+
 @api_router.get("/settings")
 async def get_site_settings():
-    settings = await db.site_settings.find_one({"id": "main"})
-    if not settings:
-        settings = {
-            "id": "main", 
-            "notification_bar_enabled": True, 
-            "chat_enabled": True,
-            "service_charge": 0,
-            "tax_percentage": 0,
-            "tax_label": "Tax"
-        }
-    settings.pop("_id", None)
-    return settings
+    return await config.get("site_settings")
 
 @api_router.put("/settings")
 async def update_site_settings(settings: dict, current_user: dict = Depends(get_current_user)):
     settings["id"] = "main"
     await db.site_settings.update_one({"id": "main"}, {"$set": settings}, upsert=True)
+    await config.invalidate("site_settings")
     return settings
 
 # ==================== PROMO CODES ====================
@@ -2125,10 +2204,16 @@ async def validate_promo_code(
     # Check category/product restrictions
     if promo.get("applicable_categories") or promo.get("applicable_products"):
         cart_valid = False
+        product_ids = [item.get("product_id") for item in cart_items if item.get("product_id")]
+        products = await db.products.find(
+            {"id": {"$in": product_ids}},
+            {"_id": 0, "id": 1, "category_id": 1}
+        ).to_list(None) if product_ids else []
+        products_by_id = {product["id"]: product for product in products}
         for item in cart_items:
             product_id = item.get("product_id")
             if product_id:
-                product = await db.products.find_one({"id": product_id})
+                product = products_by_id.get(product_id)
                 if product:
                     # Check if product matches
                     if promo.get("applicable_products") and product_id in promo["applicable_products"]:
@@ -2247,19 +2332,7 @@ async def record_promo_usage(promo_code: str, order_id: str, customer_email: Opt
 @api_router.get("/credits/settings")
 async def get_credit_settings():
     """Get credit system settings"""
-    settings = await db.credit_settings.find_one({"id": "main"}, {"_id": 0})
-    if not settings:
-        settings = {
-            "id": "main",
-            "cashback_percentage": 5.0,
-            "is_enabled": True,
-            "eligible_categories": [],
-            "eligible_products": [],
-            "min_order_amount": 0,
-            "usable_categories": [],
-            "usable_products": []
-        }
-    return settings
+    return await config.get("credit_settings")
 
 @api_router.put("/credits/settings")
 async def update_credit_settings(settings: CreditSettings, current_user: dict = Depends(get_current_user)):
@@ -2267,6 +2340,7 @@ async def update_credit_settings(settings: CreditSettings, current_user: dict =
     settings_dict = settings.model_dump()
     settings_dict["id"] = "main"
     await db.credit_settings.update_one({"id": "main"}, {"$set": settings_dict}, upsert=True)
+    await config.invalidate("credit_settings")
     return settings_dict
 
 @api_router.get("/credits/balance")
@@ -2289,7 +2363,7 @@ async def adjust_customer_credits(data: CustomerCreditUpdate, current_user: dict
     
     await db.customers.update_one(
         {"id": data.customer_id},
-        {"$set": {"credit_balance": new_balance}}
+        {"$set": {"credit_balance": new_balance, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
     
     # Log the credit transaction
@@ -2322,7 +2396,7 @@ async def get_customer_credit_logs(customer_id: str, current_user: dict = Depend
 @api_router.post("/credits/award")
 async def award_credits_for_order(order_id: str, customer_email: str, order_total: float):
     """Award cashback credits for a completed order"""
-    settings = await db.credit_settings.find_one({"id": "main"})
+    settings = await config.get("credit_settings", defaults=False)
     if not settings or not settings.get("is_enabled", True):
         return {"credits_awarded": 0, "message": "Credit system is disabled"}
     
@@ -2341,7 +2415,7 @@ async def award_credits_for_order(order_id: str, customer_email: str, order_tota
         new_balance = current_balance + credits_to_award
         await db.customers.update_one(
             {"email": customer_email},
-            {"$set": {"credit_balance": new_balance}}
+            {"$set": {"credit_balance": new_balance, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
         
         # Log the credit award
@@ -2376,7 +2450,7 @@ async def use_credits(customer_email: str, amount: float, order_id: str):
     new_balance = current_balance - amount
     await db.customers.update_one(
         {"email": customer_email},
-        {"$set": {"credit_balance": new_balance}}
+        {"$set": {"credit_balance": new_balance, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
     
     # Log the credit usage
@@ -2430,14 +2504,16 @@ class Bundle(BaseModel):
 @api_router.get("/bundles")
 async def get_bundles():
     """Get all active bundles with populated product details"""
-    bundles = await db.bundles.find({"is_active": True}).sort("sort_order", 1).to_list(100)
+    bundles = await db.bundles.find({"is_active": True}, {"_id": 0}).sort("sort_order", 1).to_list(100)
     
-    # Populate product details for each bundle
+    # Populate product details for all bundles with one query
+    product_ids = {bp.get("product_id") for bundle in bundles for bp in bundle.get("products", [])}
+    products = await db.products.find({"id": {"$in": list(product_ids)}}, {"_id": 0}).to_list(None)
+    products_by_id = {product["id"]: product for product in products}
     for bundle in bundles:
-        bundle.pop("_id", None)
         populated_products = []
         for bp in bundle.get("products", []):
-            product = await db.products.find_one({"id": bp.get("product_id")}, {"_id": 0})
+            product = products_by_id.get(bp.get("product_id"))
             if product:
                 populated_products.append({
                     "product": product,
@@ -2578,10 +2654,12 @@ async def get_wishlist(visitor_id: str):
     """Get wishlist items for a visitor"""
     items = await db.wishlists.find({"visitor_id": visitor_id}, {"_id": 0}).to_list(100)
     
-    # Populate product details
+    # Populate product details with one query
+    product_ids = list({item.get("product_id") for item in items})
+    products = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(None)
+    products_by_id = {product["id"]: product for product in products}
     for item in items:
-        product = await db.products.find_one({"id": item.get("product_id")}, {"_id": 0})
-        item["product"] = product
+        item["product"] = products_by_id.get(item.get("product_id"))
     
     return items
 
@@ -2715,6 +2793,63 @@ async def get_newsletter_subscribers(current_user: dict = Depends(get_current_us
     
     return subscribers
 
+# ==================== NEWSLETTER CAMPAIGNS ====================
+
+class NewsletterCampaignCreate(BaseModel):
+    subject: str
+    html: str  # May use {{ name }}, {{ email }} and {{ unsubscribe_url }}
+    text: Optional[str] = None  # Plain-text part; derived from html when omitted
+
+@api_router.post("/newsletter/campaigns")
+async def create_newsletter_campaign(data: NewsletterCampaignCreate, current_user: dict = Depends(get_current_user)):
+    """Create a draft campaign"""
+    try:
+        return await campaigns.create(data.subject, data.html, data.text)
+    except jinja2.TemplateError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid campaign template: {e}")
+
+@api_router.get("/newsletter/campaigns")
+async def get_newsletter_campaigns(current_user: dict = Depends(get_current_user)):
+    """List campaigns with delivery progress"""
+    return await db.newsletter_campaigns.find(
+        {}, {"_id": 0, "html": 0, "text": 0, "checkpoint": 0}
+    ).sort("created_at", -1).to_list(100)
+
+@api_router.get("/newsletter/campaigns/{campaign_id}")
+async def get_newsletter_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    campaign = await db.newsletter_campaigns.find_one({"id": campaign_id}, {"_id": 0, "checkpoint": 0})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    campaign["recipients"] = await db.newsletter.count_documents({"is_active": True})
+    return campaign
+
+@api_router.post("/newsletter/campaigns/{campaign_id}/send")
+async def send_newsletter_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    """Start or resume sending in the background"""
+    if not email_service.SMTP_USER or not email_service.SMTP_PASSWORD:
+        raise HTTPException(status_code=400, detail="SMTP credentials not configured")
+    if not await campaigns.send(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is not a draft or paused")
+    return {"message": "Campaign sending started"}
+
+@api_router.post("/newsletter/campaigns/{campaign_id}/pause")
+async def pause_newsletter_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    if not await campaigns.pause(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is not sending")
+    return {"message": "Campaign will pause after the current batch"}
+
+@api_router.api_route("/newsletter/unsubscribe-link", methods=["GET", "POST"])
+async def unsubscribe_newsletter_link(email: str, token: str):
+    """Signed unsubscribe link from campaign emails (GET from the link, POST for one-click)"""
+    email = email.lower().strip()
+    if not verify_unsubscribe_token(email, token, NEWSLETTER_SECRET):
+        raise HTTPException(status_code=400, detail="Invalid unsubscribe link")
+    await db.newsletter.update_one(
+        {"email": email, "is_active": True},
+        {"$set": {"is_active": False, "unsubscribed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    return {"message": "Successfully unsubscribed"}
+
 @api_router.get("/newsletter/stats")
 async def get_newsletter_stats(current_user: dict = Depends(get_current_user)):
     """Get newsletter statistics"""
@@ -2779,10 +2914,14 @@ async def update_order_status(order_id: str, status_data: OrderStatusUpdate, cur
     new_status = status_data.status.lower()
     
     # Update order status
-    await db.orders.update_one(
+    previous = await db.orders.find_one_and_update(
         {"id": order_id},
-        {"$set": {"status": status_data.status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": status_data.status, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        projection=STATS_FIELDS,
+        return_document=ReturnDocument.BEFORE
     )
+    if previous:
+        await daily_stats.order_status_changed(previous, status_data.status)
     
     # Add to status history
     history_entry = {
@@ -2810,7 +2949,7 @@ async def update_order_status(order_id: str, status_data: OrderStatusUpdate, cur
                 # Mark credits as deducted
                 await db.orders.update_one(
                     {"id": order_id},
-                    {"$set": {"credits_pending": False, "credits_deducted": True}}
+                    {"$set": {"credits_pending": False, "credits_deducted": True, "updated_at": datetime.now(timezone.utc).isoformat()}}
                 )
                 logger.info(f"Deducted {credits_used} credits from {customer_email} for confirmed order {order_id}")
             except Exception as e:
@@ -2832,7 +2971,7 @@ async def update_order_status(order_id: str, status_data: OrderStatusUpdate, cur
     if customer_email:
         try:
             subject, html, text = get_order_status_update_email(order, status_data.status)
-            send_email(customer_email, subject, html, text)
+            await send_email_async(customer_email, subject, html, text)
             logger.info(f"Order status update email sent to {customer_email}")
         except Exception as e:
             logger.error(f"Failed to send status update email: {e}")
@@ -2863,83 +3002,8 @@ async def get_order_details(order_id: str, current_user: dict = Depends(get_curr
 
 @api_router.get("/analytics/overview")
 async def get_analytics_overview(current_user: dict = Depends(get_current_user)):
-    """Get overview analytics for admin dashboard"""
-    now = datetime.now(timezone.utc)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-    week_ago = (now - timedelta(days=7)).isoformat()
-    month_ago = (now - timedelta(days=30)).isoformat()
-    
-    # Calculate last month date range
-    first_of_this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    last_month_end = (first_of_this_month - timedelta(days=1)).isoformat()
-    last_month_start = first_of_this_month.replace(month=first_of_this_month.month - 1 if first_of_this_month.month > 1 else 12, 
-                                                    year=first_of_this_month.year if first_of_this_month.month > 1 else first_of_this_month.year - 1).isoformat()
-    
-    # Today's stats
-    today_orders = await db.orders.count_documents({"created_at": {"$gte": today_start}})
-    today_revenue_cursor = await db.orders.aggregate([
-        {"$match": {"created_at": {"$gte": today_start}, "status": {"$ne": "cancelled"}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
-    ]).to_list(1)
-    today_revenue = today_revenue_cursor[0]["total"] if today_revenue_cursor else 0
-    
-    # This week stats
-    week_orders = await db.orders.count_documents({"created_at": {"$gte": week_ago}})
-    week_revenue_cursor = await db.orders.aggregate([
-        {"$match": {"created_at": {"$gte": week_ago}, "status": {"$ne": "cancelled"}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
-    ]).to_list(1)
-    week_revenue = week_revenue_cursor[0]["total"] if week_revenue_cursor else 0
-    
-    # This month stats
-    month_orders = await db.orders.count_documents({"created_at": {"$gte": month_ago}})
-    month_revenue_cursor = await db.orders.aggregate([
-        {"$match": {"created_at": {"$gte": month_ago}, "status": {"$ne": "cancelled"}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
-    ]).to_list(1)
-    month_revenue = month_revenue_cursor[0]["total"] if month_revenue_cursor else 0
-    
-    # Last month stats
-    last_month_orders = await db.orders.count_documents({
-        "created_at": {"$gte": last_month_start, "$lte": last_month_end}
-    })
-    last_month_revenue_cursor = await db.orders.aggregate([
-        {"$match": {"created_at": {"$gte": last_month_start, "$lte": last_month_end}, "status": {"$ne": "cancelled"}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
-    ]).to_list(1)
-    last_month_revenue = last_month_revenue_cursor[0]["total"] if last_month_revenue_cursor else 0
-    
-    # Total stats (all time)
-    total_orders = await db.orders.count_documents({})
-    total_revenue_cursor = await db.orders.aggregate([
-        {"$match": {"status": {"$ne": "cancelled"}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
-    ]).to_list(1)
-    total_revenue = total_revenue_cursor[0]["total"] if total_revenue_cursor else 0
-    
-    # Website visits
-    today_visits = await db.visits.count_documents({"date": today_start[:10]})
-    week_visits = await db.visits.count_documents({"created_at": {"$gte": week_ago}})
-    month_visits = await db.visits.count_documents({"created_at": {"$gte": month_ago}})
-    last_month_visits = await db.visits.count_documents({
-        "created_at": {"$gte": last_month_start, "$lte": last_month_end}
-    })
-    total_visits = await db.visits.count_documents({})
-    
-    return {
-        "today": {"orders": today_orders, "revenue": today_revenue},
-        "week": {"orders": week_orders, "revenue": week_revenue},
-        "month": {"orders": month_orders, "revenue": month_revenue},
-        "lastMonth": {"orders": last_month_orders, "revenue": last_month_revenue},
-        "total": {"orders": total_orders, "revenue": total_revenue},
-        "visits": {
-            "today": today_visits,
-            "week": week_visits,
-            "month": month_visits,
-            "lastMonth": last_month_visits,
-            "total": total_visits
-        }
-    }
+    """Get overview analytics for admin dashboard (Nepal-local days, summed from daily_stats)"""
+    return await daily_stats.overview()
 
 @api_router.post("/track-visit")
 async def track_visit(request: Request):
@@ -2950,21 +3014,20 @@ async def track_visit(request: Request):
         user_agent = request.headers.get("User-Agent", "")
         
         now = datetime.now(timezone.utc)
-        today = now.strftime("%Y-%m-%d")
+        today = nepal_day(now)
         
         # Only count unique visits per day per visitor
-        existing = await db.visits.find_one({
-            "visitor_id": visitor_id,
-            "date": today
-        })
-        
-        if not existing and visitor_id:
-            await db.visits.insert_one({
-                "visitor_id": visitor_id,
-                "date": today,
-                "user_agent": user_agent,
-                "created_at": now.isoformat()
-            })
+        if visitor_id:
+            try:
+                result = await db.visits.update_one(
+                    {"visitor_id": visitor_id, "date": today},
+                    {"$setOnInsert": {"user_agent": user_agent, "created_at": now.isoformat()}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                return {"success": True}  # A concurrent request inserted (and counted) it
+            if result.upserted_id is not None:
+                await daily_stats.visit(today)
         
         return {"success": True}
     except Exception as e:
@@ -3057,59 +3120,8 @@ async def get_order_status_breakdown(current_user: dict = Depends(get_current_us
 
 @api_router.get("/analytics/profit")
 async def get_profit_analytics(current_user: dict = Depends(get_current_user)):
-    """Get profit analytics based on cost price vs selling price"""
-    now = datetime.now(timezone.utc)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-    week_ago = (now - timedelta(days=7)).isoformat()
-    month_ago = (now - timedelta(days=30)).isoformat()
-    
-    # Calculate last month date range
-    first_of_this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    last_month_end = (first_of_this_month - timedelta(days=1)).isoformat()
-    last_month_start = first_of_this_month.replace(month=first_of_this_month.month - 1 if first_of_this_month.month > 1 else 12, 
-                                                    year=first_of_this_month.year if first_of_this_month.month > 1 else first_of_this_month.year - 1).isoformat()
-    
-    # Get all completed orders (case-insensitive status check)
-    all_orders = await db.orders.find({}).to_list(10000)
-    completed_orders = [o for o in all_orders if (o.get("status", "").lower() in ["completed", "delivered"])]
-    
-    # Get all products to map cost prices
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
-    
-    # Create variation cost price lookup
-    cost_lookup = {}
-    for product in products:
-        for var in product.get("variations", []):
-            key = f"{product['id']}_{var['id']}"
-            cost_lookup[key] = var.get("cost_price", 0) or 0
-    
-    # Calculate profits
-    def calculate_profit(orders):
-        total_revenue = 0
-        total_cost = 0
-        for order in orders:
-            total_revenue += order.get("total_amount", 0)
-            for item in order.get("items", []):
-                key = f"{item.get('product_id', '')}_{item.get('variation_id', '')}"
-                cost = cost_lookup.get(key, 0)
-                qty = item.get("quantity", 1)
-                total_cost += cost * qty
-        return {"revenue": total_revenue, "cost": total_cost, "profit": total_revenue - total_cost}
-    
-    # Filter orders by time periods
-    today_orders = [o for o in completed_orders if o.get("created_at", "") >= today_start]
-    week_orders = [o for o in completed_orders if o.get("created_at", "") >= week_ago]
-    month_orders = [o for o in completed_orders if o.get("created_at", "") >= month_ago]
-    last_month_orders = [o for o in completed_orders if last_month_start <= o.get("created_at", "") <= last_month_end]
-    
-    return {
-        "today": calculate_profit(today_orders),
-        "week": calculate_profit(week_orders),
-        "month": calculate_profit(month_orders),
-        "lastMonth": calculate_profit(last_month_orders),
-        "total": calculate_profit(completed_orders),
-        "all_time": calculate_profit(completed_orders)
-    }
+    """Get profit analytics: completed/delivered revenue less the item costs captured at sale (Nepal-local days)"""
+    return await daily_stats.profit()
 
 # ==================== GOOGLE SHEETS ====================
 
@@ -3118,35 +3130,124 @@ async def test_google_sheets(current_user: dict = Depends(get_current_user)):
     """Test Google Sheets connection"""
     return google_sheets_service.test_connection()
 
+SHEETS_SYNC_STALE_AFTER = timedelta(minutes=10)  # A running job that stopped reporting died with its worker
+sheets_resync_tasks = set()
+
+async def run_sheets_resync(job_id: str):
+    """Background job: diff customers and orders against the sheet and write only the changes"""
+    async def report(table, stats):
+        await db.sheet_sync_jobs.update_one(
+            {"id": job_id},
+            {"$set": {f"tables.{table}": stats, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    
+    sources = [
+        ("customers", db.customers, "email", google_sheets_service.customer_row),
+        ("orders", db.orders, "id", google_sheets_service.order_row),
+    ]
+    try:
+        for table, collection, key, row_fn in sources:
+            rows = {}
+            async for doc in collection.find({}, {"_id": 0}):
+                if doc.get(key):
+                    rows[doc[key]] = row_fn(doc)
+            await google_sheets_service.sheets_writer.resync(table, rows, lambda stats, table=table: report(table, stats))
+        status_fields = {"status": "completed"}
+    except Exception as e:
+        logger.error(f"Google Sheets resync failed: {e}")
+        status_fields = {"status": "failed", "error": str(e)}
+    now = datetime.now(timezone.utc).isoformat()
+    await db.sheet_sync_jobs.update_one({"id": job_id}, {"$set": {**status_fields, "finished_at": now, "updated_at": now}})
+
 @api_router.post("/google-sheets/sync-all")
 async def sync_all_to_sheets(current_user: dict = Depends(get_current_user)):
-    """Sync all customers and orders to Google Sheets"""
-    # Sync all customers
-    customers = await db.customers.find({}, {"_id": 0}).to_list(10000)
-    customers_synced = 0
-    for customer in customers:
-        try:
-            google_sheets_service.sync_customer_to_sheets(customer)
-            customers_synced += 1
-        except Exception as e:
-            logger.error(f"Failed to sync customer {customer.get('email')}: {e}")
-    
-    # Sync all orders
-    orders = await db.orders.find({}, {"_id": 0}).to_list(10000)
-    orders_synced = 0
-    for order in orders:
-        try:
-            google_sheets_service.sync_order_to_sheets(order)
-            orders_synced += 1
-        except Exception as e:
-            logger.error(f"Failed to sync order {order.get('id')}: {e}")
+    """Start a full diff-based resync of customers and orders; poll the returned job for progress"""
+    stale = (datetime.now(timezone.utc) - SHEETS_SYNC_STALE_AFTER).isoformat()
+    running = await db.sheet_sync_jobs.find_one(
+        {"status": "running", "updated_at": {"$gte": stale}}, {"_id": 0}
+    )
+    if running:
+        return {"success": True, "job": running, "message": "A resync is already running"}
     
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "tables": {},
+        "started_by": current_user.get("username") or current_user.get("email"),
+        "started_at": now,
+        "updated_at": now,
+    }
+    await db.sheet_sync_jobs.insert_one(job)
+    job.pop("_id", None)
+    task = asyncio.create_task(run_sheets_resync(job["id"]))
+    sheets_resync_tasks.add(task)  # Keep a reference until it finishes
+    task.add_done_callback(sheets_resync_tasks.discard)
+    return {"success": True, "job": job}
+
+@api_router.get("/google-sheets/export-status")
+async def get_export_status(current_user: dict = Depends(get_current_user)):
+    """Continuous export pipeline: source in use, rows exported by this worker, last error and saved position"""
+    if export_pipeline is None:
+        return {"enabled": False}
+    state = await db.export_state.find({"_id": {"$in": ["change_stream", "poll"]}}, {"updated_at": 1}).to_list(2)
     return {
-        "success": True,
-        "customers_synced": customers_synced,
-        "orders_synced": orders_synced
+        "enabled": True,
+        **export_pipeline.status,
+        "checkpoints": {doc["_id"]: doc.get("updated_at") for doc in state},
     }
 
+@api_router.get("/google-sheets/sync-all/{job_id}")
+async def get_sheets_sync_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Progress of a resync job: per-table phase and updated/added/unchanged counts"""
+    job = await db.sheet_sync_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job
+
+# ==================== DATA EXPORTS ====================
+
+@api_router.get("/exports/{kind}")
+async def export_data(
+    kind: str,
+    format: str = "csv",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Admin: stream every matching orders/customers/credit_logs document as csv, ndjson or parquet.
+    start/end are ISO dates or datetimes on created_at (end exclusive); status is comma-separated (orders only).
+    """
+    spec = data_exports.EXPORTS.get(kind)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {kind}")
+    if format not in data_exports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(data_exports.FORMATS)}")
+    if format == "parquet" and data_exports.pyarrow is None:
+        raise HTTPException(status_code=501, detail="Parquet export is not available on this server")
+    for value in (start, end):
+        if value:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    try:
+        query = data_exports.export_query(spec, start, end, statuses)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    media_type, extension = data_exports.FORMATS[format]
+    docs = data_exports.batches(db[spec.collection], query, spec.projection, spec.date_field)
+    filename = f"{kind}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{extension}"
+    return StreamingResponse(
+        data_exports.stream_export(spec, format, docs),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
 # ==================== SEO / SITEMAP ====================
 
 from fastapi.responses import Response
@@ -3286,29 +3387,38 @@ class CustomerProfileUpdate(BaseModel):
 async def customer_login(data: CustomerLogin):
     """Login/Register customer by phone number - sends OTP or validates"""
     phone = data.phone.strip().replace(" ", "").replace("-", "")
+    phone_key = normalize_phone(phone)
+    if not phone_key:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
     
     # Find or create customer
-    customer = await db.customers.find_one({"phone": phone})
+    customer = await db.customers.find_one({"phone_key": phone_key})
     
     if not data.otp:
         # Generate OTP (in production, send via SMS)
         import random
         otp = str(random.randint(100000, 999999))
         
+        otp_fields = {"otp": otp, "otp_expires": (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat()}
         if customer:
-            await db.customers.update_one({"phone": phone}, {"$set": {"otp": otp, "otp_expires": (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat()}})
+            await db.customers.update_one({"id": customer["id"]}, {"$set": otp_fields})
         else:
-            await db.customers.insert_one({
-                "id": str(uuid.uuid4()),
-                "phone": phone,
-                "name": None,
-                "email": None,
-                "otp": otp,
-                "otp_expires": (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat(),
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "total_orders": 0,
-                "total_spent": 0
-            })
+            try:
+                await insert_customer({
+                    "id": str(uuid.uuid4()),
+                    "phone": phone,
+                    "phone_key": phone_key,
+                    "name": None,
+                    "email": None,
+                    **otp_fields,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                    "total_orders": 0,
+                    "total_spent": 0
+                }, drop_taken_phone=False)
+            except DuplicateKeyError:
+                # A concurrent first login created this customer; the OTP goes on that record
+                await db.customers.update_one({"phone_key": phone_key}, {"$set": otp_fields})
         
         # In production, send OTP via SMS. For now, return it (dev mode)
         return {"message": "OTP sent", "dev_otp": otp}  # Remove dev_otp in production
@@ -3325,7 +3435,7 @@ async def customer_login(data: CustomerLogin):
             raise HTTPException(status_code=400, detail="OTP expired")
         
         # Clear OTP and generate token
-        await db.customers.update_one({"phone": phone}, {"$unset": {"otp": "", "otp_expires": ""}})
+        await db.customers.update_one({"id": customer["id"]}, {"$unset": {"otp": "", "otp_expires": ""}})
         
         token = jwt.encode(
             {"customer_id": customer["id"], "phone": phone, "exp": datetime.now(timezone.utc) + timedelta(days=30)},
@@ -3337,7 +3447,7 @@ async def customer_login(data: CustomerLogin):
             "token": token,
             "customer": {
                 "id": customer["id"],
-                "phone": customer["phone"],
+                "phone": customer.get("phone"),
                 "name": customer.get("name"),
                 "email": customer.get("email")
             }
@@ -3363,33 +3473,39 @@ async def sync_customers_from_takeapp(current_user: dict = Depends(get_current_u
                 continue
             
             phone = phone.strip().replace(" ", "").replace("-", "")
+            phone_key = normalize_phone(phone)
+            if not phone_key:
+                continue
             
             # Find or create customer
-            existing = await db.customers.find_one({"phone": phone})
+            existing = await db.customers.find_one({"phone_key": phone_key})
             
             order_amount = float(order.get("total", 0) or 0)
             
             if existing:
                 # Update stats
                 await db.customers.update_one(
-                    {"phone": phone},
+                    {"phone_key": phone_key},
                     {
                         "$inc": {"total_orders": 1, "total_spent": order_amount},
                         "$set": {
                             "name": order.get("customer_name") or existing.get("name"),
                             "email": order.get("customer_email") or existing.get("email"),
-                            "last_order_at": order.get("created_at") or datetime.now(timezone.utc).isoformat()
+                            "last_order_at": order.get("created_at") or datetime.now(timezone.utc).isoformat(),
+                            "updated_at": datetime.now(timezone.utc).isoformat()
                         }
                     }
                 )
             else:
                 # Create new customer
-                await db.customers.insert_one({
+                await insert_customer({
                     "id": str(uuid.uuid4()),
                     "phone": phone,
+                    "phone_key": phone_key,
                     "name": order.get("customer_name"),
                     "email": order.get("customer_email"),
                     "created_at": datetime.now(timezone.utc).isoformat(),
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
                     "total_orders": 1,
                     "total_spent": order_amount,
                     "last_order_at": order.get("created_at"),
@@ -3403,9 +3519,12 @@ async def sync_customers_from_takeapp(current_user: dict = Depends(get_current_u
 async def get_all_customers(current_user: dict = Depends(get_current_user)):
     """Admin: Get all customers with order stats"""
     customers = await db.customers.find({}, {"_id": 0, "otp": 0, "otp_expires": 0}).sort("created_at", -1).to_list(1000)
+    emails = [c["email"] for c in customers if c.get("email")]
+    phone_keys = [c["phone_key"] for c in customers if c.get("phone_key")]
     
-    # Get order stats for all customers
+    # Get order stats for the listed customers
     order_stats = await db.orders.aggregate([
+        {"$match": {"customer_email": {"$in": emails}}},
         {"$group": {
             "_id": "$customer_email",
             "total_orders": {"$sum": 1},
@@ -3419,8 +3538,9 @@ async def get_all_customers(current_user: dict = Depends(get_current_user)):
     
     # Also aggregate by phone for customers without email
     phone_stats = await db.orders.aggregate([
+        {"$match": {"phone_key": {"$in": phone_keys}}},
         {"$group": {
-            "_id": "$customer_phone",
+            "_id": "$phone_key",
             "total_orders": {"$sum": 1},
             "total_spent": {"$sum": "$total_amount"}
         }}
@@ -3430,11 +3550,8 @@ async def get_all_customers(current_user: dict = Depends(get_current_user)):
     
     # Merge order stats into customers
     for customer in customers:
-        email = customer.get("email")
-        phone = customer.get("phone") or customer.get("whatsapp_number")
-        
         # Try to find stats by email first, then by phone
-        stats = stats_by_email.get(email) or stats_by_phone.get(phone) or {}
+        stats = stats_by_email.get(customer.get("email")) or stats_by_phone.get(customer.get("phone_key")) or {}
         
         customer["total_orders"] = stats.get("total_orders", 0)
         customer["total_spent"] = stats.get("total_spent", 0)
@@ -3443,7 +3560,7 @@ async def get_all_customers(current_user: dict = Depends(get_current_user)):
         if not customer.get("phone") and stats.get("phone"):
             customer["phone"] = stats.get("phone")
     
-    return customers
+    return trusted_response(customers)
 
 # ==================== DAILY REWARDS ====================
 
@@ -3456,6 +3573,8 @@ class DailyRewardSettings(BaseModel):
         "30": 200  # 30 day streak bonus
     }
 
+config.register("daily_reward_settings", db.daily_reward_settings, {"id": "main"}, DailyRewardSettings)
+
 def get_nepal_date():
     """Get current date in Nepal timezone (UTC+5:45)"""
     nepal_offset = timedelta(hours=5, minutes=45)
@@ -3491,16 +3610,7 @@ async def get_active_multiplier_value(event_type: str = None) -> float:
 @api_router.get("/daily-reward/settings")
 async def get_daily_reward_settings():
     """Get daily reward settings (public)"""
-    settings = await db.daily_reward_settings.find_one({"id": "main"}, {"_id": 0})
-    if not settings:
-        settings = {
-            "id": "main",
-            "is_enabled": True,
-            "reward_amount": 10.0,
-            "streak_bonus_enabled": True,
-            "streak_milestones": {"7": 50, "30": 200}
-        }
-    return settings
+    return await config.get("daily_reward_settings")
 
 @api_router.put("/daily-reward/settings")
 async def update_daily_reward_settings(settings: DailyRewardSettings, current_user: dict = Depends(get_current_user)):
@@ -3508,19 +3618,13 @@ async def update_daily_reward_settings(settings: DailyRewardSettings, current_us
     settings_dict = settings.model_dump()
     settings_dict["id"] = "main"
     await db.daily_reward_settings.update_one({"id": "main"}, {"$set": settings_dict}, upsert=True)
+    await config.invalidate("daily_reward_settings")
     return settings_dict
 
 @api_router.get("/daily-reward/status")
 async def get_daily_reward_status(email: str):
     """Check if customer can claim daily reward and their streak"""
-    settings = await db.daily_reward_settings.find_one({"id": "main"})
-    if not settings:
-        settings = {
-            "is_enabled": True,
-            "reward_amount": 10.0,
-            "streak_bonus_enabled": True,
-            "streak_milestones": {"7": 50, "30": 200}
-        }
+    settings = await config.get("daily_reward_settings")
     
     if not settings.get("is_enabled", True):
         return {"can_claim": False, "reason": "Daily rewards are disabled", "streak": 0}
@@ -3563,7 +3667,7 @@ async def get_daily_reward_status(email: str):
 @api_router.post("/daily-reward/claim")
 async def claim_daily_reward(email: str):
     """Claim daily login reward"""
-    settings = await db.daily_reward_settings.find_one({"id": "main"})
+    settings = await config.get("daily_reward_settings", defaults=False)
     if not settings or not settings.get("is_enabled", True):
         raise HTTPException(status_code=400, detail="Daily rewards are disabled")
     
@@ -3618,7 +3722,8 @@ async def claim_daily_reward(email: str):
         {"$set": {
             "credit_balance": new_balance,
             "last_daily_reward_date": today,
-            "daily_reward_streak": current_streak
+            "daily_reward_streak": current_streak,
+            "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
     
@@ -3664,20 +3769,12 @@ class ReferralSettings(BaseModel):
     min_purchase_required: bool = False  # Require purchase to earn referral bonus
     min_purchase_amount: float = 0
 
+config.register("referral_settings", db.referral_settings, {"id": "main"}, ReferralSettings)
+
 @api_router.get("/referral/settings")
 async def get_referral_settings():
     """Get referral program settings"""
-    settings = await db.referral_settings.find_one({"id": "main"}, {"_id": 0})
-    if not settings:
-        settings = {
-            "id": "main",
-            "is_enabled": True,
-            "referrer_reward": 50.0,
-            "referee_reward": 25.0,
-            "min_purchase_required": False,
-            "min_purchase_amount": 0
-        }
-    return settings
+    return await config.get("referral_settings")
 
 @api_router.put("/referral/settings")
 async def update_referral_settings(settings: ReferralSettings, current_user: dict = Depends(get_current_user)):
@@ -3685,6 +3782,7 @@ async def update_referral_settings(settings: ReferralSettings, current_user: dic
     settings_dict = settings.model_dump()
     settings_dict["id"] = "main"
     await db.referral_settings.update_one({"id": "main"}, {"$set": settings_dict}, upsert=True)
+    await config.invalidate("referral_settings")
     return settings_dict
 
 @api_router.get("/referral/code/{email}")
@@ -3706,7 +3804,7 @@ async def get_referral_code(email: str):
         
         await db.customers.update_one(
             {"email": email.lower()},
-            {"$set": {"referral_code": referral_code}}
+            {"$set": {"referral_code": referral_code, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
     
     # Get referral stats
@@ -3729,7 +3827,7 @@ async def get_referral_code(email: str):
 @api_router.post("/referral/apply")
 async def apply_referral_code(referee_email: str, referral_code: str):
     """Apply a referral code for a new user"""
-    settings = await db.referral_settings.find_one({"id": "main"})
+    settings = await config.get("referral_settings", defaults=False)
     if not settings or not settings.get("is_enabled", True):
         raise HTTPException(status_code=400, detail="Referral program is currently disabled")
     
@@ -3771,7 +3869,8 @@ async def apply_referral_code(referee_email: str, referral_code: str):
         {"$set": {
             "credit_balance": referee_balance + referee_reward,
             "referred_by": referrer["email"],
-            "referred_by_code": referral_code.upper()
+            "referred_by_code": referral_code.upper(),
+            "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
     
@@ -3790,7 +3889,7 @@ async def apply_referral_code(referee_email: str, referral_code: str):
         referrer_balance = referrer.get("credit_balance", 0)
         await db.customers.update_one(
             {"email": referrer["email"]},
-            {"$set": {"credit_balance": referrer_balance + referrer_reward}}
+            {"$set": {"credit_balance": referrer_balance + referrer_reward, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
         
         await db.credit_logs.insert_one({
@@ -3920,6 +4019,43 @@ async def delete_multiplier_event(event_id: str, current_user: dict = Depends(ge
         raise HTTPException(status_code=404, detail="Event not found")
     return {"message": "Event deleted"}
 
+# ==================== PROFILER ROUTES ====================
+
+@api_router.get("/admin/profiler")
+async def get_profiler_config(current_user: dict = Depends(get_current_user)):
+    """Get live profiler settings - main admin only"""
+    if not current_user.get("is_main_admin"):
+        raise HTTPException(status_code=403, detail="Only main admin can use the profiler")
+    return profiler.config
+
+@api_router.put("/admin/profiler")
+async def update_profiler_config(config: ProfilerConfig, current_user: dict = Depends(get_current_user)):
+    """Enable/disable profiling for routes or a 1-in-N sample of requests, takes effect immediately"""
+    if not current_user.get("is_main_admin"):
+        raise HTTPException(status_code=403, detail="Only main admin can use the profiler")
+    profiler.config = config
+    logger.info(f"Profiler config updated by {current_user.get('username')}: {config.model_dump()}")
+    return profiler.config
+
+@api_router.get("/admin/profiler/profiles")
+async def list_profiles(limit: int = 100, current_user: dict = Depends(get_current_user)):
+    """List captured profiles, newest first"""
+    if not current_user.get("is_main_admin"):
+        raise HTTPException(status_code=403, detail="Only main admin can use the profiler")
+    return await profiler.list_profiles(min(limit, 1000))
+
+@api_router.get("/admin/profiler/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "collapsed", current_user: dict = Depends(get_current_user)):
+    """Download a profile as collapsed stacks (flamegraph.pl) or speedscope JSON"""
+    if not current_user.get("is_main_admin"):
+        raise HTTPException(status_code=403, detail="Only main admin can use the profiler")
+    profile = await profiler.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "speedscope":
+        return to_speedscope(profile["collapsed"], f"{profile['method']} {profile['route']}", profile["interval_ms"])
+    return PlainTextResponse(profile["collapsed"])
+
 # ==================== ROOT ====================
 
 @api_router.get("/")
@@ -3929,6 +4065,24 @@ async def root():
 # Include router
 app.include_router(api_router)
 
+# HTTP caching for public storefront reads (inside CORS so 304s get CORS headers)
+HTTP_CACHE_POLICIES = [
+    ("/api/settings", CachePolicy(("site_settings",))),
+    ("/api/payment-methods", CachePolicy(("payment_methods",))),
+    ("/api/notification-bar", CachePolicy(("notification_bar",), max_age=30, stale_while_revalidate=60)),
+    ("/api/faqs", CachePolicy(("faqs",), max_age=60, stale_while_revalidate=3600)),
+    ("/api/social-links", CachePolicy(("social_links",), max_age=300, stale_while_revalidate=86400)),
+    ("/api/pages/*", CachePolicy(("pages",), max_age=60, stale_while_revalidate=3600)),
+    ("/api/categories", CachePolicy(("categories",), max_age=60, stale_while_revalidate=600)),
+    ("/api/blog/all/*", None),
+    ("/api/blog", CachePolicy(("blog_posts",), max_age=60, stale_while_revalidate=600)),
+    ("/api/blog/*", CachePolicy(("blog_posts",), max_age=60, stale_while_revalidate=600)),
+    ("/api/reviews", CachePolicy(("reviews",), max_age=60, stale_while_revalidate=3600)),
+]
+CACHED_RESOURCES = sorted({r for _, policy in HTTP_CACHE_POLICIES if policy for r in policy.resources})
+
+app.add_middleware(HTTPCacheMiddleware, store=versions, policies=HTTP_CACHE_POLICIES)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -3938,6 +4092,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compression (outermost, so every middleware's output is compressed)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+)
+
+@app.on_event("startup")
+async def create_db_indexes():
+    # Idempotent; set AUTO_CREATE_INDEXES=false to manage indexes with db_indexes.py instead
+    if os.environ.get("AUTO_CREATE_INDEXES", "true").lower() == "false":
+        return
+    try:
+        await ensure_indexes(db)
+    except PyMongoError as e:
+        # e.g. MongoDB unreachable at boot: start anyway and let requests fail individually
+        logger.error(f"Failed to ensure indexes: {e}")
+
+@app.on_event("startup")
+async def build_daily_stats():
+    # One-off backfill for databases from before the rollups; afterwards use `python daily_stats.py rebuild`
+    await daily_stats.ensure_built()
+
+@app.on_event("startup")
+async def start_version_store():
+    await versions.start(sorted(set(CACHED_RESOURCES) | set(config.resources)))
+
+@app.on_event("startup")
+async def start_campaign_sender():
+    await campaigns.start()
+
+@app.on_event("startup")
+async def start_export_pipeline():
+    if export_pipeline:
+        await export_pipeline.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if export_pipeline:
+        await export_pipeline.stop()
+    await campaigns.stop()
+    await versions.stop()
+    await smtp_pool.close()
+    await imgbb.close()
+    await google_sheets_service.sheets_writer.flush()
     client.close()
@@ -0,0 +1,8 @@
+"""
+Shared pytest setup for backend tests
+Makes the flat backend modules (server, email_service, ...) importable
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
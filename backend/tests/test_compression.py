@@ -0,0 +1,121 @@
+"""
+Unit Tests for Response Compression
+Tests: Accept-Encoding negotiation, thresholds, skipped responses, streaming
+"""
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding
+
+BIG_JSON = {"items": [{"id": i, "name": f"Product {i}"} for i in range(200)]}
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/big")
+    async def big():
+        return BIG_JSON
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" + b"\0" * 5000, media_type="image/png")
+
+    @app.get("/partial")
+    async def partial():
+        return PlainTextResponse("x" * 5000, status_code=206)
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(100):
+                yield f'{{"row": {i}}}\n'
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+class TestNegotiation:
+    """Accept-Encoding parsing"""
+
+    def test_prefers_brotli(self):
+        assert choose_encoding("gzip, deflate, br") == "br"
+
+    def test_q_values(self):
+        assert choose_encoding("br;q=0.5, gzip") == "gzip"
+        assert choose_encoding("gzip;q=0, br;q=0") is None
+
+    def test_without_brotli(self):
+        assert choose_encoding("br, gzip", brotli_available=False) == "gzip"
+
+    def test_identity_only(self):
+        assert choose_encoding("") is None
+        assert choose_encoding("identity") is None
+
+
+class TestCompressionMiddleware:
+    """End-to-end through a small app"""
+
+    def test_gzip_large_json(self):
+        response = make_client().get("/big", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == BIG_JSON
+
+    def test_brotli_large_json(self):
+        pytest.importorskip("brotli")
+        response = make_client().get("/big", headers={"Accept-Encoding": "br"})
+        assert response.headers["content-encoding"] == "br"
+        assert int(response.headers["content-length"]) < len(str(BIG_JSON))
+
+    def test_small_body_not_compressed(self):
+        response = make_client().get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert response.json() == {"ok": True}
+
+    def test_images_and_partial_content_untouched(self):
+        client = make_client()
+        for path in ("/image", "/partial"):
+            response = client.get(path, headers={"Accept-Encoding": "gzip"})
+            assert "content-encoding" not in response.headers
+
+    def test_streaming_is_compressed_incrementally(self):
+        client = make_client()
+        with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            assert response.headers["content-encoding"] == "gzip"
+            assert "content-length" not in response.headers
+            raw = b"".join(response.iter_raw())
+        assert gzip.decompress(raw).decode().count("\n") == 100
+
+    def test_sync_flush_makes_each_chunk_decodable(self):
+        from compression import _Compressor
+        compressor = _Compressor("gzip", 6, 4)
+        decoder = zlib.decompressobj(31)
+        assert decoder.decompress(compressor.compress(b"first chunk")) == b"first chunk"
+
+    def test_small_chunked_body_not_compressed(self):
+        app = FastAPI()
+        app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+        @app.middleware("http")
+        async def passthrough(request, call_next):
+            # BaseHTTPMiddleware re-streams every response in chunks
+            return await call_next(request)
+
+        @app.get("/small")
+        async def small():
+            return {"ok": True}
+
+        response = TestClient(app).get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["content-length"] == str(len(response.content))
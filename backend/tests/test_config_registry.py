@@ -0,0 +1,103 @@
+"""
+Unit Tests for the Configuration Registry
+Tests: typed defaults, in-memory hits, invalidation across workers
+"""
+import asyncio
+
+from pydantic import BaseModel
+
+from config_registry import ConfigRegistry
+from resource_versions import VersionStore
+
+
+class FakeCollection:
+    """Motor-like collection with a single filter-matched document store"""
+
+    def __init__(self, docs=None):
+        self.docs = docs or []
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in query.items()):
+                return dict(doc)
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in query.items()):
+                doc.update(update.get("$set", {}))
+                return
+        self.docs.append({**query, **update.get("$set", {})})
+
+
+class RewardSettings(BaseModel):
+    is_enabled: bool = True
+    reward_amount: float = 10.0
+
+
+def make_worker(versions_collection, settings):
+    versions = VersionStore(db={"resource_versions": versions_collection})
+    registry = ConfigRegistry(versions)
+    registry.register("rewards", settings, {"id": "main"}, RewardSettings)
+    registry.register("bar", settings, {"is_active": True})
+    return versions, registry
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestConfigRegistry:
+    """Singleton settings cache"""
+
+    def test_missing_document_returns_typed_defaults(self):
+        _, registry = make_worker(FakeCollection(), FakeCollection())
+        assert run(registry.get("rewards")) == {"id": "main", "is_enabled": True, "reward_amount": 10.0}
+
+    def test_missing_document_without_model_is_none(self):
+        _, registry = make_worker(FakeCollection(), FakeCollection())
+        assert run(registry.get("bar")) is None
+
+    def test_gates_see_missing_document_as_none(self):
+        versions, registry = make_worker(FakeCollection(), FakeCollection())
+        run(versions.bump("rewards"))
+        assert run(registry.get("rewards", defaults=False)) is None
+        assert run(registry.get("rewards"))["is_enabled"] is True  # Same cached read, defaults merged
+
+    def test_stored_values_override_defaults(self):
+        settings = FakeCollection([{"id": "main", "reward_amount": 25.0}])
+        _, registry = make_worker(FakeCollection(), settings)
+        assert run(registry.get("rewards"))["reward_amount"] == 25.0
+
+    def test_reads_are_served_from_memory(self):
+        settings = FakeCollection([{"id": "main", "reward_amount": 25.0}])
+        versions, registry = make_worker(FakeCollection(), settings)
+        run(versions.bump("rewards"))
+        for _ in range(5):
+            run(registry.get("rewards"))
+        assert settings.reads == 1
+
+    def test_callers_cannot_mutate_cache(self):
+        versions, registry = make_worker(FakeCollection(), FakeCollection())
+        run(versions.bump("rewards"))
+        run(registry.get("rewards"))["is_enabled"] = False
+        assert run(registry.get("rewards"))["is_enabled"] is True
+
+    def test_invalidate_reaches_other_workers_after_poll(self):
+        shared_versions = FakeCollection()
+        settings = FakeCollection([{"id": "main", "reward_amount": 25.0}])
+        versions_a, worker_a = make_worker(shared_versions, settings)
+        versions_b, worker_b = make_worker(shared_versions, settings)
+        run(versions_a.bump("rewards"))
+        versions_b._versions.update(versions_a._versions)  # As a poll would
+        assert run(worker_b.get("rewards"))["reward_amount"] == 25.0
+
+        run(settings.update_one({"id": "main"}, {"$set": {"reward_amount": 40.0}}))
+        run(worker_a.invalidate("rewards"))
+        assert run(worker_a.get("rewards"))["reward_amount"] == 40.0
+        assert run(worker_b.get("rewards"))["reward_amount"] == 25.0
+
+        versions_b._versions.update(versions_a._versions)
+        assert run(worker_b.get("rewards"))["reward_amount"] == 40.0
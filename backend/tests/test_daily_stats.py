@@ -0,0 +1,154 @@
+"""
+Unit Tests for Daily Stats Rollups
+Tests: Nepal-local day bucketing, overview windows, per-order deltas, profit
+from captured costs, incremental rollups agree with a rebuild (needs TEST_MONGO_URL)
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from daily_stats import DailyStats, cost_total, nepal_day, order_counters, summarize, summarize_profit, windows
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+
+class TestNepalDay:
+    def test_evening_utc_is_next_day_in_nepal(self):
+        assert nepal_day("2025-01-31T18:14:59+00:00") == "2025-01-31"
+        assert nepal_day("2025-01-31T18:15:00+00:00") == "2025-02-01"
+        assert nepal_day(datetime(2025, 1, 31, 18, 15, tzinfo=timezone.utc)) == "2025-02-01"
+
+    def test_naive_and_bad_values(self):
+        assert nepal_day("2025-01-31T18:15:00") == "2025-02-01"  # Naive timestamps are UTC
+        assert nepal_day("2025-01-31T18:15:00Z") == "2025-02-01"
+        assert nepal_day("not a date") is None
+
+
+class TestOverview:
+    def test_windows(self):
+        assert windows("2025-03-05") == {
+            "today": ("2025-03-05", "2025-03-05"),
+            "week": ("2025-02-27", "2025-03-05"),
+            "month": ("2025-02-04", "2025-03-05"),
+            "lastMonth": ("2025-02-01", "2025-02-28"),
+        }
+        assert windows("2025-01-10")["lastMonth"] == ("2024-12-01", "2024-12-31")
+
+    def test_summarize(self):
+        rows = [
+            {"_id": "2025-03-05", "orders": 2, "revenue": 300, "visits": 10},
+            {"_id": "2025-03-01", "orders": 1, "revenue": 50, "visits": 4},
+            {"_id": "2025-02-10", "orders": 5, "revenue": 1000, "visits": 20},
+        ]
+        result = summarize(rows, {"orders": 100, "revenue": 9000, "visits": 500}, "2025-03-05")
+        assert result["today"] == {"orders": 2, "revenue": 300}
+        assert result["week"] == {"orders": 3, "revenue": 350}
+        assert result["month"] == {"orders": 8, "revenue": 1350}
+        assert result["lastMonth"] == {"orders": 5, "revenue": 1000}
+        assert result["total"] == {"orders": 100, "revenue": 9000}
+        assert result["visits"] == {"today": 10, "week": 14, "month": 34, "lastMonth": 20, "total": 500}
+
+    def test_cancelled_orders_count_but_earn_nothing(self):
+        assert order_counters({"status": "pending", "total_amount": 250}) == {"orders": 1, "revenue": 250}
+        assert order_counters({"status": "Cancelled", "total_amount": 250}) == {"orders": 1, "cancelled": 1}
+        assert order_counters({"status": "pending", "total_amount": 250}, sign=-1) == {"orders": -1, "revenue": -250}
+
+
+class FakeCollection:
+    def __init__(self):
+        self.updates = []
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates.append((query["_id"], update["$inc"]))
+
+
+class TestProfit:
+    ORDER = {"status": "Confirmed", "total_amount": 500, "cost_total": 320, "created_at": "2025-03-05T06:00:00+00:00"}
+
+    def status_change(self, order, new_status):
+        stats = DailyStats({"daily_stats": FakeCollection()})
+        asyncio.run(stats.order_status_changed(order, new_status))
+        return stats.collection.updates
+
+    def test_completion_books_revenue_and_cost(self):
+        assert self.status_change(self.ORDER, "Completed") == [("2025-03-05", {"completed_revenue": 500, "cost": 320})]
+        assert self.status_change(self.ORDER, "processing") == []
+
+    def test_cancelling_a_delivered_order_reverses_everything(self):
+        delivered = {**self.ORDER, "status": "delivered"}
+        [(_, delta)] = self.status_change(delivered, "cancelled")
+        assert delta == {"revenue": -500, "cancelled": 1, "completed_revenue": -500, "cost": -320}
+
+    def test_cost_total_uses_captured_prices(self):
+        items = [{"cost_price": 80, "quantity": 2}, {"cost_price": None, "quantity": 1}, {"cost_price": 15}]
+        assert cost_total(items) == 175
+
+    def test_summarize_profit(self):
+        rows = [{"_id": "2025-03-05", "completed_revenue": 500, "cost": 320}]
+        result = summarize_profit(rows, {"completed_revenue": 2000, "cost": 1500}, "2025-03-05")
+        assert result["today"] == {"revenue": 500, "cost": 320, "profit": 180}
+        assert result["lastMonth"] == {"revenue": 0, "cost": 0, "profit": 0}
+        assert result["total"] == result["all_time"] == {"revenue": 2000, "cost": 1500, "profit": 500}
+
+
+@pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+class TestRollups:
+    """The incremental write path and a rebuild from raw collections agree"""
+
+    def test_incremental_matches_rebuild(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def scenario():
+            client = AsyncIOMotorClient(TEST_MONGO_URL)
+            db = client[f"stats_{uuid.uuid4().hex[:12]}"]
+            stats = DailyStats(db)
+            try:
+                orders = [
+                    {"id": "a", "status": "pending", "total_amount": 100, "created_at": "2025-01-31T10:00:00.123456+00:00"},
+                    {"id": "b", "status": "pending", "total_amount": 40, "created_at": "2025-01-31T19:00:00+00:00"},
+                    {"id": "c", "status": "pending", "total_amount": 60, "created_at": "2025-02-01T01:00:00+00:00"},
+                    {"id": "d", "status": "pending", "total_amount": 90, "cost_total": 70, "created_at": "2025-02-01T02:00:00+00:00"},
+                ]
+                for order in orders:
+                    await db.orders.insert_one(dict(order))
+                    await stats.order_created(order)
+                await db.orders.update_one({"id": "c"}, {"$set": {"status": "cancelled"}})
+                await stats.order_status_changed(orders[2], "cancelled")
+                await db.orders.update_one({"id": "d"}, {"$set": {"status": "Completed"}})
+                await stats.order_status_changed(orders[3], "Completed")
+                await db.orders.delete_one({"id": "a"})
+                await stats.order_deleted(orders[0])
+                await db.visits.insert_many([
+                    {"visitor_id": "v1", "date": "2025-02-01", "created_at": "2025-02-01T03:00:00+00:00"},
+                    {"visitor_id": "v2", "date": "2025-02-01", "created_at": "2025-02-01T04:00:00+00:00"},
+                ])
+                await stats.visit("2025-02-01")
+                await stats.visit("2025-02-01")
+
+                fields = ("orders", "revenue", "cancelled", "visits", "completed_revenue", "cost")
+                incremental = {
+                    row["_id"]: [row.get(f, 0) for f in fields]
+                    async for row in db.daily_stats.find({})
+                    if any(row.get(f) for f in fields)  # Deleting the only order leaves a zeroed row
+                }
+                assert await stats.rebuild() == 1
+                rebuilt = await db.daily_stats.find({}, {"updated_at": 0}).to_list(None)
+                assert rebuilt == [{
+                    "_id": "2025-02-01", "orders": 3, "revenue": 130, "cancelled": 1, "visits": 2,
+                    "completed_revenue": 90, "cost": 70,
+                }]
+                assert incremental == {"2025-02-01": [3, 130, 1, 2, 90, 70]}
+
+                overview = await stats.overview(datetime(2025, 2, 2, tzinfo=timezone.utc))
+                assert overview["week"] == {"orders": 3, "revenue": 130}
+                assert overview["visits"]["total"] == 2
+                profit = await stats.profit(datetime(2025, 2, 2, tzinfo=timezone.utc))
+                assert profit["week"] == {"revenue": 90, "cost": 70, "profit": 20}
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+
+        asyncio.run(scenario())
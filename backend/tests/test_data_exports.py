@@ -0,0 +1,110 @@
+"""
+Unit Tests for Streaming Data Exports
+Tests: query filters, CSV/NDJSON/Parquet encoding batch by batch, cursor batching
+"""
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+
+from data_exports import EXPORTS, batches, export_query, stream_export
+
+ORDERS = EXPORTS["orders"]
+
+
+def order(i, status="completed"):
+    return {"id": f"o-{i}", "customer_name": f"Name, {i}", "total_amount": 100 + i, "status": status}
+
+
+async def doc_batches(*groups):
+    for group in groups:
+        yield group
+
+
+def export(fmt, *groups):
+    async def collect():
+        return [chunk async for chunk in stream_export(ORDERS, fmt, doc_batches(*groups))]
+    return asyncio.run(collect())
+
+
+class TestExportQuery:
+    def test_date_range_and_statuses(self):
+        query = export_query(ORDERS, "2025-01-01", "2025-02-01", ["completed", "pending"])
+        assert query == {
+            "created_at": {"$gte": "2025-01-01", "$lt": "2025-02-01"},
+            "status": {"$in": ["completed", "pending"]},
+        }
+        assert export_query(ORDERS) == {}
+
+    def test_status_filter_needs_status_field(self):
+        with pytest.raises(ValueError, match="customers"):
+            export_query(EXPORTS["customers"], statuses=["completed"])
+
+
+class TestEncoders:
+    """One chunk per batch, so nothing larger than a batch is held"""
+
+    def test_csv(self):
+        chunks = export("csv", [order(1), order(2)], [order(3)])
+        assert len(chunks) == 3  # Header, then one per batch
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        assert rows[0][:3] == ["id", "takeapp_order_number", "customer_name"]
+        assert [row[2] for row in rows[1:]] == ["Name, 1", "Name, 2", "Name, 3"]
+
+    def test_ndjson(self):
+        chunks = export("ndjson", [order(1)], [order(2, "pending")])
+        records = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        assert [(r["id"], r["status"], r["total_amount"]) for r in records] == [("o-1", "completed", 101), ("o-2", "pending", 102)]
+        assert records[0]["remark"] is None
+
+    def test_parquet_row_group_per_batch(self):
+        pq = pytest.importorskip("pyarrow.parquet")
+        data = b"".join(export("parquet", [order(1), order(2)], [{**order(3), "total_amount": "n/a"}]))
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        assert parquet.num_row_groups == 2
+        table = parquet.read()
+        assert table.column("id").to_pylist() == ["o-1", "o-2", "o-3"]
+        assert table.column("total_amount").to_pylist() == [101.0, 102.0, None]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.closed = False
+
+    def sort(self, field, direction):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.cursor = FakeCursor(docs)
+
+    def find(self, query, projection):
+        return self.cursor
+
+
+class TestBatches:
+    def test_groups_cursor_and_closes_it(self):
+        collection = FakeCollection([order(i) for i in range(5)])
+
+        async def collect():
+            return [len(batch) async for batch in batches(collection, {}, {}, "created_at", batch_size=2)]
+
+        assert asyncio.run(collect()) == [2, 2, 1]
+        assert collection.cursor.closed
@@ -0,0 +1,38 @@
+"""
+Unit Tests for the Index Manifest
+Tests: manifest consistency, COLLSCAN detection in explain() plans
+"""
+from db_indexes import INDEXES, QUERY_SHAPES, find_collscan
+
+
+class TestManifest:
+    """Manifest is well formed"""
+
+    def test_index_names_unique_per_collection(self):
+        for collection, models in INDEXES.items():
+            names = [model.document["name"] for model in models]
+            assert len(names) == len(set(names)), collection
+
+    def test_query_shapes_target_indexed_collections(self):
+        for collection, _, _ in QUERY_SHAPES:
+            assert collection in INDEXES
+
+    def test_upsert_dedupe_keys_are_unique(self):
+        # track_visit counts a visit only when its upsert inserted the row
+        unique = {model.document["name"]: model.document.get("unique") for model in INDEXES["visits"]}
+        assert unique["visitor_date_unique"] is True
+
+
+class TestFindCollscan:
+    """Plan tree walking"""
+
+    def test_index_scan(self):
+        plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "id_unique"}}
+        assert find_collscan(plan) is False
+
+    def test_nested_collscan_in_or_branch(self):
+        plan = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+            {"stage": "IXSCAN"},
+            {"stage": "COLLSCAN"},
+        ]}}
+        assert find_collscan(plan) is True
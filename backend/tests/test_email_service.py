@@ -0,0 +1,179 @@
+"""
+Unit Tests for Async SMTP Delivery
+Tests: connection reuse, pool size, reconnect after server disconnect, send timeout,
+STARTTLS required by default
+"""
+import asyncio
+import base64
+
+import aiosmtplib
+import pytest
+
+import email_service
+from email_service import SMTPPool, build_message
+
+
+class FakeSMTPServer:
+    """Minimal local SMTP server: EHLO, AUTH PLAIN, MAIL/RCPT/DATA, RSET, NOOP, QUIT"""
+
+    def __init__(self, hang_on_data=False):
+        self.hang_on_data = hang_on_data
+        self.connections = 0
+        self.logins = []
+        self.messages = []
+        self.writers = []
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.drop_connections()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_connections(self):
+        for writer in self.writers:
+            writer.close()
+        self.writers.clear()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+
+        def reply(line):
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 localhost ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command = line.decode().strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    reply("250-localhost")
+                    reply("250 AUTH PLAIN")
+                elif verb == "AUTH":
+                    credentials = base64.b64decode(command.split()[-1]).split(b"\0")
+                    self.logins.append(credentials[1].decode())
+                    reply("235 Authentication successful")
+                elif verb == "DATA":
+                    if self.hang_on_data:
+                        await asyncio.sleep(3600)
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = b""
+                    while not data.endswith(b"\r\n.\r\n"):
+                        data += await reader.readline()
+                    self.messages.append(data.decode())
+                    reply("250 Queued")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    writer.close()
+                    return
+                else:
+                    reply("250 OK")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+def run(scenario, **server_options):
+    async def runner():
+        server = FakeSMTPServer(**server_options)
+        await server.start()
+        try:
+            await scenario(server)
+        finally:
+            await server.stop()
+
+    asyncio.run(runner())
+
+
+def message(n=0):
+    return build_message(f"customer{n}@example.com", f"Order #{n}", f"<p>Order {n}</p>", f"Order {n}")
+
+
+class TestSMTPPool:
+    """Authenticated connections are reused and replaced on failure"""
+
+    def test_sequential_sends_reuse_one_connection(self):
+        async def scenario(server):
+            pool = SMTPPool("127.0.0.1", server.port, "shop@example.com", "secret", start_tls=False)
+            for n in range(5):
+                await pool.send(message(n))
+            await pool.close()
+            assert server.connections == 1
+            assert server.logins == ["shop@example.com"]
+            assert len(server.messages) == 5
+            assert "Subject: Order #4" in server.messages[-1]
+
+        run(scenario)
+
+    def test_concurrent_sends_bounded_by_pool_size(self):
+        async def scenario(server):
+            pool = SMTPPool("127.0.0.1", server.port, "shop@example.com", "secret", size=2, start_tls=False)
+            await asyncio.gather(*[pool.send(message(n)) for n in range(8)])
+            await pool.close()
+            assert server.connections <= 2
+            assert len(server.messages) == 8
+
+        run(scenario)
+
+    def test_reconnects_after_server_drops_idle_connection(self):
+        async def scenario(server):
+            pool = SMTPPool("127.0.0.1", server.port, "shop@example.com", "secret", start_tls=False)
+            await pool.send(message(1))
+            server.drop_connections()
+            await asyncio.sleep(0.05)
+            await pool.send(message(2))
+            await pool.close()
+            assert server.connections == 2
+            assert len(server.messages) == 2
+
+        run(scenario)
+
+    def test_send_times_out(self):
+        async def scenario(server):
+            pool = SMTPPool("127.0.0.1", server.port, "shop@example.com", "secret", timeout=0.3, start_tls=False)
+            started = asyncio.get_running_loop().time()
+            with pytest.raises(aiosmtplib.SMTPTimeoutError):
+                await pool.send(message())
+            assert asyncio.get_running_loop().time() - started < 2
+            await pool.close()
+
+        run(scenario, hang_on_data=True)
+
+
+    def test_refuses_server_without_starttls(self):
+        async def scenario(server):
+            pool = SMTPPool("127.0.0.1", server.port, "shop@example.com", "secret")
+            with pytest.raises(aiosmtplib.SMTPException):
+                await pool.send(message())
+            await pool.close()
+            assert server.logins == [] and server.messages == []
+
+        run(scenario)
+
+
+class TestSendEmailAsync:
+    """Handler-facing helper never raises"""
+
+    def test_delivers_through_module_pool(self, monkeypatch):
+        async def scenario(server):
+            monkeypatch.setattr(email_service, "SMTP_USER", "shop@example.com")
+            monkeypatch.setattr(email_service, "SMTP_PASSWORD", "secret")
+            monkeypatch.setattr(email_service, "smtp_pool", SMTPPool("127.0.0.1", server.port, "shop@example.com", "secret", start_tls=False))
+            assert await email_service.send_email_async("a@example.com", "Hi", "<p>Hi</p>") is True
+            await email_service.smtp_pool.close()
+            assert len(server.messages) == 1
+
+        run(scenario)
+
+    def test_returns_false_when_unconfigured(self, monkeypatch):
+        monkeypatch.setattr(email_service, "SMTP_USER", "")
+        assert asyncio.run(email_service.send_email_async("a@example.com", "Hi", "<p>Hi</p>")) is False
@@ -0,0 +1,84 @@
+"""
+Unit Tests for Email Templates
+Tests: CSS inlining at compile time, every template renders, escaping, text parts
+"""
+import pytest
+
+import email_service
+from email_templates import inline_css, parse_css, templates
+
+ORDER = {
+    "id": "abcdef123456",
+    "customer_name": "Ram <script>",
+    "created_at": "2025-01-02T10:00:00",
+    "items": [{"name": "Netflix 1 Month", "price": 500, "quantity": 2}],
+    "total_amount": 1000,
+    "items_text": "Netflix 1 Month x2",
+}
+
+
+class TestInlineCSS:
+    """Classes become style attributes before compilation"""
+
+    RULES = parse_css("/* comment */ .a { color: red; } .b {\n  margin: 0;\n  padding: 1px }")
+
+    def test_parse_css(self):
+        assert self.RULES == {"a": "color: red;", "b": "margin: 0; padding: 1px;"}
+
+    def test_classes_replaced_in_order(self):
+        assert inline_css('<p class="a b">x</p>', self.RULES) == '<p style="color: red; margin: 0; padding: 1px;">x</p>'
+
+    def test_existing_style_overrides_class(self):
+        html = inline_css('<p class="a" style="color: blue;">x</p>', self.RULES)
+        assert html == '<p style="color: red; color: blue;">x</p>'
+
+    def test_unknown_class_fails_at_compile_time(self):
+        with pytest.raises(ValueError, match="missing"):
+            inline_css('<p class="missing">x</p>', self.RULES)
+
+
+class TestTemplates:
+    """Each email renders subject, html and text in one call"""
+
+    @pytest.mark.parametrize("name", templates.names)
+    def test_compiled_html_has_no_classes_left(self, name):
+        source, _, _ = templates.env.loader.get_source(templates.env, f"{name}.html")
+        assert "class=" not in source
+
+    def test_order_confirmation(self):
+        subject, html, text = email_service.get_order_confirmation_email(ORDER)
+        assert subject == "Order Confirmation - #abcdef12"
+        assert "Netflix 1 Month" in html and "Rs 1000" in html
+        assert "Complete Payment" not in html
+        assert "Ram &lt;script&gt;" in html and "<script>" not in html
+        assert "Customer: Ram <script>" in text
+
+    def test_payment_link_and_takeapp_number(self):
+        order = {**ORDER, "takeapp_order_number": "TA-42", "payment_url": "https://pay.example/42"}
+        subject, html, text = email_service.get_order_confirmation_email(order)
+        assert subject == "Order Confirmation - #TA-42"
+        assert 'href="https://pay.example/42"' in html
+        assert "Payment Link: https://pay.example/42" in text
+
+    def test_status_update(self):
+        subject, html, text = email_service.get_order_status_update_email(ORDER, "processing")
+        assert subject == "Order Update - We're preparing your order!"
+        assert "PROCESSING" in html and "Status: PROCESSING" in text
+
+    def test_customer_otp(self):
+        subject, html, text = email_service.get_customer_otp_email("482913")
+        assert subject == "Your GSN Login Code: 482913"
+        assert "482913" in html and "expires in 10 minutes" in text
+
+    def test_order_completed_credits(self):
+        subject, html, text = email_service.get_order_completed_email(ORDER, credits_awarded=25)
+        assert subject == "Your Order #abcdef12 is Complete - GameShop Nepal"
+        assert "Rs 25</strong> in store credits" in html
+        assert "/invoice/abcdef123456" in text
+        _, html, text = email_service.get_order_completed_email(ORDER, credits_awarded=0)
+        assert "store credits" not in html and "store credits" not in text
+
+    def test_welcome(self):
+        subject, html, text = email_service.get_welcome_email("Sita")
+        assert subject == "Welcome to GameShop Nepal! 🎉"
+        assert "Hi Sita," in html and "Hi Sita," in text
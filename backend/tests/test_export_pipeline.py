@@ -0,0 +1,179 @@
+"""
+Unit Tests for the Export Pipeline
+Tests: change stream event mapping, file sinks, Sheets sink, retrying only failed sinks,
+polling with checkpoints (needs TEST_MONGO_URL)
+"""
+import asyncio
+import csv
+import json
+import os
+import uuid
+
+import pytest
+
+import export_pipeline
+from export_pipeline import ChangeEvent, ChangeStreamSource, CSVSink, ExportPipeline, NDJSONSink, PollingSource, SheetsSink
+from test_google_sheets_service import make_writer
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+ORDER = {"id": "o-1", "customer_name": "Ram", "total_amount": 100, "status": "pending"}
+CUSTOMER = {"id": "c-1", "email": "a@example.com", "name": "A"}
+
+
+class FlakySink:
+    name = "flaky"
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def write(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("quota exceeded")
+        self.batches.append(events)
+
+
+class TestChangeStreamEvents:
+    """Change documents become sink events without secrets"""
+
+    def test_update_with_full_document(self):
+        event = ChangeStreamSource.to_event({
+            "operationType": "update",
+            "ns": {"db": "shop", "coll": "customers"},
+            "documentKey": {"_id": "abc"},
+            "fullDocument": {"_id": "abc", **CUSTOMER, "otp": "123456", "otp_expires": "later"},
+        })
+        assert (event.collection, event.op, event.document_id) == ("customers", "upsert", "abc")
+        assert event.document == CUSTOMER
+
+    def test_delete_and_vanished_document(self):
+        change = {"ns": {"coll": "orders"}, "documentKey": {"_id": "abc"}}
+        assert ChangeStreamSource.to_event({**change, "operationType": "delete"}).op == "delete"
+        assert ChangeStreamSource.to_event({**change, "operationType": "update", "fullDocument": None}) is None
+
+
+class TestSinks:
+    """Each sink accepts a whole batch"""
+
+    EVENTS = [
+        ChangeEvent("orders", "upsert", "x1", ORDER),
+        ChangeEvent("customers", "upsert", "x2", CUSTOMER),
+        ChangeEvent("orders", "delete", "x3"),
+    ]
+
+    def test_ndjson(self, tmp_path):
+        asyncio.run(NDJSONSink(tmp_path).write(self.EVENTS))
+        [orders] = tmp_path.glob("orders-*.ndjson")
+        records = [json.loads(line) for line in orders.read_text().splitlines()]
+        assert [(r["op"], r["_id"]) for r in records] == [("upsert", "x1"), ("delete", "x3")]
+        assert records[0]["document"] == ORDER
+
+    def test_csv_writes_header_once(self, tmp_path):
+        sink = CSVSink(tmp_path)
+        asyncio.run(sink.write(self.EVENTS))
+        asyncio.run(sink.write(self.EVENTS[:1]))
+        [orders] = tmp_path.glob("orders-*.csv")
+        rows = list(csv.reader(orders.open()))
+        assert rows[0][:4] == ["Exported At", "Op", "_id", "Order ID"]
+        assert [row[1:4] for row in rows[1:]] == [["upsert", "x1", "o-1"], ["delete", "x3", ""], ["upsert", "x1", "o-1"]]
+
+    def test_sheets_upserts_and_flushes(self):
+        writer, spreadsheet = make_writer()
+        asyncio.run(SheetsSink(writer).write(self.EVENTS))
+        assert spreadsheet.worksheets["Orders"].rows[-1][0] == "o-1"
+        assert spreadsheet.worksheets["Customers"].rows[-1][1] == "a@example.com"
+
+
+class TestDelivery:
+    """A failing sink is retried with backoff; sinks that succeeded are not called again"""
+
+    def test_retries_only_failed_sink(self, monkeypatch):
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+
+        monkeypatch.setattr(export_pipeline.asyncio, "sleep", fake_sleep)
+        healthy, flaky = FlakySink(), FlakySink(failures=3)
+        pipeline = ExportPipeline(None, [healthy, flaky], max_backoff=3)
+
+        async def lease():
+            return True
+
+        pipeline._acquire_lease = lease
+        asyncio.run(pipeline._deliver([ChangeEvent("orders", "upsert", "x1", ORDER)]))
+        assert len(healthy.batches) == 1 and len(flaky.batches) == 1
+        assert sleeps == [1.0, 2.0, 3]
+        assert pipeline.status["last_error"] == "flaky: quota exceeded"
+
+    def test_long_backoff_keeps_renewing_the_lease(self, monkeypatch):
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+
+        monkeypatch.setattr(export_pipeline.asyncio, "sleep", fake_sleep)
+        flaky = FlakySink(failures=8)
+        pipeline = ExportPipeline(None, [flaky], lease_seconds=60, max_backoff=300)
+        leases = []
+
+        async def lease():
+            leases.append(True)
+            return len(leases) < 8
+
+        pipeline._acquire_lease = lease
+        delivered = asyncio.run(pipeline._deliver([ChangeEvent("orders", "upsert", "x1", ORDER)]))
+        assert delivered is False  # Lost the lease; stopped instead of writing the batch again
+        assert flaky.batches == [] and len(leases) == 8
+        assert max(sleeps) == 30
+
+    def test_unknown_sink_rejected(self, tmp_path):
+        env = {"EXPORT_SINKS": "sheets,ftp"}
+        with pytest.raises(ValueError, match="ftp"):
+            export_pipeline.create_export_pipeline(None, tmp_path, lambda key, default: env.get(key, default))
+        assert export_pipeline.create_export_pipeline(None, tmp_path, lambda key, default: "false") is None
+
+
+@pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+class TestPolling:
+    """The poller resumes from its saved high-water mark and waits for writes to settle"""
+
+    def test_poll_resumes_from_checkpoint(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def scenario():
+            client = AsyncIOMotorClient(TEST_MONGO_URL)
+            db = client[f"export_{uuid.uuid4().hex[:12]}"]
+            try:
+                source = PollingSource(db, collections=["orders"], batch_size=2, interval=0.01, settle=0.5)
+                stamp = "2025-01-01T00:00:00+00:00"
+                await db.orders.insert_many([{"id": f"o-{i}", "updated_at": stamp} for i in range(3)])
+
+                batches = source.batches({"orders": {"updated_at": "2024-01-01", "_id": None}})
+                events, marks = await batches.__anext__()
+                assert [e.document["id"] for e in events] == ["o-0", "o-1"]
+                await batches.aclose()
+
+                # Same updated_at: the _id tie-breaker picks up exactly where the checkpoint stopped
+                batches = source.batches(marks)
+                events, marks = await batches.__anext__()
+                assert [e.document["id"] for e in events] == ["o-2"]
+                await batches.aclose()
+
+                # A write stamped just now is left for a later poll, so one committing late isn't passed over
+                now = export_pipeline._now().isoformat()
+                await db.orders.insert_one({"id": "o-late", "updated_at": now})
+                batches = source.batches(marks)
+                events, unchanged = await batches.__anext__()
+                assert events == [] and unchanged == marks
+                await asyncio.sleep(0.6)
+                events, _ = await batches.__anext__()
+                assert [e.document["id"] for e in events] == ["o-late"]
+                await batches.aclose()
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+
+        asyncio.run(scenario())
@@ -0,0 +1,64 @@
+"""
+Unit Tests for the Synthetic Data Generator
+Tests: reproducibility, unique keys, status histories
+"""
+from datetime import datetime, timezone
+
+from generate_synthetic_data import Generator, referral_code_for
+
+END = datetime(2025, 6, 30, tzinfo=timezone.utc)
+COUNTS = {"products": 50, "customers": 200, "orders": 300, "credit_logs": 50,
+          "referrals": 20, "wishlists": 30, "visits": 400}
+
+
+def make_generator(seed=42):
+    return Generator(seed, END, 365, COUNTS)
+
+
+class TestGenerator:
+    """Documents are deterministic and realistic enough to index"""
+
+    def test_same_seed_same_documents(self):
+        a, b = make_generator(), make_generator()
+        assert [a.order(i) for i in range(20)] == [b.order(i) for i in range(20)]
+        assert a.customer(7) == b.customer(7)
+
+    def test_different_seed_different_documents(self):
+        assert make_generator(1).order(0) != make_generator(2).order(0)
+
+    def test_customer_unique_keys(self):
+        generator = make_generator()
+        customers = [generator.customer(i) for i in range(COUNTS["customers"])]
+        for field in ("id", "email", "phone_key"):
+            values = [c[field] for c in customers]
+            assert len(values) == len(set(values)), field
+
+    def test_referral_codes_unique(self):
+        codes = [referral_code_for(i) for i in range(100_000)]
+        assert len(set(codes)) == len(codes)
+        assert all(len(code) == 8 for code in codes)
+
+    def test_status_history_matches_final_status(self):
+        generator = make_generator()
+        for i in range(COUNTS["orders"]):
+            order, history = generator.order(i)
+            if history:
+                assert history[-1]["new_status"] == order["status"]
+                assert all(entry["order_id"] == order["id"] for entry in history)
+            else:
+                assert order["status"] == "pending"
+
+    def test_one_visit_per_visitor_per_day(self):
+        generator = make_generator()
+        visits = [generator.visit(i) for i in range(COUNTS["visits"])]
+        keys = {(v["visitor_id"], v["date"]) for v in visits}
+        assert len(keys) == len(visits)
+
+    def test_orders_carry_cost_snapshot(self):
+        generator = make_generator()
+        order, _ = generator.order(3)
+        for item in order["items"]:
+            product = next(p for p in (generator.product(i) for i in range(COUNTS["products"])) if p["id"] == item["product_id"])
+            variation = next(v for v in product["variations"] if v["id"] == item["variation_id"])
+            assert item["cost_price"] == variation["cost_price"]
+        assert 0 < order["cost_total"] < order["total_amount"]
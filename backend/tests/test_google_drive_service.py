@@ -0,0 +1,139 @@
+"""
+Unit Tests for the Google Drive Client
+Tests: service built once, per-thread Http, chunked resumable upload with retry,
+batched permission grants
+"""
+import asyncio
+import io
+import json
+import re
+import threading
+
+import httplib2
+import pytest
+
+from google_drive_service import DriveClient
+
+UPLOAD_URL = "https://upload.example/session"
+
+
+class FakeDriveHttp:
+    """httplib2.Http stand-in speaking just enough of the Drive upload and batch protocols"""
+
+    def __init__(self, fail_chunks=0, denied=()):
+        self.fail_chunks = fail_chunks
+        self.denied = set(denied)
+        self.received = b""
+        self.requests = []
+        self.batches = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.requests.append((method, uri))
+        if "uploadType=resumable" in uri:
+            return httplib2.Response({"status": "200", "location": UPLOAD_URL}), b""
+        if uri == UPLOAD_URL:
+            if self.fail_chunks:
+                self.fail_chunks -= 1
+                return httplib2.Response({"status": "503"}), b"unavailable"
+            self.received += body if isinstance(body, bytes) else body.read()
+            headers = {k.lower(): v for k, v in headers.items()}
+            total = headers["content-range"].rsplit("/", 1)[1]
+            if total != "*" and len(self.received) == int(total):
+                return httplib2.Response({"status": "200"}), json.dumps({"id": "file-1"}).encode()
+            return httplib2.Response({"status": "308", "range": f"bytes=0-{len(self.received) - 1}"}), b""
+        if "/batch/" in uri:
+            return self.batch(body)
+        raise AssertionError(f"Unexpected request {method} {uri}")
+
+    def batch(self, body):
+        body = body.decode() if isinstance(body, bytes) else body
+        ids = re.findall(r"Content-ID: <([^>]+)>", body)
+        self.batches.append(len(ids))
+        parts = []
+        for content_id in ids:
+            file_id = content_id.split("+", 1)[1].strip()
+            status = "403 Forbidden" if file_id in self.denied else "200 OK"
+            parts.append(
+                "--BOUNDARY\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n\r\n"
+                '{"id": "perm"}\r\n'
+            )
+        content = "".join(parts) + "--BOUNDARY--"
+        return httplib2.Response({"status": "200", "content-type": "multipart/mixed; boundary=BOUNDARY"}), content.encode()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("googleapiclient.http.time.sleep", lambda seconds: None)
+
+
+def make_client(http, **options):
+    created = []
+
+    def factory():
+        created.append(threading.get_ident())
+        return http
+
+    return DriveClient(http_factory=factory, folder_id="folder", **options), created
+
+
+class TestDriveClient:
+    def test_service_built_once_with_http_per_thread(self):
+        client, created = make_client(FakeDriveHttp())
+        assert client.service() is client.service()
+        barrier = threading.Barrier(3)  # Keep all three threads alive so their idents differ
+
+        def worker():
+            client.http()
+            barrier.wait()
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(created) == 4 and len(set(created)) == 4
+
+    def test_chunked_resumable_upload_retries_failed_chunk(self):
+        http = FakeDriveHttp(fail_chunks=1)
+        client, _ = make_client(http, chunk_size=256 * 1024)
+        content = bytes(range(256)) * 2500  # 640000 bytes: three chunks
+        response = client.upload_sync(io.BytesIO(content), "shot.png", "image/png")
+        assert response["id"] == "file-1"
+        assert http.received == content
+        puts = [uri for method, uri in http.requests if uri == UPLOAD_URL]
+        assert len(puts) == 4  # Three chunks plus the retried one
+
+    def test_concurrent_grants_share_one_batch(self):
+        http = FakeDriveHttp(denied={"f-3"})
+        client, _ = make_client(http, permission_window=0.05)
+
+        async def scenario():
+            return await asyncio.gather(
+                *[client._grant_public_read(f"f-{i}") for i in range(4)], return_exceptions=True
+            )
+
+        results = asyncio.run(scenario())
+        assert http.batches == [4]
+        assert results[:3] == [None, None, None]
+        assert isinstance(results[3], Exception)
+
+    def test_grant_queued_during_a_batch_is_sent_next(self):
+        http = FakeDriveHttp()
+        client, _ = make_client(http, permission_window=0.01)
+        real = client.grant_public_read_sync
+
+        def slow(file_ids):
+            threading.Event().wait(0.1)  # time.sleep is patched out by no_backoff
+            return real(file_ids)
+
+        client.grant_public_read_sync = slow
+
+        async def scenario():
+            first = asyncio.create_task(client._grant_public_read("a"))
+            await asyncio.sleep(0.05)  # "a" is in flight
+            await asyncio.wait_for(asyncio.gather(first, client._grant_public_read("b")), timeout=2)
+
+        asyncio.run(scenario())
+        assert http.batches == [1, 1]
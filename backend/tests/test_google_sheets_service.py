@@ -0,0 +1,206 @@
+"""
+Unit Tests for the Batched Google Sheets Writer
+Tests: coalescing, one batch_update/append_rows per flush, cached handles and row index,
+diff-based full resync
+"""
+import asyncio
+import threading
+
+import google_sheets_service
+from google_sheets_service import SheetTable, SheetsWriter, customer_row, diff_rows, order_row, range_updates
+
+
+class FakeWorksheet:
+    """In-memory stand-in for gspread.Worksheet recording API calls"""
+
+    def __init__(self, title, rows):
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        self.calls = []
+        self.threads = set()
+
+    def get_all_values(self, value_render_option=None):
+        self.calls.append("get_all_values")
+        return [list(row) for row in self.rows]
+
+    def col_values(self, col):
+        self.calls.append("col_values")
+        return [row[col - 1] if len(row) >= col else "" for row in self.rows]
+
+    def batch_update(self, data):
+        self.calls.append("batch_update")
+        self.threads.add(threading.get_ident())
+        for item in data:
+            first = int(item["range"].split(":")[0][1:])
+            for offset, values in enumerate(item["values"]):
+                self.rows[first - 1 + offset] = values
+
+    def append_rows(self, values):
+        self.calls.append("append_rows")
+        self.threads.add(threading.get_ident())
+        first = len(self.rows) + 1
+        self.rows.extend(values)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:J{len(self.rows)}"}}
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets):
+        self.worksheets = worksheets
+        self.opened = 0
+
+    def worksheet(self, title):
+        return self.worksheets[title]
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        self.spreadsheet.opened += 1
+        return self.spreadsheet
+
+
+def make_writer(customers=(), orders=()):
+    sheets = {
+        "Customers": FakeWorksheet("Customers", [google_sheets_service.CUSTOMER_HEADERS, *customers]),
+        "Orders": FakeWorksheet("Orders", [google_sheets_service.ORDER_HEADERS, *orders]),
+    }
+    spreadsheet = FakeSpreadsheet(sheets)
+    return SheetsWriter(client_factory=lambda: FakeClient(spreadsheet), window=0.01), spreadsheet
+
+
+def order(order_id, status="pending"):
+    return {"id": order_id, "customer_name": "Ram", "total_amount": 100, "status": status}
+
+
+class TestSheetsWriter:
+    """Many record syncs become one API call per kind of write"""
+
+    def test_flush_batches_updates_and_appends(self):
+        existing = order_row(order("o-1"))
+        writer, spreadsheet = make_writer(orders=[existing])
+        sheet = spreadsheet.worksheets["Orders"]
+
+        async def scenario():
+            writer.enqueue("orders", "o-1", order_row(order("o-1", "completed")))
+            for i in range(2, 6):
+                writer.enqueue("orders", f"o-{i}", order_row(order(f"o-{i}")))
+            await writer.flush()
+
+        asyncio.run(scenario())
+        assert sheet.calls == ["col_values", "batch_update", "append_rows"]
+        assert sheet.rows[1][6] == "completed"
+        assert [row[0] for row in sheet.rows[1:]] == ["o-1", "o-2", "o-3", "o-4", "o-5"]
+        assert threading.get_ident() not in sheet.threads
+
+    def test_repeated_writes_coalesce_and_use_cached_index(self):
+        writer, spreadsheet = make_writer()
+        sheet = spreadsheet.worksheets["Customers"]
+        customer = {"id": "c-1", "email": "a@example.com", "name": "A"}
+
+        async def scenario():
+            writer.enqueue("customers", "a@example.com", customer_row(customer))
+            writer.enqueue("customers", "a@example.com", customer_row({**customer, "name": "A2"}))
+            await writer.flush()
+            writer.enqueue("customers", "a@example.com", customer_row({**customer, "name": "A3"}))
+            await writer.flush()
+
+        asyncio.run(scenario())
+        # Row number of the appended customer came from the append response, not a re-read
+        assert sheet.calls == ["col_values", "append_rows", "batch_update"]
+        assert len(sheet.rows) == 2 and sheet.rows[1][2] == "A3"
+        assert spreadsheet.opened == 1
+
+    def test_window_flushes_automatically(self):
+        writer, spreadsheet = make_writer()
+
+        async def scenario():
+            google_sheets_service.sheets_writer, previous = writer, google_sheets_service.sheets_writer
+            try:
+                google_sheets_service.sync_order_to_sheets(order("o-9"))
+                google_sheets_service.sync_customer_to_sheets({"id": "c-9", "email": "z@example.com"})
+                await asyncio.sleep(0.2)
+            finally:
+                google_sheets_service.sheets_writer = previous
+
+        asyncio.run(scenario())
+        assert spreadsheet.worksheets["Orders"].rows[-1][0] == "o-9"
+        assert spreadsheet.worksheets["Customers"].rows[-1][1] == "z@example.com"
+
+    def test_failed_flush_is_retried_without_new_writes(self):
+        writer, spreadsheet = make_writer()
+        sheet = spreadsheet.worksheets["Orders"]
+        append_rows = sheet.append_rows
+
+        def fail_once(values):
+            sheet.append_rows = append_rows
+            raise RuntimeError("quota exceeded")
+
+        sheet.append_rows = fail_once
+
+        async def scenario():
+            writer.enqueue("orders", "o-1", order_row(order("o-1")))
+            await asyncio.sleep(0.2)
+
+        asyncio.run(scenario())
+        assert sheet.rows[-1][0] == "o-1"
+        assert writer._pending == {"customers": {}, "orders": {}}
+
+    def test_unconfigured_client_drops_quietly(self):
+        writer = SheetsWriter(client_factory=lambda: None, window=0.01)
+
+        async def scenario():
+            writer.enqueue("orders", "o-1", order_row(order("o-1")))
+            await writer.flush()
+
+        asyncio.run(scenario())
+        assert writer._pending == {"customers": {}, "orders": {}}
+
+
+class TestResync:
+    """Full resync reads the sheet once and writes only the difference"""
+
+    TABLE = SheetTable("Orders", google_sheets_service.ORDER_HEADERS, key_column=1)
+
+    def test_diff_rows(self):
+        sheet = [
+            google_sheets_service.ORDER_HEADERS,
+            ["o-1", "Ram", "", "", "", 100, "pending", "", "", ""],  # Sheets returns 100.0 as 100
+            ["o-2", "Sita", "", "", "", 200, "pending"],  # Trailing empty cells omitted
+            ["o-extra", "Hari"],
+        ]
+        rows = {
+            "o-1": order_row({"id": "o-1", "customer_name": "Ram", "total_amount": 100.0}),
+            "o-2": order_row({"id": "o-2", "customer_name": "Sita", "total_amount": 200, "status": "completed"}),
+            "o-3": order_row({"id": "o-3", "customer_name": "Gita"}),
+        }
+        changed, appends, unchanged = diff_rows(self.TABLE, sheet, rows)
+        assert [row_number for row_number, _ in changed] == [3]
+        assert [row[0] for row in appends] == ["o-3"]
+        assert unchanged == 1
+
+    def test_consecutive_rows_share_a_range(self):
+        changed = [(2, ["a"]), (3, ["b"]), (4, ["c"]), (9, ["d"])]
+        assert range_updates(self.TABLE, changed) == [
+            {"range": "A2:J4", "values": [["a"], ["b"], ["c"]]},
+            {"range": "A9:J9", "values": [["d"]]},
+        ]
+
+    def test_resync_writes_only_changes_and_reports_progress(self):
+        orders = [order(f"o-{i}") for i in range(10)]
+        writer, spreadsheet = make_writer(orders=[order_row(o) for o in orders])
+        sheet = spreadsheet.worksheets["Orders"]
+        orders[3]["status"] = orders[4]["status"] = "completed"
+        rows = {o["id"]: order_row(o) for o in orders + [order("o-new")]}
+        reports = []
+
+        async def progress(stats):
+            reports.append(stats)
+
+        stats = asyncio.run(writer.resync("orders", rows, progress))
+        assert sheet.calls == ["get_all_values", "batch_update", "append_rows"]
+        assert (stats["updated"], stats["added"], stats["unchanged"]) == (2, 1, 8)
+        assert sheet.rows[4][6] == sheet.rows[5][6] == "completed"
+        assert sheet.rows[-1][0] == "o-new"
+        assert [r["phase"] for r in reports][0] == "reading" and reports[-1]["phase"] == "done"
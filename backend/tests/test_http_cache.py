@@ -0,0 +1,94 @@
+"""
+Unit Tests for HTTP Conditional Caching
+Tests: ETag/304 without running the handler, policies, version bumps, auth bypass
+"""
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from http_cache import CachePolicy, HTTPCacheMiddleware, etag_matches
+from resource_versions import VersionStore
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for VersionStore.bump"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["resource"], {})
+        doc.update(update.get("$set", {}))
+
+
+def make_app():
+    store = VersionStore(db={"resource_versions": FakeCollection()})
+    calls = {"faqs": 0}
+    app = FastAPI()
+    app.add_middleware(HTTPCacheMiddleware, store=store, policies=[
+        ("/api/faqs", CachePolicy(("faqs",), max_age=60, stale_while_revalidate=600)),
+        ("/api/settings", CachePolicy(("site_settings",))),
+    ])
+
+    @app.get("/api/faqs")
+    async def faqs():
+        calls["faqs"] += 1
+        return [{"question": "Q", "answer": "A"}]
+
+    @app.get("/api/settings")
+    async def settings():
+        return {"id": "main"}
+
+    @app.get("/api/products")
+    async def products():
+        return []
+
+    asyncio.run(store.bump("faqs", "site_settings"))
+    return TestClient(app), store, calls
+
+
+class TestHTTPCacheMiddleware:
+    """Conditional requests"""
+
+    def test_etag_and_cache_control_on_200(self):
+        client, _, _ = make_app()
+        response = client.get("/api/faqs")
+        assert response.status_code == 200
+        assert response.headers["etag"].startswith('W/"')
+        assert response.headers["cache-control"] == "public, max-age=60, stale-while-revalidate=600"
+
+    def test_matching_if_none_match_skips_handler(self):
+        client, _, calls = make_app()
+        etag = client.get("/api/faqs").headers["etag"]
+        response = client.get("/api/faqs", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert calls["faqs"] == 1
+
+    def test_bump_invalidates_etag(self):
+        client, store, _ = make_app()
+        etag = client.get("/api/faqs").headers["etag"]
+        asyncio.run(store.bump("faqs"))
+        response = client.get("/api/faqs", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_no_cache_policy(self):
+        client, _, _ = make_app()
+        assert client.get("/api/settings").headers["cache-control"] == "public, no-cache"
+
+    def test_uncached_routes_and_authorized_requests_pass_through(self):
+        client, _, _ = make_app()
+        assert "etag" not in client.get("/api/products").headers
+        assert "etag" not in client.get("/api/faqs", headers={"Authorization": "Bearer x"}).headers
+
+
+class TestEtagMatches:
+    """If-None-Match parsing"""
+
+    def test_weak_and_strong_forms_match(self):
+        assert etag_matches('"abc"', 'W/"abc"')
+        assert etag_matches('W/"old", W/"abc"', 'W/"abc"')
+        assert etag_matches("*", 'W/"abc"')
+        assert not etag_matches('W/"old"', 'W/"abc"')
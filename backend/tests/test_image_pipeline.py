@@ -0,0 +1,108 @@
+"""
+Unit Tests for the Image Pipeline
+Tests: variants and srcset manifest, dedupe by content hash, single-flight,
+EXIF rotation, animated GIFs, blurhash, rejected input
+"""
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+from image_pipeline import ImagePipeline, InvalidImage, _base83, blurhash, process_image
+
+
+def png(width, height, color=(200, 30, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestProcessImage:
+    """One upload becomes every width in every output format"""
+
+    def test_variants_and_srcset(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(image_pipeline, "WIDTHS", (320, 640, 1280))
+        manifest = process_image(png(1000, 500), tmp_path, "/api/uploads")
+        digest = manifest["hash"]
+        assert (manifest["width"], manifest["height"]) == (1000, 500)
+        assert manifest["url"] == f"/api/uploads/{digest}.png"
+        webp = next(s for s in manifest["sources"] if s["type"] == "image/webp")
+        assert webp["srcset"] == (
+            f"/api/uploads/{digest}-320.webp 320w, /api/uploads/{digest}-640.webp 640w, "
+            f"/api/uploads/{digest}-1000.webp 1000w"
+        )
+        for variant in manifest["variants"]:
+            path = tmp_path / variant["url"].rsplit("/", 1)[1]
+            assert path.stat().st_size == variant["bytes"]
+            with Image.open(path) as image:
+                assert image.size == (variant["width"], variant["height"])
+        assert manifest["sources"][0]["type"] == image_pipeline.OUTPUT_FORMATS[0][1]
+
+    def test_same_bytes_reuse_stored_files(self, tmp_path):
+        first = process_image(png(50, 50), tmp_path, "/u")
+        files = sorted(p.name for p in tmp_path.iterdir())
+        assert process_image(png(50, 50), tmp_path, "/u") == first
+        assert sorted(p.name for p in tmp_path.iterdir()) == files
+        assert process_image(png(50, 50, (0, 0, 0)), tmp_path, "/u")["hash"] != first["hash"]
+
+    def test_exif_orientation_applied(self, tmp_path):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotate 90° clockwise
+        Image.new("RGB", (40, 20)).save(buffer, "JPEG", exif=exif)
+        manifest = process_image(buffer.getvalue(), tmp_path, "/u")
+        assert (manifest["width"], manifest["height"]) == (20, 40)
+
+    def test_animated_gif_keeps_original_only(self, tmp_path):
+        buffer = io.BytesIO()
+        frames = [Image.new("RGB", (30, 30), (i * 80, 0, 0)) for i in range(3)]
+        frames[0].save(buffer, "GIF", save_all=True, append_images=frames[1:])
+        manifest = process_image(buffer.getvalue(), tmp_path, "/u")
+        assert manifest["url"].endswith(".gif") and manifest["variants"] == []
+
+    def test_rejects_non_images(self, tmp_path):
+        with pytest.raises(InvalidImage):
+            process_image(b"not an image", tmp_path, "/u")
+        assert list(tmp_path.iterdir()) == []
+
+    def test_rejects_too_many_pixels_before_decoding(self, tmp_path, monkeypatch):
+        data = png(200, 100)
+        monkeypatch.setattr(image_pipeline, "MAX_PIXELS", 100 * 100)
+        monkeypatch.setattr("PIL.ImageFile.ImageFile.load", lambda self: pytest.fail("decoded"))
+        with pytest.raises(InvalidImage, match="too large"):
+            process_image(data, tmp_path, "/u")
+
+
+class TestBlurhash:
+    def test_solid_color(self):
+        hash_ = blurhash(Image.new("RGB", (64, 48), (255, 0, 0)))
+        assert len(hash_) == 6 + 2 * 11
+        assert hash_[0] == "L"  # 4x3 components
+        assert hash_[2:6] == _base83(0xFF0000, 4)  # DC term is the average colour
+
+
+class TestImagePipeline:
+    def test_concurrent_uploads_share_one_job(self, tmp_path, monkeypatch):
+        calls = []
+        real = image_pipeline.process_image
+
+        def counting(*args):
+            calls.append(1)
+            return real(*args)
+
+        monkeypatch.setattr(image_pipeline, "process_image", counting)
+        pipeline = ImagePipeline(tmp_path)
+
+        async def scenario():
+            return await asyncio.gather(*[pipeline.process(png(60, 60)) for _ in range(5)])
+
+        results = asyncio.run(scenario())
+        assert len(calls) == 1 and all(r == results[0] for r in results)
+        assert pipeline.manifest(results[0]["hash"]) == results[0]
+
+    def test_size_limit(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(image_pipeline, "MAX_UPLOAD_BYTES", 10)
+        with pytest.raises(InvalidImage, match="larger"):
+            asyncio.run(ImagePipeline(tmp_path).process(png(20, 20)))
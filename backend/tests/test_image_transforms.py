@@ -0,0 +1,146 @@
+"""
+Unit Tests for On-the-fly Image Transforms
+Tests: parameter validation, format negotiation, rendering, disk LRU eviction,
+single-flight, cache keys follow source content
+"""
+import asyncio
+import os
+
+import pytest
+from PIL import Image
+
+import image_transforms
+from image_transforms import DiskLRU, ImageTransformer, InvalidTransform, parse_params
+from upload_files import UploadStore
+
+
+def write_png(path, size=(800, 400), color=(20, 200, 90, 255)):
+    Image.new("RGBA", size, color).save(path, "PNG")
+
+
+class TestParseParams:
+    def test_no_params_means_original(self):
+        assert parse_params(None, None, None) is None
+
+    def test_auto_format_from_accept(self):
+        assert parse_params(320, None, None, "image/webp,*/*").format == "webp"
+        assert parse_params(320, "auto", None, "*/*").format == "jpeg"
+        params = parse_params(320, None, None, "image/webp,*/*")
+        assert params.auto and params.quality == 80
+
+    def test_explicit_format_and_quality(self):
+        params = parse_params(None, "jpg", 65)
+        assert (params.format, params.quality, params.auto) == ("jpeg", 65, False)
+
+    def test_width_and_quality_snap_to_presets(self):
+        assert [parse_params(w, "webp", None).width for w in (16, 320, 321, 1280, 2560)] == [320, 320, 640, 1280, 1280]
+        assert [parse_params(None, "webp", q).quality for q in (30, 60, 71, 95)] == [50, 65, 65, 90]
+
+    @pytest.mark.parametrize("width,format,quality", [(5, None, None), (9000, None, None), (None, "bmp", None), (None, "webp", 99)])
+    def test_rejected(self, width, format, quality):
+        with pytest.raises(InvalidTransform):
+            parse_params(width, format, quality)
+
+
+class TestDiskLRU:
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = DiskLRU(tmp_path, max_bytes=250)
+        for name in ("a", "b"):
+            (tmp_path / name).write_bytes(b"x" * 100)
+            cache.put(name, 100)
+        assert cache.get("a") is not None  # a is now the most recent
+        (tmp_path / "c").write_bytes(b"x" * 100)
+        cache.put("c", 100)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "c"]
+        assert cache.total == 200
+
+    def test_reloads_existing_files_by_mtime(self, tmp_path):
+        for i, name in enumerate(["old", "new"]):
+            (tmp_path / name).write_bytes(b"x" * 100)
+            os.utime(tmp_path / name, (1000 + i, 1000 + i))
+        cache = DiskLRU(tmp_path, max_bytes=150)
+        assert list(cache.entries) == ["new"] and not (tmp_path / "old").exists()
+
+
+class TestImageTransformer:
+    def make(self, tmp_path):
+        uploads = tmp_path / "uploads"
+        uploads.mkdir()
+        write_png(uploads / "legacy.png")
+        store = UploadStore(uploads)
+        transformer = ImageTransformer(DiskLRU(tmp_path / "cache", max_bytes=10 * 1024 * 1024))
+        return store, transformer
+
+    def test_resize_and_reencode(self, tmp_path):
+        store, transformer = self.make(tmp_path)
+        info = store.lookup("legacy.png")
+        result = asyncio.run(transformer.transform(info, parse_params(320, "jpeg", None)))
+        assert result.content_type == "image/jpeg"
+        assert result.cache_control == info.cache_control
+        with Image.open(result.path) as image:
+            assert (image.format, image.size) == ("JPEG", (320, 160))
+            assert image.getpixel((10, 10))[1] > 150  # Alpha flattened, colour kept
+
+    def test_never_upscales(self, tmp_path):
+        store, transformer = self.make(tmp_path)
+        result = asyncio.run(transformer.transform(store.lookup("legacy.png"), parse_params(1280, "webp", None)))
+        with Image.open(result.path) as image:
+            assert image.size == (800, 400)
+
+    def test_concurrent_requests_render_once(self, tmp_path, monkeypatch):
+        store, transformer = self.make(tmp_path)
+        calls = []
+        real = image_transforms.render
+
+        def counting(*args):
+            calls.append(1)
+            return real(*args)
+
+        monkeypatch.setattr(image_transforms, "render", counting)
+        info = store.lookup("legacy.png")
+
+        async def scenario():
+            params = parse_params(320, "webp", 65)
+            first = await asyncio.gather(*[transformer.transform(info, params) for _ in range(5)])
+            again = await transformer.transform(info, params)
+            return first, again
+
+        first, again = asyncio.run(scenario())
+        assert len(calls) == 1
+        assert {r.etag for r in first} == {again.etag}
+
+    def test_changed_source_gets_new_key(self, tmp_path):
+        store, transformer = self.make(tmp_path)
+        params = parse_params(320, "png", None)
+        before = asyncio.run(transformer.transform(store.lookup("legacy.png"), params))
+        write_png(store.directory / "legacy.png", color=(0, 0, 0, 255))
+        store._stats.clear()
+        after = asyncio.run(transformer.transform(store.lookup("legacy.png"), params))
+        assert before.etag != after.etag
+
+    def test_open_rerenders_file_evicted_after_lookup(self, tmp_path, monkeypatch):
+        store, transformer = self.make(tmp_path)
+        info = store.lookup("legacy.png")
+        params = parse_params(320, "png", None)
+        first = asyncio.run(transformer.transform(info, params))
+        real = transformer.transform
+
+        async def evicting(*args):
+            result = await real(*args)
+            if result.path.exists() and not getattr(evicting, "done", False):
+                evicting.done = True
+                os.unlink(result.path)  # Another request evicts it before we open it
+            return result
+
+        monkeypatch.setattr(transformer, "transform", evicting)
+        result, file = asyncio.run(transformer.open(info, params))
+        with file:
+            assert result.etag == first.etag
+            assert Image.open(file).size == (320, 160)
+
+    def test_not_an_image(self, tmp_path):
+        store, transformer = self.make(tmp_path)
+        (store.directory / "notes.txt").write_text("hello")
+        with pytest.raises(InvalidTransform):
+            asyncio.run(transformer.transform(store.lookup("notes.txt"), parse_params(320, None, None)))
+        assert list(transformer.cache.directory.iterdir()) == []
@@ -0,0 +1,153 @@
+"""
+Unit Tests for ImgBB Uploads
+Tests: multipart upload against a local HTTP stand-in, pooled connections,
+retries on 5xx/429, screenshot downscaling
+"""
+import asyncio
+import io
+import json
+from email.parser import BytesParser
+
+import pytest
+from PIL import Image
+
+import imgbb_service
+from imgbb_service import ImgBBClient, prepare_screenshot
+
+
+class FakeImgBB:
+    """Minimal HTTP/1.1 server speaking the ImgBB upload API; replies with the queued statuses first"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.connections = 0
+        self.requests = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/1/upload"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await self.read_body(reader, headers)
+                self.requests.append((request_line.decode().split()[1], headers, body))
+                status = self.statuses.pop(0) if self.statuses else 200
+                payload = json.dumps(self.result(headers, body) if status == 200 else {"success": False}).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_body(reader, headers):
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"]))
+        body = b""
+        while True:  # Chunked
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                return body
+            body += chunk[:-2]
+
+    @staticmethod
+    def parts(headers, body):
+        message = BytesParser().parsebytes(f"Content-Type: {headers['content-type']}\r\n\r\n".encode() + body)
+        return {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+
+    def result(self, headers, body):
+        image = self.parts(headers, body)["image"]
+        return {"success": True, "data": {
+            "id": "abc", "url": f"https://i.ibb.co/abc/{image.get_filename()}",
+            "display_url": "https://ibb.co/abc", "delete_url": "https://ibb.co/abc/delete",
+        }}
+
+
+def screenshot(width, height, fmt="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (10, 120, 200)).save(buffer, fmt)
+    buffer.seek(0)
+    return buffer
+
+
+def run_upload(server, client_options=None, uploads=1, image=None):
+    async def scenario():
+        url = await server.start()
+        client = ImgBBClient(url, **(client_options or {}))
+        try:
+            return [
+                await client.upload(image or screenshot(20, 20), "shot.png", "image/png", "k3y")
+                for _ in range(uploads)
+            ]
+        finally:
+            await client.close()
+            await server.stop()
+    return asyncio.run(scenario())
+
+
+class TestImgBBClient:
+    def test_multipart_upload_without_base64(self):
+        server = FakeImgBB()
+        image = screenshot(20, 20)
+        [result] = run_upload(server, image=image)
+        assert result["data"]["url"] == "https://i.ibb.co/abc/shot.png"
+        path, headers, body = server.requests[0]
+        assert path == "/1/upload?key=k3y"
+        assert headers["content-type"].startswith("multipart/form-data")
+        parts = FakeImgBB.parts(headers, body)
+        assert parts["image"].get_payload(decode=True) == image.getvalue()
+        assert parts["name"].get_payload() == "shot"
+
+    def test_uploads_share_a_connection(self):
+        server = FakeImgBB()
+        run_upload(server, uploads=3)
+        assert len(server.requests) == 3 and server.connections == 1
+
+    def test_retries_transient_errors(self):
+        server = FakeImgBB(statuses=[503, 429])
+        image = screenshot(20, 20)
+        [result] = run_upload(server, {"backoff": 0.01}, image=image)
+        assert result["success"] and len(server.requests) == 3
+        # The file is rewound, so every attempt carries the whole image
+        for _, headers, body in server.requests:
+            assert FakeImgBB.parts(headers, body)["image"].get_payload(decode=True) == image.getvalue()
+
+    def test_gives_up_after_max_attempts(self):
+        server = FakeImgBB(statuses=[502, 502, 502])
+        with pytest.raises(Exception, match="502"):
+            run_upload(server, {"backoff": 0.01, "max_attempts": 3})
+        assert len(server.requests) == 3
+
+
+class TestPrepareScreenshot:
+    def test_small_image_passes_through(self):
+        image = screenshot(400, 800)
+        assert prepare_screenshot(image, "a.png", "image/png") == (image, "a.png", "image/png")
+
+    def test_large_image_downscaled_to_jpeg(self, monkeypatch):
+        monkeypatch.setattr(imgbb_service, "MAX_DIMENSION", 500)
+        file, filename, content_type = prepare_screenshot(screenshot(1170, 2532), "a.png", "image/png")
+        assert (filename, content_type) == ("a.jpg", "image/jpeg")
+        with Image.open(file) as image:
+            assert image.format == "JPEG" and max(image.size) == 500
+
+    def test_unreadable_image_left_for_imgbb(self):
+        file = io.BytesIO(b"not an image")
+        assert prepare_screenshot(file, "a.png", "image/png")[0] is file
@@ -0,0 +1,60 @@
+"""
+Unit Tests for the Load Test Reporting
+Tests: percentiles, per-route report, baseline comparison
+"""
+from benchmarks.load_test import Recorder, compare, percentile
+
+
+def route(p95, rps=100.0, errors=0):
+    return {"count": 1000, "errors": errors, "rps": rps, "mean_ms": p95 / 2,
+            "p50_ms": p95 / 2, "p95_ms": p95, "p99_ms": p95 * 1.5}
+
+
+class TestPercentile:
+    """Nearest-rank percentiles"""
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+
+    def test_small_and_empty(self):
+        assert percentile([7.0], 99) == 7.0
+        assert percentile([], 50) == 0.0
+
+
+class TestReport:
+    """Per-route aggregation"""
+
+    def test_report_counts_errors_and_rate(self):
+        rec = Recorder()
+        rec.latencies["GET /api/products"] = [10.0, 20.0, 30.0, 40.0]
+        rec.errors["GET /api/products"] = 1
+        report = rec.report(duration=2.0)
+        assert report["routes"]["GET /api/products"]["rps"] == 2.0
+        assert report["routes"]["GET /api/products"]["p50_ms"] == 20.0
+        assert report["totals"] == {"requests": 4, "errors": 1, "rps": 2.0}
+
+
+class TestCompare:
+    """Regression detection against a baseline"""
+
+    def test_latency_regression_detected(self):
+        baseline = {"routes": {"GET /api/products": route(50)}}
+        result = {"routes": {"GET /api/products": route(80)}}
+        assert len(compare(result, baseline, tolerance=0.2)) == 1
+
+    def test_small_absolute_changes_are_noise(self):
+        baseline = {"routes": {"GET /api/faqs": route(1.0)}}
+        result = {"routes": {"GET /api/faqs": route(2.5)}}
+        assert compare(result, baseline, tolerance=0.2) == []
+
+    def test_throughput_and_error_regressions(self):
+        baseline = {"routes": {"GET /api/orders": route(50, rps=100)}}
+        result = {"routes": {"GET /api/orders": route(50, rps=60, errors=3)}}
+        assert len(compare(result, baseline, tolerance=0.2)) == 2
+
+    def test_new_routes_are_ignored(self):
+        assert compare({"routes": {"GET /api/new": route(500)}}, {"routes": {}}, tolerance=0.2) == []
@@ -0,0 +1,193 @@
+"""
+Unit Tests for Newsletter Campaigns
+Tests: signed unsubscribe tokens, render-once merge fields, message headers,
+pausing instead of skipping subscribers during an SMTP outage,
+resume from checkpoint after a crash (needs TEST_MONGO_URL)
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from email_templates import MergeTemplate, templates
+from newsletter_campaigns import CampaignSender, compile_campaign, unsubscribe_token, verify_unsubscribe_token
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+
+class RecordingPool:
+    """
+    Stands in for SMTPPool; hangs after `hang_after` messages to simulate a crash,
+    and refuses the first `fail_sends` sends to simulate an outage
+    """
+
+    def __init__(self, hang_after=None, fail_sends=0):
+        self.messages = []
+        self.hang_after = hang_after
+        self.fail_sends = fail_sends
+
+    async def send(self, message):
+        if self.fail_sends:
+            self.fail_sends -= 1
+            raise ConnectionError("SMTP server unavailable")
+        if self.hang_after is not None and len(self.messages) >= self.hang_after:
+            await asyncio.Event().wait()
+        self.messages.append(message)
+
+    @property
+    def recipients(self):
+        return [message["To"] for message in self.messages]
+
+
+def make_sender(db=None, pool=None, **options):
+    return CampaignSender(db, pool or RecordingPool(), templates, "test-secret",
+                          "https://shop.example/api/newsletter/unsubscribe-link", **options)
+
+
+CAMPAIGN = {
+    "subject": "Deals for {{ name }}",
+    "html": "<p>Hi {{ name }}, new <b>deals</b> are live.</p>",
+}
+
+
+class TestUnsubscribeTokens:
+    """Links can't be forged for other addresses"""
+
+    def test_round_trip(self):
+        token = unsubscribe_token("Buyer@Example.com", "secret")
+        assert verify_unsubscribe_token("buyer@example.com", token, "secret")
+
+    def test_rejects_other_email_or_secret(self):
+        token = unsubscribe_token("buyer@example.com", "secret")
+        assert not verify_unsubscribe_token("other@example.com", token, "secret")
+        assert not verify_unsubscribe_token("buyer@example.com", token, "other-secret")
+        assert not verify_unsubscribe_token("buyer@example.com", None, "secret")
+
+
+class TestCompileCampaign:
+    """Rendered once; recipients only fill placeholders"""
+
+    def test_merge_template_fill(self):
+        template = MergeTemplate("Hi \ue000name\ue000, bye \ue000name\ue000", html=True)
+        assert template.fill({"name": "<Ram>"}) == "Hi &lt;Ram&gt;, bye &lt;Ram&gt;"
+        assert MergeTemplate("Hi \ue000name\ue000").fill({"name": "<Ram>"}) == "Hi <Ram>"
+
+    def test_fields_filled_per_recipient(self):
+        subject, html, text = compile_campaign(templates, CAMPAIGN)
+        values = {"name": "Sita & Co", "email": "sita@example.com", "unsubscribe_url": "https://u.example/?a=1&b=2"}
+        assert subject.fill(values) == "Deals for Sita & Co"
+        rendered = html.fill(values)
+        assert "Hi Sita &amp; Co, new <b>deals</b> are live." in rendered
+        assert 'href="https://u.example/?a=1&amp;b=2"' in rendered
+        assert "style=" in rendered and "class=" not in rendered
+        plain = text.fill(values)
+        assert plain.startswith("Hi Sita & Co, new deals are live.")
+        assert "Unsubscribe: https://u.example/?a=1&b=2" in plain
+
+    def test_message_headers(self):
+        pool = RecordingPool()
+        sender = make_sender(pool=pool)
+        compiled = compile_campaign(templates, CAMPAIGN)
+        assert asyncio.run(sender._send_one({"email": "a@example.com", "name": "A"}, compiled))
+        message = pool.messages[0]
+        link = sender.unsubscribe_link("a@example.com")
+        assert message["List-Unsubscribe"] == f"<{link}>"
+        assert message["List-Unsubscribe-Post"] == "List-Unsubscribe=One-Click"
+        assert message["Subject"] == "Deals for A"
+
+
+class FakeCampaigns:
+    """One leased campaign document; applies $set/$inc and records every update"""
+
+    def __init__(self, owner):
+        self.doc = {"id": "c-1", "status": "sending", "lease_owner": owner, "checkpoint": None, "sent": 0, "failed": 0}
+        self.updates = []
+
+    def _matches(self, query):
+        return all(self.doc.get(k) == v for k, v in query.items())
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        if not self._matches(query):
+            return None
+        self.updates.append(update)
+        self.doc.update(update.get("$set", {}))
+        for key, amount in update.get("$inc", {}).items():
+            self.doc[key] += amount
+        return dict(self.doc)
+
+    async def update_one(self, query, update):
+        if self._matches(query):
+            self.updates.append(update)
+            self.doc.update(update["$set"])
+
+
+class TestOutage:
+    """A batch that mostly fails is retried, then the campaign pauses at its checkpoint"""
+
+    BATCH = [{"_id": i, "email": f"user{i}@example.com"} for i in range(4)]
+
+    def send_batch(self, pool):
+        sender = make_sender(pool=pool, per_minute=1_000_000, retry_delays=(0.01, 0.01))
+        campaigns = FakeCampaigns(sender.owner)
+        sender.db = {"newsletter_campaigns": campaigns}
+        compiled = compile_campaign(templates, CAMPAIGN)
+        return asyncio.run(sender._send_batch("c-1", self.BATCH, compiled)), campaigns.doc
+
+    def test_outage_pauses_without_advancing(self):
+        pool = RecordingPool(fail_sends=1000)
+        carry_on, doc = self.send_batch(pool)
+        assert carry_on is False
+        assert doc["status"] == "paused" and doc["lease_owner"] is None
+        assert doc["checkpoint"] is None and doc["sent"] == doc["failed"] == 0
+        assert pool.messages == []
+
+    def test_transient_failure_retries_only_failed_recipients(self):
+        pool = RecordingPool(fail_sends=3)
+        carry_on, doc = self.send_batch(pool)
+        assert carry_on is True
+        assert sorted(pool.recipients) == [s["email"] for s in self.BATCH]
+        assert doc["status"] == "sending" and doc["checkpoint"] == 3
+        assert (doc["sent"], doc["failed"]) == (4, 0)
+
+
+@pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+class TestResume:
+    """A crashed sender's campaign continues from its checkpoint"""
+
+    def test_resumes_after_crash(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def scenario():
+            client = AsyncIOMotorClient(TEST_MONGO_URL)
+            db = client[f"campaigns_{uuid.uuid4().hex[:12]}"]
+            try:
+                emails = [f"user{i}@example.com" for i in range(5)]
+                await db.newsletter.insert_many([{"email": e, "is_active": True} for e in emails])
+                await db.newsletter.insert_one({"email": "gone@example.com", "is_active": False})
+
+                crashing = RecordingPool(hang_after=2)
+                first = make_sender(db, crashing, batch_size=2, per_minute=1_000_000)
+                campaign = await first.create(**CAMPAIGN)
+                assert await first.send(campaign["id"])
+                while (await db.newsletter_campaigns.find_one({"id": campaign["id"]}))["sent"] < 2:
+                    await asyncio.sleep(0.01)
+                await first.stop()  # Worker dies mid-batch, lease still held
+
+                await db.newsletter_campaigns.update_one(
+                    {"id": campaign["id"]}, {"$set": {"lease_expires_at": datetime(2000, 1, 1, tzinfo=timezone.utc).isoformat()}}
+                )
+                resumed = RecordingPool()
+                second = make_sender(db, resumed, batch_size=2, per_minute=1_000_000)
+                await second.run(campaign["id"])
+
+                assert crashing.recipients == emails[:2]
+                assert resumed.recipients == emails[2:]
+                done = await db.newsletter_campaigns.find_one({"id": campaign["id"]})
+                assert done["status"] == "completed" and done["sent"] == 5 and done["lease_owner"] is None
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+
+        asyncio.run(scenario())
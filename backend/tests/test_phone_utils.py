@@ -0,0 +1,25 @@
+"""
+Unit Tests for Phone Number Normalization
+Tests: normalize_phone canonical E.164 keys
+"""
+from phone_utils import normalize_phone
+
+
+class TestNormalizePhone:
+    """Every format we store should collapse to the same key"""
+
+    def test_national_formats(self):
+        for raw in ["9812345678", "09812345678", "981-234-5678", " 981 234 5678 "]:
+            assert normalize_phone(raw) == "+9779812345678", raw
+
+    def test_country_code_formats(self):
+        for raw in ["9779812345678", "+977 9812345678", "+977-981-2345678", "009779812345678"]:
+            assert normalize_phone(raw) == "+9779812345678", raw
+
+    def test_foreign_number_keeps_its_country_code(self):
+        assert normalize_phone("+1 (415) 555-2671") == "+14155552671"
+        assert normalize_phone("0014155552671") == "+14155552671"
+
+    def test_invalid_input(self):
+        for raw in [None, "", "   ", "abc", "12345", "+1234567890123456"]:
+            assert normalize_phone(raw) is None, raw
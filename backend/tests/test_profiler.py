@@ -0,0 +1,89 @@
+"""
+Unit Tests for the Sampling Profiler
+Tests: request selection, stack attribution, collapsed/speedscope output
+"""
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from profiler import Profiler, ProfilerConfig, to_speedscope
+
+
+def busy_work():
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+        pass
+
+
+def make_app(tmp_path, config):
+    app = FastAPI()
+    profiler = Profiler(db=None, directory=tmp_path)
+    profiler.config = config
+
+    @app.middleware("http")
+    async def profiler_middleware(request: Request, call_next):
+        session = profiler.start(request.scope, app.router.routes)
+        if session is None:
+            return await call_next(request)
+        try:
+            return await call_next(request)
+        finally:
+            await profiler.finish(session)
+
+    @app.get("/api/heavy")
+    async def heavy():
+        busy_work()
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    @app.get("/api/light")
+    async def light():
+        return {"ok": True}
+
+    return app, profiler
+
+
+class TestProfiler:
+    """Live request profiling to disk"""
+
+    def test_selected_route_is_profiled(self, tmp_path):
+        config = ProfilerConfig(enabled=True, routes=["/api/heavy"], interval_ms=2, storage="disk")
+        app, profiler = make_app(tmp_path, config)
+        client = TestClient(app)
+        client.get("/api/heavy")
+        client.get("/api/light")
+
+        profiles = asyncio.run(profiler.list_profiles())
+        assert [p["route"] for p in profiles] == ["/api/heavy"]
+
+        collapsed = asyncio.run(profiler.get_profile(profiles[0]["id"]))["collapsed"]
+        assert "heavy (test_profiler.py" in collapsed
+        assert "busy_work" in collapsed
+        assert "[awaiting]" in collapsed
+
+    def test_disabled_profiler_records_nothing(self, tmp_path):
+        app, profiler = make_app(tmp_path, ProfilerConfig(enabled=False, routes=["*"], storage="disk"))
+        TestClient(app).get("/api/heavy")
+        assert asyncio.run(profiler.list_profiles()) == []
+
+    def test_one_in_n_sampling(self, tmp_path):
+        config = ProfilerConfig(enabled=True, sample_one_in=3, storage="disk")
+        app, profiler = make_app(tmp_path, config)
+        client = TestClient(app)
+        for _ in range(6):
+            client.get("/api/light")
+        assert len(asyncio.run(profiler.list_profiles())) == 2
+
+
+class TestSpeedscope:
+    """Collapsed stacks to speedscope conversion"""
+
+    def test_frames_are_shared(self):
+        result = to_speedscope("a;b 3\na;c 1", "GET /x", interval_ms=5)
+        profile = result["profiles"][0]
+        assert [f["name"] for f in result["shared"]["frames"]] == ["a", "b", "c"]
+        assert profile["samples"] == [[0, 1], [0, 2]]
+        assert profile["weights"] == [15, 5]
+        assert profile["endValue"] == 20
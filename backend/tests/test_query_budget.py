@@ -0,0 +1,134 @@
+"""
+Query-Budget Regression Tests
+Tests: maximum MongoDB round trips per endpoint for a fixed dataset
+
+Runs against a real MongoDB (the command counts come from the server's
+monitoring events), so the module is skipped unless TEST_MONGO_URL is set:
+
+    TEST_MONGO_URL=mongodb://localhost:27017 pytest tests/test_query_budget.py
+
+Each test seeds a throwaway database, then calls the endpoint with the
+per-request counter from query_metrics active. A loop that queries once per
+item (N+1) blows the budget and fails here instead of in production.
+"""
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+
+if TEST_MONGO_URL:
+    os.environ.setdefault("MONGO_URL", TEST_MONGO_URL)
+    os.environ.setdefault("DB_NAME", "query_budget")
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    import query_metrics
+    import server
+
+
+@asynccontextmanager
+async def query_budget(max_commands: int):
+    """Fail if the block issues more than max_commands MongoDB commands"""
+    stats = query_metrics.start_request()
+    yield stats
+    assert stats.commands <= max_commands, (
+        f"{stats.commands} MongoDB commands issued, budget is {max_commands}"
+    )
+
+
+def run_with_db(monkeypatch, scenario):
+    """Run scenario(db) against a fresh database wired into the server module"""
+    async def runner():
+        client = AsyncIOMotorClient(TEST_MONGO_URL, event_listeners=[query_metrics.QueryMetricsListener()])
+        db = client[f"query_budget_{uuid.uuid4().hex[:12]}"]
+        monkeypatch.setattr(server, "db", db)
+        try:
+            await scenario(db)
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    asyncio.run(runner())
+
+
+def make_products(count, category_id="cat-1"):
+    return [
+        {"id": f"prod-{i}", "name": f"Product {i}", "category_id": category_id,
+         "variations": [{"id": f"var-{i}", "name": "1 Month", "price": 100 + i}]}
+        for i in range(count)
+    ]
+
+
+class TestQueryBudgets:
+    """Round trips stay constant as the dataset grows"""
+
+    def test_get_bundles(self, monkeypatch):
+        async def scenario(db):
+            await db.products.insert_many(make_products(30))
+            await db.bundles.insert_many([
+                {"id": f"bundle-{i}", "name": f"Bundle {i}", "is_active": True, "sort_order": i,
+                 "products": [{"product_id": f"prod-{i * 3 + j}", "variation_id": None} for j in range(3)]}
+                for i in range(10)
+            ])
+            async with query_budget(2):
+                bundles = await server.get_bundles()
+            assert len(bundles) == 10
+            assert all(len(bundle["populated_products"]) == 3 for bundle in bundles)
+
+        run_with_db(monkeypatch, scenario)
+
+    def test_get_wishlist(self, monkeypatch):
+        async def scenario(db):
+            await db.products.insert_many(make_products(20))
+            await db.wishlists.insert_many([
+                {"id": f"wish-{i}", "visitor_id": "visitor-1", "product_id": f"prod-{i}"}
+                for i in range(20)
+            ])
+            async with query_budget(2):
+                items = await server.get_wishlist("visitor-1")
+            assert len(items) == 20
+            assert all(item["product"] for item in items)
+
+        run_with_db(monkeypatch, scenario)
+
+    def test_get_customer_orders(self, monkeypatch):
+        async def scenario(db):
+            email = "buyer@example.com"
+            await db.orders.insert_many([
+                {"id": f"order-{i}", "customer_email": email, "created_at": f"2025-01-{i % 28 + 1:02d}T00:00:00"}
+                for i in range(50)
+            ])
+            await db.order_status_history.insert_many([
+                {"id": f"hist-{i}-{step}", "order_id": f"order-{i}", "status": status,
+                 "created_at": f"2025-02-01T00:0{step}:00"}
+                for i in range(50)
+                for step, status in enumerate(["pending", "confirmed"])
+            ])
+            async with query_budget(2):
+                orders = await server.get_customer_orders(current_customer={"email": email})
+            assert len(orders) == 50
+            assert all([h["status"] for h in order["status_history"]] == ["pending", "confirmed"] for order in orders)
+
+        run_with_db(monkeypatch, scenario)
+
+    def test_validate_promo_code(self, monkeypatch):
+        async def scenario(db):
+            await db.products.insert_many(make_products(9, category_id="cat-other"))
+            await db.products.insert_one({"id": "prod-game", "name": "Game", "category_id": "cat-games"})
+            await db.promo_codes.insert_one({
+                "id": "promo-1", "code": "GAMES10", "is_active": True, "discount_type": "percentage",
+                "discount_value": 10, "applicable_categories": ["cat-games"],
+            })
+            # The matching product is last, so every item is looked at
+            cart = [{"product_id": f"prod-{i}"} for i in range(9)] + [{"product_id": "prod-game"}]
+            async with query_budget(2):
+                result = await server.validate_promo_code(code="games10", subtotal=1000, cart_items=cart)
+            assert result["discount_amount"] == 100
+
+        run_with_db(monkeypatch, scenario)
@@ -0,0 +1,59 @@
+"""
+Unit Tests for MongoDB Query Metrics
+Tests: per-request attribution across executor threads, route labels, documents counted
+"""
+import asyncio
+from types import SimpleNamespace
+
+import query_metrics
+from query_metrics import QueryMetricsListener, RequestStats, route_label
+
+
+def succeeded_event(reply, micros=2000, name="find"):
+    return SimpleNamespace(command_name=name, duration_micros=micros, reply=reply)
+
+
+class TestQueryMetricsListener:
+    """Commands are credited to the request that issued them"""
+
+    def test_executor_thread_commands_attributed_to_request(self):
+        listener = QueryMetricsListener()
+
+        async def handler():
+            stats = query_metrics.start_request()
+            reply = {"cursor": {"firstBatch": [{}, {}, {}]}}
+            # Motor runs commands on executor threads with a copy of the context
+            await asyncio.gather(*[asyncio.to_thread(listener.succeeded, succeeded_event(reply)) for _ in range(4)])
+            return stats
+
+        stats = asyncio.run(handler())
+        assert stats.commands == 4
+        assert stats.documents == 12
+        assert abs(stats.duration - 0.008) < 1e-9
+
+    def test_commands_outside_requests_are_ignored(self):
+        async def background():
+            QueryMetricsListener().succeeded(succeeded_event({"n": 1}, name="update"))
+            return query_metrics._request_stats.get()
+
+        assert asyncio.run(background()) is None
+
+    def test_get_more_batches_counted(self):
+        stats = RequestStats()
+        token = query_metrics._request_stats.set(stats)
+        try:
+            QueryMetricsListener().succeeded(succeeded_event({"cursor": {"nextBatch": [{}] * 5}}, name="getMore"))
+        finally:
+            query_metrics._request_stats.reset(token)
+        assert stats.documents == 5
+
+
+class TestRouteLabel:
+    """Labels use path templates, never raw paths"""
+
+    def test_matched_route_uses_template(self):
+        scope = {"route": SimpleNamespace(path="/api/products/{product_id}")}
+        assert route_label(scope) == "/api/products/{product_id}"
+
+    def test_unmatched_route(self):
+        assert route_label({"path": "/wp-login.php"}) == "unmatched"
@@ -0,0 +1,117 @@
+"""
+Unit Tests for the Sliding-Window Rate Limiter
+Tests: window accounting, LRU eviction, per-route policies, Redis backend
+"""
+import asyncio
+import pytest
+
+from rate_limiter import MemoryBackend, RedisBackend, RateLimiter, RateLimitPolicy
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def hits(backend, key, count, limit, window, now):
+    return [await backend.hit(key, limit, window, now) for _ in range(count)]
+
+
+class TestMemoryBackend:
+    """In-process sliding window counter"""
+
+    def test_allows_up_to_limit_then_blocks(self):
+        backend = MemoryBackend()
+        results = run(hits(backend, "ip", 6, limit=5, window=60, now=1000.0))
+        assert results == [True] * 5 + [False]
+
+    def test_previous_window_is_weighted(self):
+        backend = MemoryBackend()
+        # Fill window [960, 1020) completely
+        run(hits(backend, "ip", 10, limit=10, window=60, now=1000.0))
+        # Halfway through the next window the old window still counts for ~5
+        results = run(hits(backend, "ip", 6, limit=10, window=60, now=1050.0))
+        assert results.count(True) == 5
+
+    def test_window_gap_resets_counts(self):
+        backend = MemoryBackend()
+        run(hits(backend, "ip", 10, limit=10, window=60, now=1000.0))
+        assert run(backend.hit("ip", 10, 60, now=1200.0)) is True
+
+    def test_idle_keys_are_evicted(self):
+        backend = MemoryBackend(max_keys=3)
+        for i in range(10):
+            run(backend.hit(f"ip-{i}", 5, 60, now=1000.0))
+        assert len(backend) == 3
+
+    def test_recently_used_key_survives_eviction(self):
+        backend = MemoryBackend(max_keys=2)
+        run(backend.hit("a", 5, 60, now=1000.0))
+        run(backend.hit("b", 5, 60, now=1000.0))
+        run(backend.hit("a", 5, 60, now=1001.0))
+        run(backend.hit("c", 5, 60, now=1002.0))
+        assert "a" in backend._windows and "b" not in backend._windows
+
+
+class TestRateLimiterPolicies:
+    """Route to policy selection"""
+
+    def make_limiter(self):
+        login = RateLimitPolicy("login", limit=2, window=60, message="slow down login")
+        default = RateLimitPolicy("default", limit=3, window=60)
+        return RateLimiter(MemoryBackend(), [("*/auth/login", login)], default, exempt=["/health"])
+
+    def test_route_policy_applies(self):
+        limiter = self.make_limiter()
+        results = [run(limiter.check("/api/auth/login", "1.2.3.4", now=1000.0)) for _ in range(3)]
+        assert results[:2] == [None, None]
+        assert results[2].message == "slow down login"
+
+    def test_policies_have_separate_counters(self):
+        limiter = self.make_limiter()
+        for _ in range(2):
+            run(limiter.check("/api/auth/login", "1.2.3.4", now=1000.0))
+        assert run(limiter.check("/api/products", "1.2.3.4", now=1000.0)) is None
+
+    def test_exempt_paths_are_never_limited(self):
+        limiter = self.make_limiter()
+        results = [run(limiter.check("/health", "1.2.3.4", now=1000.0)) for _ in range(20)]
+        assert results == [None] * 20
+
+    def test_backend_errors_fail_open(self):
+        class BrokenBackend:
+            async def hit(self, *args):
+                raise ConnectionError("backend down")
+
+        limiter = RateLimiter(BrokenBackend(), [], RateLimitPolicy("default", 1, 60))
+        assert run(limiter.check("/api/products", "1.2.3.4")) is None
+
+
+class TestRedisBackend:
+    """Shared backend against a Redis-protocol stand-in"""
+
+    @pytest.fixture
+    def fake_redis(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        return fakeredis.FakeAsyncRedis()
+
+    def test_allows_up_to_limit_then_blocks(self, fake_redis):
+        backend = RedisBackend(fake_redis)
+        results = run(hits(backend, "ip", 6, limit=5, window=60, now=1000.0))
+        assert results == [True] * 5 + [False]
+
+    def test_rejected_requests_are_not_counted(self, fake_redis):
+        backend = RedisBackend(fake_redis)
+        run(hits(backend, "ip", 8, limit=5, window=60, now=1000.0))
+        assert run(fake_redis.get("rl:ip:16")) == b"5"
+
+    def test_workers_share_limits(self, fake_redis):
+        worker_a = RedisBackend(fake_redis)
+        worker_b = RedisBackend(fake_redis)
+        run(hits(worker_a, "ip", 3, limit=5, window=60, now=1000.0))
+        results = run(hits(worker_b, "ip", 3, limit=5, window=60, now=1000.0))
+        assert results == [True, True, False]
+
+    def test_counters_expire(self, fake_redis):
+        backend = RedisBackend(fake_redis)
+        run(backend.hit("ip", 5, 60, now=1000.0))
+        assert 0 < run(fake_redis.ttl("rl:ip:16")) <= 120
@@ -0,0 +1,132 @@
+"""
+Unit Tests for Upload Serving
+Tests: traversal guard, immutable caching for hashed names, ETag/304, byte ranges,
+stat cache, X-Accel-Redirect
+"""
+import os
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from upload_files import IMMUTABLE_CACHE_CONTROL, RangeNotSatisfiable, UploadStore, parse_range
+
+HASHED = "0123456789abcdef0123456789abcdef-640.webp"
+DATA = bytes(range(256)) * 4
+
+
+def make_client(directory, **options):
+    store = UploadStore(directory, **options)
+    app = FastAPI()
+
+    @app.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+    async def serve(filename: str, request: Request):
+        info = store.lookup(filename)
+        if info is None:
+            raise HTTPException(status_code=404)
+        return store.response(info, request.headers)
+
+    return TestClient(app), store
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    directory = tmp_path / "uploads"
+    directory.mkdir()
+    (directory / HASHED).write_bytes(DATA)
+    (directory / "legacy.png").write_bytes(b"png")
+    (tmp_path / "secret.txt").write_text("secret")
+    return directory
+
+
+class TestParseRange:
+    @pytest.mark.parametrize("header,expected", [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=1000-", (1000, 1023)),
+        ("bytes=-24", (1000, 1023)),
+        ("bytes=-5000", (0, 1023)),
+        ("bytes=1000-9999", (1000, 1023)),
+        ("bytes=0-1,5-6", None),  # Multiple ranges: whole file
+        ("items=0-1", None),
+        ("bytes=abc", None),
+        ("bytes=5-1", None),
+    ])
+    def test_ranges(self, header, expected):
+        assert parse_range(header, 1024) == expected
+
+    def test_unsatisfiable(self):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=1024-", 1024)
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=-0", 1024)
+
+
+class TestServing:
+    def test_hashed_name_is_immutable(self, uploads):
+        client, _ = make_client(uploads)
+        response = client.get(f"/uploads/{HASHED}")
+        assert response.content == DATA
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["etag"] == '"0123456789abcdef0123456789abcdef-640"'
+        assert response.headers["content-type"] == "image/webp"
+        assert client.get("/uploads/legacy.png").headers["cache-control"] != IMMUTABLE_CACHE_CONTROL
+
+    def test_if_none_match(self, uploads):
+        client, _ = make_client(uploads)
+        etag = client.get("/uploads/legacy.png").headers["etag"]
+        response = client.get("/uploads/legacy.png", headers={"If-None-Match": etag})
+        assert response.status_code == 304 and response.content == b""
+
+    def test_range_and_if_range(self, uploads):
+        client, _ = make_client(uploads)
+        response = client.get(f"/uploads/{HASHED}", headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == DATA[10:20]
+        assert response.headers["content-range"] == "bytes 10-19/1024"
+        stale = client.get(f"/uploads/{HASHED}", headers={"Range": "bytes=10-19", "If-Range": '"old"'})
+        assert stale.status_code == 200 and stale.content == DATA
+        assert client.get(f"/uploads/{HASHED}", headers={"Range": "bytes=5000-"}).status_code == 416
+
+    def test_head(self, uploads):
+        client, _ = make_client(uploads)
+        response = client.head(f"/uploads/{HASHED}")
+        assert response.status_code == 200 and response.content == b""
+        assert response.headers["content-length"] == "1024"
+
+    @pytest.mark.parametrize("name", ["..", "../secret.txt", ".env", "..%2Fsecret.txt", "a\\..\\b"])
+    def test_traversal_rejected(self, uploads, name):
+        client, store = make_client(uploads)
+        assert store.lookup(name) is None
+        assert client.get(f"/uploads/{name}").status_code == 404
+
+    def test_symlink_outside_directory_rejected(self, uploads):
+        os.symlink(uploads.parent / "secret.txt", uploads / "link.txt")
+        _, store = make_client(uploads)
+        assert store.lookup("link.txt") is None
+
+    def test_stat_cache(self, uploads, monkeypatch):
+        _, store = make_client(uploads)
+        first = store.lookup("legacy.png")
+        monkeypatch.setattr("upload_files.os.stat", lambda path: pytest.fail("stat called"))
+        assert store.lookup("legacy.png") is first
+
+    def test_accel_redirect(self, uploads):
+        client, _ = make_client(uploads, accel_prefix="/internal-uploads")
+        response = client.get(f"/uploads/{HASHED}")
+        assert response.headers["x-accel-redirect"] == f"/internal-uploads/{HASHED}"
+        assert response.content == b"" and response.headers["content-type"] == "image/webp"
+
+    def test_open_handle_without_accel(self, uploads):
+        store = UploadStore(uploads, accel_prefix="/internal-uploads")
+        app = FastAPI()
+
+        @app.get("/cached/{filename}")
+        async def serve(filename: str, request: Request):
+            info = store.lookup(filename)
+            file = open(info.path, "rb")
+            os.unlink(info.path)  # Evicted after opening: the handle still reads it
+            return store.response(info, request.headers, accel=False, file=file)
+
+        response = TestClient(app).get(f"/cached/{HASHED}", headers={"Range": "bytes=0-9"})
+        assert "x-accel-redirect" not in response.headers
+        assert response.status_code == 206 and response.content == DATA[:10]
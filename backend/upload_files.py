@@ -0,0 +1,207 @@
+"""
+Upload Files
+Serves /api/uploads with validators, byte ranges and long-lived caching
+
+Content-hashed names written by the image pipeline never change, so they
+are served as immutable for a year. Stats are cached in memory for a short
+time, so a hot image costs no syscalls per request. When nginx sits in
+front and UPLOADS_ACCEL_PREFIX is set, full responses are handed to it
+with X-Accel-Redirect and nginx sends the file itself.
+"""
+import mimetypes
+import os
+import re
+import stat
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+
+from http_cache import etag_matches
+
+CHUNK_SIZE = 64 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Legacy uuid uploads may be replaced by hand; revalidate daily
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+
+# <sha256 prefix>[-<width>].<ext>, as written by image_pipeline
+HASHED_NAME = re.compile(r"^[0-9a-f]{32}(-\d+)?\.[a-z0-9]+$")
+SAFE_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]*$")
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    path: Path
+    size: int
+    mtime: float
+    etag: str
+    content_type: str
+    cache_control: str
+
+
+class UploadStore:
+    def __init__(self, directory: Path, stat_ttl: float = 60.0, max_entries: int = 4096,
+                 accel_prefix: Optional[str] = None):
+        self.directory = Path(directory).resolve()
+        self.stat_ttl = stat_ttl
+        self.max_entries = max_entries
+        self.accel_prefix = accel_prefix.rstrip("/") + "/" if accel_prefix else None
+        self._stats: "OrderedDict[str, Tuple[float, FileInfo]]" = OrderedDict()
+
+    def lookup(self, filename: str) -> Optional[FileInfo]:
+        """Stat `filename` (cached); None when it is missing or not a plain name inside the directory"""
+        if not SAFE_NAME.match(filename) or ".." in filename:
+            return None
+        now = time.monotonic()
+        cached = self._stats.get(filename)
+        if cached and now - cached[0] < self.stat_ttl:
+            self._stats.move_to_end(filename)
+            return cached[1]
+
+        path = self.directory / filename
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._stats.pop(filename, None)
+            return None
+        if not stat.S_ISREG(st.st_mode) or path.resolve().parent != self.directory:
+            return None
+        info = FileInfo(
+            path=path,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            etag=self._etag(filename, st),
+            content_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            cache_control=IMMUTABLE_CACHE_CONTROL if HASHED_NAME.match(filename) else DEFAULT_CACHE_CONTROL,
+        )
+        self._stats[filename] = (now, info)
+        if len(self._stats) > self.max_entries:
+            self._stats.popitem(last=False)
+        return info
+
+    @staticmethod
+    def _etag(filename: str, st: os.stat_result) -> str:
+        if HASHED_NAME.match(filename):
+            return f'"{filename.split(".")[0]}"'  # The name is the content hash
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+    def response(self, info: FileInfo, headers, accel: bool = True, file: Optional[BinaryIO] = None) -> Response:
+        """
+        Build the response for a GET/HEAD with the given request headers.
+        accel=False for files outside this store's directory, which nginx
+        can't reach; `file` is an already-open handle to send instead of
+        reopening info.path (closed once the response no longer needs it).
+        """
+        response = self._response(info, headers, accel and file is None, file)
+        if file is not None and not isinstance(response, FileRangeResponse):
+            file.close()
+        return response
+
+    def _response(self, info: FileInfo, headers, accel: bool, file: Optional[BinaryIO]) -> Response:
+        base = {"ETag": info.etag, "Cache-Control": info.cache_control, "Accept-Ranges": "bytes"}
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, info.etag):
+            return Response(status_code=304, headers=base)
+
+        byte_range = headers.get("range")
+        if_range = headers.get("if-range")
+        if byte_range and (not if_range or if_range == info.etag):
+            try:
+                parsed = parse_range(byte_range, info.size)
+            except RangeNotSatisfiable:
+                return Response(status_code=416, headers={**base, "Content-Range": f"bytes */{info.size}"})
+            if parsed and parsed != (0, info.size - 1):
+                start, end = parsed
+                return FileRangeResponse(info, start, end, status_code=206, file=file, headers={
+                    **base, "Content-Range": f"bytes {start}-{end}/{info.size}",
+                })
+
+        if accel and self.accel_prefix:
+            return Response(headers={
+                **base,
+                "Content-Type": info.content_type,
+                "X-Accel-Redirect": f"{self.accel_prefix}{info.path.name}",
+            })
+        return FileRangeResponse(info, 0, info.size - 1, headers=base, file=file)
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single bytes range. None means send the whole
+    file: other units, malformed headers and multiple ranges, all of which
+    RFC 9110 lets a server ignore.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+        return None
+    if first == "":
+        if last == "":
+            return None
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    end = int(last) if last else size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """
+    Sends bytes start..end (inclusive) of a file in chunks. No pathsend:
+    the app's BaseHTTPMiddleware layers only pass http.response.body
+    messages, so zero-copy sends are left to nginx (X-Accel-Redirect).
+    """
+
+    def __init__(self, info: FileInfo, start: int, end: int, status_code: int = 200, headers: dict = None,
+                 file: Optional[BinaryIO] = None):
+        super().__init__(status_code=status_code, headers=headers, media_type=info.content_type)
+        self.info = info
+        self.file = file
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(max(0, end - start + 1))
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self._send(scope, send)
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+    async def _send(self, scope, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.end < self.start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        remaining = self.end - self.start + 1
+        f = anyio.wrap_file(self.file) if self.file is not None else await anyio.open_file(self.info.path, "rb")
+        async with f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})  # File shrank underneath us
@@ -3,6 +3,7 @@ import { Badge } from '@/components/ui/badge';
 import { WishlistButton } from '@/components/Wishlist';
 import { FlashSaleBadge } from '@/components/FlashSale';
 import { Zap } from 'lucide-react';
+import ProductImage from '@/components/ProductImage';
 
 export default function ProductCard({ product }) {
   const lowestPrice = product.variations?.length > 0
@@ -41,7 +42,7 @@ export default function ProductCard({ product }) {
       }}
     >
       <div className="aspect-square relative overflow-hidden bg-black/50">
-        <img src={product.image_url} alt={product.name} className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500" loading="lazy" />
+        <ProductImage product={product} sizes="(min-width: 1024px) 20vw, (min-width: 640px) 33vw, 50vw" className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500" loading="lazy" />
 
         {/* Wishlist Button */}
         <div className="absolute top-2 left-2 opacity-0 group-hover:opacity-100 transition-opacity">
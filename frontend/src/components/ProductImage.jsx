@@ -0,0 +1,27 @@
+import { useState } from 'react';
+import { blurhashDataURL, productImage, uploadSrcSet } from '@/lib/images';
+
+// Product image as <picture>: AVIF/WebP variants from the upload manifest, blurhash behind it until it loads
+export default function ProductImage({ product, sizes, className, loading }) {
+  const image = productImage(product);
+  const [loaded, setLoaded] = useState(false);
+  const placeholder = !loaded && image ? blurhashDataURL(image.blurhash, image.width, image.height) : undefined;
+
+  return (
+    <picture className="contents">
+      {image?.sources.map((source) => (
+        <source key={source.type} type={source.type} srcSet={source.srcset} sizes={sizes} />
+      ))}
+      <img
+        src={product.image_url}
+        srcSet={image ? undefined : uploadSrcSet(product.image_url)}
+        sizes={sizes}
+        alt={product.name}
+        className={className}
+        loading={loading}
+        onLoad={() => setLoaded(true)}
+        style={placeholder ? { backgroundImage: `url(${placeholder})`, backgroundSize: 'cover' } : undefined}
+      />
+    </picture>
+  );
+}
@@ -0,0 +1,104 @@
+// Responsive sources for product images. Images uploaded through the admin
+// form carry the upload pipeline's manifest (AVIF/WebP variants + blurhash);
+// older /api/uploads images fall back to ?width= copies rendered on request.
+const UPLOAD_WIDTHS = [320, 640, 960, 1280];
+
+export function uploadSrcSet(url, widths = UPLOAD_WIDTHS) {
+  if (!url || !url.includes('/api/uploads/') || url.includes('?') || url.endsWith('.gif')) return undefined;
+  return widths.map((w) => `${url}?width=${w}&format=auto ${w}w`).join(', ');
+}
+
+// The manifest returned by /api/upload uses paths; prefix them like image_url
+export function manifestWithBase(image, base = '') {
+  if (!image) return null;
+  const srcset = (value) => value.split(', ').map((entry) => `${base}${entry}`).join(', ');
+  return {
+    ...image,
+    url: `${base}${image.url}`,
+    sources: image.sources.map((source) => ({ ...source, srcset: srcset(source.srcset) })),
+    variants: (image.variants || []).map((variant) => ({ ...variant, url: `${base}${variant.url}` })),
+  };
+}
+
+// Manifest for the product's current image, or null if image_url was changed by hand
+export function productImage(product) {
+  const image = product?.image;
+  return image && image.url === product.image_url ? image : null;
+}
+
+// ==================== BLURHASH ====================
+
+const BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+const placeholders = new Map();
+
+const decode83 = (str) => [...str].reduce((value, char) => value * 83 + BASE83.indexOf(char), 0);
+
+const toLinear = (value) => {
+  const v = value / 255;
+  return v <= 0.04045 ? v / 12.92 : ((v + 0.055) / 1.055) ** 2.4;
+};
+
+const toSRGB = (value) => {
+  const v = Math.max(0, Math.min(1, value));
+  return Math.round(v <= 0.0031308 ? v * 12.92 * 255 : (1.055 * v ** (1 / 2.4) - 0.055) * 255);
+};
+
+function decodeBlurhash(hash, width, height) {
+  const size = decode83(hash[0]);
+  const nx = (size % 9) + 1;
+  const ny = Math.floor(size / 9) + 1;
+  const maxValue = (decode83(hash[1]) + 1) / 166;
+  const colors = [];
+  for (let i = 0; i < nx * ny; i++) {
+    if (i === 0) {
+      const dc = decode83(hash.slice(2, 6));
+      colors.push([toLinear(dc >> 16), toLinear((dc >> 8) & 255), toLinear(dc & 255)]);
+    } else {
+      const ac = decode83(hash.slice(4 + i * 2, 6 + i * 2));
+      colors.push([Math.floor(ac / 361), Math.floor(ac / 19) % 19, ac % 19].map((q) => {
+        const v = (q - 9) / 9;
+        return Math.sign(v) * v * v * maxValue;
+      }));
+    }
+  }
+  const pixels = new Uint8ClampedArray(width * height * 4);
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      let r = 0, g = 0, b = 0;
+      for (let j = 0; j < ny; j++) {
+        for (let i = 0; i < nx; i++) {
+          const basis = Math.cos((Math.PI * x * i) / width) * Math.cos((Math.PI * y * j) / height);
+          const color = colors[i + j * nx];
+          r += color[0] * basis;
+          g += color[1] * basis;
+          b += color[2] * basis;
+        }
+      }
+      const p = 4 * (x + y * width);
+      pixels.set([toSRGB(r), toSRGB(g), toSRGB(b), 255], p);
+    }
+  }
+  return pixels;
+}
+
+// Small data URL to show behind the image while it loads; cached per hash
+export function blurhashDataURL(hash, width = 1, height = 1) {
+  if (!hash || hash.length < 6 || typeof document === 'undefined') return undefined;
+  if (!placeholders.has(hash)) {
+    let url;
+    try {
+      const scale = 32 / Math.max(width, height);
+      const w = Math.max(1, Math.round(width * scale));
+      const h = Math.max(1, Math.round(height * scale));
+      const canvas = document.createElement('canvas');
+      canvas.width = w;
+      canvas.height = h;
+      canvas.getContext('2d').putImageData(new ImageData(decodeBlurhash(hash, w, h), w, h), 0, 0);
+      url = canvas.toDataURL();
+    } catch {
+      url = undefined;
+    }
+    placeholders.set(hash, url);
+  }
+  return placeholders.get(hash);
+}
@@ -22,6 +22,7 @@ import { useLanguage } from '@/components/Language';
 import { useCustomer } from '@/components/CustomerAccount';
 import CustomerAuth from '@/components/CustomerAuth';
 import { FlashSaleTimer } from '@/components/FlashSale';
+import ProductImage from '@/components/ProductImage';
 
 export default function ProductPage() {
   const { productSlug } = useParams();
@@ -202,7 +203,7 @@ export default function ProductPage() {
         customer_name: orderForm.customer_name,
         customer_phone: orderForm.customer_phone,
         customer_email: orderForm.customer_email || null,
-        items: [{ name: product.name, price: currentVariation.price, quantity: quantity, variation: currentVariation.name }],
+        items: [{ name: product.name, price: currentVariation.price, quantity: quantity, variation: currentVariation.name, product_id: product.id, variation_id: currentVariation.id }],
         total_amount: total,
         credits_used: creditsToUse,
         remark: fullRemark.trim() || null
@@ -337,7 +338,7 @@ See invoice: ${invoiceUrl}`;
           <div className="grid grid-cols-1 lg:grid-cols-2 gap-5 lg:gap-10">
             <div className="lg:sticky lg:top-24 lg:self-start" data-testid="product-image-container">
               <div className="aspect-square bg-card rounded-lg overflow-hidden border border-white/10 animate-fade-in relative">
-                <img src={product.image_url} alt={product.name} className="w-full h-full object-cover hover:scale-105 transition-transform duration-500" />
+                <ProductImage product={product} sizes="(min-width: 1024px) 50vw, 100vw" className="w-full h-full object-cover hover:scale-105 transition-transform duration-500" />
                 
                 {/* Wishlist button on image */}
                 <button
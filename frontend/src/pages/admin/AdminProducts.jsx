@@ -10,10 +10,11 @@ import { Badge } from '@/components/ui/badge';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { toast } from 'sonner';
-import { productsAPI, categoriesAPI } from '@/lib/api';
+import { productsAPI, categoriesAPI, uploadAPI } from '@/lib/api';
+import { manifestWithBase } from '@/lib/images';
 
 const AVAILABLE_TAGS = ['Popular', 'Sale', 'New', 'Limited', 'Hot', 'Best Seller', 'Flash Sale'];
-const emptyProduct = { name: '', slug: '', description: '', image_url: '', category_id: '', variations: [], tags: [], custom_fields: [], sort_order: 0, is_active: true, is_sold_out: false, stock_quantity: null, flash_sale_end: '', flash_sale_label: '' };
+const emptyProduct = { name: '', slug: '', description: '', image_url: '', image: null, category_id: '', variations: [], tags: [], custom_fields: [], sort_order: 0, is_active: true, is_sold_out: false, stock_quantity: null, flash_sale_end: '', flash_sale_label: '' };
 const emptyVariation = { id: '', name: '', price: '', original_price: '', cost_price: '' };
 const emptyCustomField = { id: '', label: '', placeholder: '', required: false };
 
@@ -28,6 +29,7 @@ export default function AdminProducts() {
   const [newCustomField, setNewCustomField] = useState(emptyCustomField);
   const [editingVariationId, setEditingVariationId] = useState(null);
   const [editingVariationData, setEditingVariationData] = useState(emptyVariation);
+  const [isUploading, setIsUploading] = useState(false);
 
   const fetchData = async () => {
     try {
@@ -40,12 +42,29 @@ export default function AdminProducts() {
   useEffect(() => { fetchData(); }, []);
 
   const handleOpenDialog = (product = null) => {
-    if (product) { setEditingProduct(product); setFormData({ name: product.name, slug: product.slug || '', description: product.description, image_url: product.image_url, category_id: product.category_id, variations: product.variations || [], tags: product.tags || [], custom_fields: product.custom_fields || [], sort_order: product.sort_order || 0, is_active: product.is_active, is_sold_out: product.is_sold_out, stock_quantity: product.stock_quantity, flash_sale_end: product.flash_sale_end || '', flash_sale_label: product.flash_sale_label || '' }); }
+    if (product) { setEditingProduct(product); setFormData({ name: product.name, slug: product.slug || '', description: product.description, image_url: product.image_url, image: product.image || null, category_id: product.category_id, variations: product.variations || [], tags: product.tags || [], custom_fields: product.custom_fields || [], sort_order: product.sort_order || 0, is_active: product.is_active, is_sold_out: product.is_sold_out, stock_quantity: product.stock_quantity, flash_sale_end: product.flash_sale_end || '', flash_sale_label: product.flash_sale_label || '' }); }
     else { setEditingProduct(null); setFormData(emptyProduct); }
     setNewVariation(emptyVariation);
     setIsDialogOpen(true);
   };
 
+  const handleImageUpload = async (e) => {
+    const file = e.target.files[0];
+    if (!file) return;
+    setIsUploading(true);
+    try {
+      const res = await uploadAPI.uploadImage(file);
+      const base = process.env.REACT_APP_BACKEND_URL;
+      setFormData(prev => ({ ...prev, image_url: `${base}${res.data.url}`, image: manifestWithBase(res.data.image, base) }));
+      toast.success('Image uploaded!');
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to upload image');
+    } finally {
+      setIsUploading(false);
+      e.target.value = '';
+    }
+  };
+
   const handleAddVariation = () => {
     if (!newVariation.name || !newVariation.price) { toast.error('Variation name and price are required'); return; }
     const variation = { ...newVariation, id: `var-${Date.now()}`, price: parseFloat(newVariation.price), original_price: newVariation.original_price ? parseFloat(newVariation.original_price) : null, cost_price: newVariation.cost_price ? parseFloat(newVariation.cost_price) : null };
@@ -166,7 +185,13 @@ export default function AdminProducts() {
             <form onSubmit={handleSubmit} className="space-y-4 lg:space-y-6">
               <div className="space-y-2">
                 <Label>Product Image URL</Label>
-                <Input value={formData.image_url} onChange={(e) => setFormData({ ...formData, image_url: e.target.value })} className="bg-black border-white/20 flex-1" placeholder="https://example.com/image.png" />
+                <div className="flex gap-2">
+                  <Input value={formData.image_url} onChange={(e) => setFormData({ ...formData, image_url: e.target.value })} className="bg-black border-white/20 flex-1" placeholder="https://... or upload" />
+                  <label className="cursor-pointer">
+                    <input type="file" accept="image/*" onChange={handleImageUpload} className="hidden" />
+                    <Button type="button" variant="outline" className="border-gold-500 text-gold-500" disabled={isUploading} asChild><span>{isUploading ? 'Uploading...' : 'Upload'}</span></Button>
+                  </label>
+                </div>
                 {formData.image_url && <div className="mt-2 flex items-center gap-3"><img src={formData.image_url} alt="Preview" className="w-20 h-20 object-cover rounded-lg" onError={(e) => e.target.style.display = 'none'} /><span className="text-white/40 text-xs">Image preview</span></div>}
               </div>
 